@@ -0,0 +1,73 @@
+"""Proxy cache purge: time to drop one book's pages from nginx's cache.
+
+Fills a directory laid out like proxy_cache_path levels=1:2 with cache
+files for a few books (binary header, "KEY: <book>|<uri>" line, body),
+drops the page cache (as root), then purges one book cold and another
+warm through ProxyCache, and checks that exactly their files went,
+including a book whose name extends a purged one. nginx itself is not
+needed.
+
+    python3 bench_cache_purge.py [--scale 1] [--manager OLD.py]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import time
+
+from common import MANAGER, drop_page_cache, load_manager, scratch_dir
+
+BOOKS = {"wikipedia_en_all_maxi": 15000, "wiktionary_en_all": 4000, "gutenberg_en": 1000}
+HEADER = 336  # Size of ngx_http_file_cache_header_t and friends, roughly
+
+
+def write_entry(cache, key: str, size: int):
+    digest = hashlib.md5(key.encode()).hexdigest()
+    directory = cache / digest[-1] / digest[-3:-1]
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / digest, "wb") as f:
+        f.write(os.urandom(HEADER) + b"\nKEY: " + key.encode() + b"\nHTTP/1.1 200 OK\r\n\r\n" + b"x" * size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1, help="Multiply the number of cached pages")
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    manager = load_manager(args.manager)
+    if not hasattr(manager, "ProxyCache"):
+        raise SystemExit("this revision has no proxy cache")
+    work = scratch_dir("cache-purge")
+    rng = random.Random(1)
+    try:
+        cache = work / "kiwix"
+        entries = 0
+        for book, count in BOOKS.items():
+            for i in range(int(count * args.scale)):
+                write_entry(cache, f"{book}|/content/{book}/A/Article_{i}", rng.randint(2000, 40000))
+                entries += 1
+        for i in range(200):
+            write_entry(cache, f"|/skin/asset{i}.css?cacheid=abc", 3000)
+            entries += 1
+        write_entry(cache, "wikipedia_en_all_maxi_2024|/content/wikipedia_en_all_maxi_2024/A/X", 100)
+        entries += 1
+        drop_page_cache()
+
+        proxy_cache = manager.ProxyCache(cache)
+        started = time.monotonic()
+        first = proxy_cache.purge({"wiktionary_en_all"})
+        cold = time.monotonic() - started
+        started = time.monotonic()
+        second = proxy_cache.purge({"wikipedia_en_all_maxi"})
+        warm = time.monotonic() - started
+        left = sum(len(files) for _, _, files in os.walk(cache))
+        print(f"{entries} cached responses: purged {first} in {cold:.2f}s (cold), then {second} in {warm:.2f}s "
+              f"(warm); {left} left, expected {entries - first - second}")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Delta downloads: bytes fetched for a new edition when the old one is installed.
+
+Two kinds of edition pairs:
+
+- raw: a random file (256 MB by default) and a copy with three 1000-byte
+  insertions, five 100 KB edits, a 50 KB deletion and 5 MB appended, the
+  worst case for fixed-offset blocks
+- zim: a 6000-article ZIM and one in which N articles changed (same
+  length, so the clusters around them stay aligned)
+
+The new edition and its .blockmap are served from the stand-in mirror,
+and it is downloaded through the API with the old edition in storage,
+once as a delta and once in full ("delta": false). Reports the bytes the
+mirror sent, the bytes copied from the old edition and whether the
+result is intact (ZIM checksum, or MD5 against the mirror's copy).
+
+    python3 bench_delta_download.py [--raw-mb 256] [--changed 0 6 60] [--manager OLD.py]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+
+from common import MANAGER, Manager, load_manager, scratch_dir
+from mkzim import build
+from standin import serve
+
+ARTICLES = 6000
+WORDS = [f"w{i}" for i in range(50000)]
+
+
+def md5(path) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def raw_editions(old, new, megabytes: int):
+    rng = random.Random(7)
+    data = bytearray(os.urandom(megabytes << 20))
+    old.write_bytes(data)
+    scale = megabytes / 256
+    for position in (10, 100, 200):
+        position = int(position * scale) << 20
+        data[position:position] = rng.randbytes(1000)
+    for position in (30, 60, 90, 150, 230):
+        position = int(position * scale) << 20
+        data[position:position + 100_000] = rng.randbytes(100_000)
+    position = int(120 * scale) << 20
+    del data[position:position + 50_000]
+    data += os.urandom(5 << 20)
+    new.write_bytes(data)
+
+
+def article(i: int, revision: int) -> str:
+    rng = random.Random(i * 1000 + revision)
+    return " ".join(rng.choice(WORDS) for _ in range(1500))
+
+
+def zim_edition(path, date: str, changed=frozenset()):
+    def body(i):
+        text = article(i, 0)
+        if i in changed:
+            text = article(i, 1)[:len(text)].ljust(len(text))
+        return f"<html><body>{text}</body></html>"
+    return build(path, name="wiki_en_all", date=date, articles=ARTICLES, body=body)
+
+
+def compare(work, mirror, old, new, manager_script, label: str):
+    """Download new with old installed, as a delta and in full, and print the results."""
+    size = new.stat().st_size
+    expected = md5(new)
+    for delta in (True, False):
+        storage = work / f"storage-{delta}"
+        storage.mkdir()
+        shutil.copy(old, storage / old.name)
+        sent = mirror.bytes_sent
+        with Manager(storage, script=manager_script) as manager:
+            status, seconds = manager.download(f"{mirror.url}/{new.name}", delta=delta)
+        fetched = mirror.bytes_sent - sent
+        intact = status["status"] == "completed" and md5(storage / new.name) == expected
+        print(f"{label}, {'delta' if delta else 'full '}: fetched {fetched / 2**20:7.1f} of {size / 2**20:.1f} MB "
+              f"({fetched / size:6.1%}), reused {(status.get('bytes_saved') or 0) / 2**20:6.1f} MB, "
+              f"verified {status.get('verified')}, identical {intact}, {seconds:.1f}s")
+        shutil.rmtree(storage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--raw-mb", type=int, default=256, help="Size of the raw edition, 0 to skip it")
+    parser.add_argument("--changed", type=int, nargs="*", default=[0, 6, 60],
+                        help="Numbers of changed articles between ZIM editions")
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    blockmap = load_manager().BlockMap  # The map format of this tree, whatever --manager is
+    work = scratch_dir("delta")
+    remote = work / "remote"
+    remote.mkdir()
+    mirror = serve(remote)
+    try:
+        if args.raw_mb:
+            old, new = work / "raw_en_all_maxi_2026-01.zim", remote / "raw_en_all_maxi_2026-02.zim"
+            raw_editions(old, new, args.raw_mb)
+            (remote / (new.name + ".blockmap")).write_bytes(blockmap.build(new).to_bytes())
+            compare(work, mirror, old, new, args.manager, "raw")
+            new.unlink()
+        if args.changed:
+            old = zim_edition(work / "wiki_en_all_maxi_2026-01.zim", "2026-01-01")
+            for count in args.changed:
+                changed = frozenset(random.Random(3).sample(range(ARTICLES), count))
+                new = zim_edition(remote / "wiki_en_all_maxi_2026-02.zim", "2026-02-01", changed)
+                (remote / (new.name + ".blockmap")).write_bytes(blockmap.build(new).to_bytes())
+                compare(work, mirror, old, new, args.manager, f"zim, {count:2} changed")
+    finally:
+        mirror.shutdown()
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
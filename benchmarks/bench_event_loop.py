@@ -0,0 +1,104 @@
+"""Event loop responsiveness: /api/zim latency while heavy requests run.
+
+Starts the manager with a library of small books, polls GET /api/zim
+every 10ms and, phase by phase, runs work that used to block the event
+loop: raw PUT uploads, multipart uploads, deletes of large files and
+bursts of /info requests. Reports poll latency per phase; a blocked loop
+shows up as a high p99/max and few polls answered.
+
+    python3 bench_event_loop.py [--books 200] [--large-mb 1024] [--manager OLD.py]
+"""
+import argparse
+import asyncio
+import shutil
+import time
+
+import httpx
+
+from common import MANAGER, Manager, percentile, scratch_dir
+from mkzim import build
+
+
+async def curl(*args):
+    process = await asyncio.create_subprocess_exec("curl", "-s", "-o", "/dev/null", *args)
+    await process.wait()
+
+
+async def poll(client, base, latencies, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(base + "/api/zim")
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run(manager, large, multipart, deletes, books):
+    base = manager.base
+
+    async def put_uploads(client):
+        for i in range(2):
+            await curl("-T", str(large), f"{base}/api/zim/put{i}.zim")
+
+    async def multipart_uploads(client):
+        for i in range(2):
+            await curl("-F", f"file=@{multipart};filename=multipart{i}.zim", f"{base}/api/zim/upload")
+
+    async def delete_files(client):
+        for name in [f"put{i}.zim" for i in range(2)] + [path.name for path in deletes]:
+            await client.delete(f"{base}/api/zim/{name}")
+
+    async def info_requests(client):
+        for _ in range(50):
+            for i in range(0, books, max(1, books // 20)):
+                await client.get(f"{base}/api/zim/book{i:04d}.zim/info")
+
+    phases = [("PUT 2 files", put_uploads), ("multipart 2 files", multipart_uploads),
+              (f"delete {2 + len(deletes)} files", delete_files), ("info x1000", info_requests)]
+    async with httpx.AsyncClient(timeout=600) as poller, httpx.AsyncClient(timeout=600) as worker:
+        for name, phase in phases:
+            latencies, stop = [], asyncio.Event()
+            polling = asyncio.create_task(poll(poller, base, latencies, stop))
+            started = time.monotonic()
+            await phase(worker)
+            seconds = time.monotonic() - started
+            stop.set()
+            await polling
+            print(f"{name:20} {seconds:6.1f}s  polls answered {len(latencies):5}  "
+                  f"p50 {percentile(latencies, .5):6.1f}ms  p99 {percentile(latencies, .99):7.1f}ms  "
+                  f"max {max(latencies):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--large-mb", type=int, default=1024, help="Size of the uploaded and deleted files")
+    parser.add_argument("--multipart-mb", type=int, default=300)
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    work = scratch_dir("eventloop")
+    try:
+        storage = work / "storage"
+        storage.mkdir()
+        small = build(work / "small.zim")
+        for i in range(args.books):
+            shutil.copy(small, storage / f"book{i:04d}.zim")
+        large = build(work / "large.zim", articles=args.large_mb * 2, body_kb=512,
+                      compression="none", random_body=True)
+        multipart = build(work / "multipart.zim", articles=args.multipart_mb * 2, body_kb=512,
+                          compression="none", random_body=True)
+        deletes = []
+        for i in range(3):
+            deletes.append(storage / f"delete{i}.zim")
+            shutil.copy(large, deletes[-1])
+        with Manager(storage, "--min-free-space", 0, "--log-level", "warning", script=args.manager) as manager:
+            # Let the startup scan of the library finish first
+            while manager.status("/api/health") not in (200, 404):
+                time.sleep(0.1)
+            asyncio.run(run(manager, large, multipart, deletes, args.books))
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Proxy cache through nginx: hits, cache file layout and ProxyCache.purge().
+
+Starts nginx with the add-on's configuration (nginx_fixture.py) and the
+cache on, in front of a stub kiwix-serve that counts the requests it gets,
+and requests every page of three books (one whose name extends another's)
+plus some skin assets, three times:
+
+1. cold: everything is a miss and reaches the stub;
+2. warm: everything is a hit, the stub sees nothing;
+3. after ProxyCache.purge() of one book on the files nginx wrote: that
+   book's pages are misses again, everything else is still a hit.
+
+It also checks that every response is in the file nginx's levels=1:2
+layout gives to the MD5 of its "<book>|<uri>" key, and that the key
+line sits within the header bytes ProxyCache reads.
+
+    python3 bench_nginx_cache.py [--pages 500] [--nginx BINARY] [--manager OLD.py]
+"""
+import argparse
+import hashlib
+import http.client
+import http.server
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+from common import MANAGER, load_manager, percentile, scratch_dir
+from nginx_fixture import Nginx
+
+BOOKS = ["wikipedia_en_all_maxi", "wikipedia_en_all_maxi_2024", "wiktionary_en_all"]
+PURGED = "wikipedia_en_all_maxi"
+SKIN_ASSETS = 20
+PAGE_MS = 2
+
+
+def stub_kiwix_serve():
+    """Threaded HTTP server answering every GET with a page; returns (server, per-path request counter)."""
+    served = Counter()
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            with lock:
+                served[self.path] += 1
+            time.sleep(PAGE_MS / 1000)
+            body = f"<html><body>{self.path}</body></html>".encode() + b" " * 8000
+            self.send_response(200)
+            self.send_header("Content-Type", "text/css" if self.path.startswith("/skin/") else "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "max-age=0, must-revalidate")  # Ignored by kiwix-proxy.conf
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, served
+
+
+def fetch_all(port: int, urls):
+    """GET every URL over one kept-alive connection; returns (cache statuses per book, latencies)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    statuses = {}
+    latencies = []
+    for book, url in urls:
+        started = time.monotonic()
+        connection.request("GET", url)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.monotonic() - started)
+        if response.status != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status}")
+        statuses.setdefault(book, Counter())[response.getheader("X-Cache-Status")] += 1
+    connection.close()
+    return statuses, latencies
+
+
+def cache_file(cache, key: str):
+    """Where proxy_cache_path levels=1:2 puts the response for this key."""
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return cache / digest[-1] / digest[-3:-1] / digest
+
+
+def describe(statuses) -> str:
+    return ", ".join(f"{book or 'skin'} " + "/".join(f"{n} {status}" for status, n in sorted(counts.items()))
+                     for book, counts in statuses.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500, help="Pages per book")
+    parser.add_argument("--nginx", default="nginx", metavar="BINARY")
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    manager = load_manager(args.manager)
+    if not hasattr(manager, "ProxyCache"):
+        raise SystemExit("this revision has no proxy cache")
+    # Half the pages through the /wiki/ prefix the viewer uses, half directly
+    urls = [(book, f"{'/wiki' if i % 2 else ''}/content/{book}/A/Article_{i}")
+            for book in BOOKS for i in range(args.pages)]
+    urls += [("", f"/skin/asset{i}.css?cacheid=abc") for i in range(SKIN_ASSETS)]
+    keys = [f"{book}|{url.removeprefix('/wiki')}" for book, url in urls]
+
+    server, served = stub_kiwix_serve()
+    nginx = Nginx(scratch_dir("nginx-cache"), [server.server_address[1]], cache_size=64, binary=args.nginx)
+    try:
+        print(nginx.test())
+        if nginx.dropped:
+            print(f"commented out for this nginx build: {', '.join(nginx.dropped)}")
+        nginx.start()
+
+        cold, cold_latency = fetch_all(nginx.port, urls)
+        upstream_cold = sum(served.values())
+        warm, warm_latency = fetch_all(nginx.port, urls)
+        upstream_warm = sum(served.values()) - upstream_cold
+        print(f"cold: {describe(cold)}; stub served {upstream_cold}, p50 {percentile(cold_latency, .5) * 1000:.1f}ms")
+        print(f"warm: {describe(warm)}; stub served {upstream_warm}, p50 {percentile(warm_latency, .5) * 1000:.1f}ms")
+
+        files = sum(len(names) for _, _, names in os.walk(nginx.cache_path))
+        misplaced = [key for key in keys if not cache_file(nginx.cache_path, key).exists()]
+        key_offset = max(cache_file(nginx.cache_path, key).read_bytes().find(b"\nKEY: ") for key in keys
+                         if key not in misplaced)
+        print(f"cache: {files} files for {len(urls)} URLs, {len(misplaced)} not at md5(key) levels=1:2"
+              + (f" (first: {misplaced[0]})" if misplaced else "")
+              + f"; KEY line at byte {key_offset} (ProxyCache reads {manager.ProxyCache.HEADER_SIZE})")
+
+        started = time.monotonic()
+        removed = manager.ProxyCache(nginx.cache_path).purge({PURGED})
+        seconds = time.monotonic() - started
+        left = sum(len(names) for _, _, names in os.walk(nginx.cache_path))
+        print(f"purge {PURGED}: removed {removed} files in {seconds * 1000:.0f}ms (expected {args.pages}), "
+              f"{left} left")
+
+        before = sum(served.values())
+        after, _ = fetch_all(nginx.port, urls)
+        print(f"after purge: {describe(after)}; stub served {sum(served.values()) - before}")
+        expected = {book: Counter({"MISS" if book == PURGED else "HIT": args.pages}) for book in BOOKS}
+        expected[""] = Counter({"HIT": SKIN_ASSETS})
+        ok = (removed == args.pages and not misplaced and files == len(urls) and upstream_warm == 0
+              and 0 <= key_offset < manager.ProxyCache.HEADER_SIZE and after == expected)
+        print("OK" if ok else "UNEXPECTED RESULT")
+    finally:
+        nginx.stop()
+        server.shutdown()
+        shutil.rmtree(nginx.prefix)
+
+
+if __name__ == "__main__":
+    main()
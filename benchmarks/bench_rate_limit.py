@@ -0,0 +1,72 @@
+"""Accuracy of the global and per-job download rate limits.
+
+Downloads random files from the unthrottled stand-in mirror through the
+manager's API under three limits and compares the achieved rate (bytes
+over wall time, request to completion) with the target:
+- a global limit, one job over 4 connections
+- a global limit shared by two concurrent jobs
+- a per-job limit on each of two concurrent jobs
+
+    python3 bench_rate_limit.py [--size-mb 8] [--kbps 2048]
+"""
+import argparse
+import os
+import shutil
+import threading
+import time
+
+import standin
+from common import Manager, scratch_dir
+
+
+def run(label, work, mirror, size, target_kbps, jobs, manager_args, job_options):
+    storage = work / "storage"
+    with Manager(storage, "--min-free-space", 0, *manager_args) as manager:
+        results = []
+        threads = [
+            threading.Thread(target=lambda i=i: results.append(
+                manager.download(f"{mirror.url}/file{i}.zim", **job_options)[0]))
+            for i in range(jobs)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.monotonic() - started
+    shutil.rmtree(storage)
+    failed = [r["error"] for r in results if r["status"] != "completed"]
+    rate = jobs * size / seconds / 1024
+    print(f"{label:40} {rate:6.0f} KB/s, target {target_kbps} KB/s "
+          f"({100 * (rate - target_kbps) / target_kbps:+.1f}%)" + (f" FAILED: {failed}" if failed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--kbps", type=int, default=2048, help="Global limit for the first case")
+    args = parser.parse_args()
+
+    work = scratch_dir("ratelimit")
+    files = work / "mirror"
+    files.mkdir()
+    size = args.size_mb << 20
+    for i in range(2):
+        (files / f"file{i}.zim").write_bytes(os.urandom(size))
+    mirror = standin.serve(files)
+    try:
+        run(f"global {args.kbps} KB/s, 1 job x 4 conns", work, mirror, size, args.kbps, 1,
+            ["--download-rate-limit", args.kbps, "--download-connections", 4], {})
+        half = args.kbps // 2
+        run(f"global {half} KB/s, 2 jobs", work, mirror, size, half, 2,
+            ["--download-rate-limit", half], {})
+        quarter = args.kbps // 4
+        run(f"per-job {quarter} KB/s x 2 jobs", work, mirror, size, 2 * quarter, 2,
+            [], {"rate_limit": quarter})
+    finally:
+        mirror.shutdown()
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
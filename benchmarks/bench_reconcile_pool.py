@@ -0,0 +1,92 @@
+"""Startup library scan: serial vs thread-pool header reads.
+
+Creates N unindexed ZIM files of three kinds (zstd articles,
+uncompressed, tiny) and times LibraryReconciler's pass over them
+in-process, once with a single reader thread and once with the default
+pool, from a cold page cache. With --fuse-delay-ms the files are read
+through slowfs.py (needs root and /dev/fuse), which adds that delay to
+every filesystem request like network storage does. The library.xml
+of both runs is compared byte for byte.
+
+    python3 bench_reconcile_pool.py [--books 10 100 1000] [--fuse-delay-ms 2] [--manager OLD.py]
+"""
+import argparse
+import filecmp
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from common import MANAGER, drop_page_cache, load_manager, scratch_dir
+from mkzim import build
+
+HERE = Path(__file__).resolve().parent
+
+
+def reconcile(manager, storage: Path, library_dir: Path, workers: int) -> float:
+    """Run one reconciliation pass; returns its duration in seconds."""
+    shutil.rmtree(library_dir, ignore_errors=True)
+    library_dir.mkdir()
+    manager.storage_path = storage
+    manager.library = manager.KiwixLibrary(library_dir / "library.xml")
+    manager.zim_index = None
+    reconciler = manager.LibraryReconciler()
+    if hasattr(reconciler, "WORKERS"):
+        reconciler.WORKERS = workers
+    drop_page_cache(*storage.glob("*.zim"))
+    started = time.monotonic()
+    reconciler.start()
+    reconciler._thread.join()
+    seconds = time.monotonic() - started
+    if reconciler.state["status"] != "completed":
+        raise RuntimeError(f"reconciliation {reconciler.state}")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--fuse-delay-ms", type=float, default=0, help="Read through slowfs with this delay")
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    manager = load_manager(args.manager)
+    pool_size = getattr(manager.LibraryReconciler, "WORKERS", 1)
+    work = scratch_dir("reconcile")
+    kinds = [
+        build(work / "zstd.zim", articles=400, body_kb=4),
+        build(work / "plain.zim", articles=200, body_kb=4, compression="none"),
+        build(work / "tiny.zim", articles=5),
+    ]
+    try:
+        for count in args.books:
+            source = work / f"books-{count}"
+            source.mkdir()
+            for i in range(count):
+                shutil.copy(kinds[i % len(kinds)], source / f"book{i:05d}.zim")
+            storage, slowfs = source, None
+            if args.fuse_delay_ms:
+                storage = work / f"mount-{count}"
+                storage.mkdir()
+                slowfs = subprocess.Popen([sys.executable, str(HERE / "slowfs.py"), str(source), str(storage),
+                                           str(args.fuse_delay_ms), "32"], stdout=subprocess.PIPE)
+                slowfs.stdout.readline()
+            try:
+                serial = reconcile(manager, storage, work / "library-serial", 1)
+                pooled = reconcile(manager, storage, work / "library-pool", pool_size)
+            finally:
+                if slowfs is not None:
+                    subprocess.run(["umount", str(storage)], check=False)
+                    slowfs.wait()
+            same = filecmp.cmp(work / "library-serial" / "library.xml", work / "library-pool" / "library.xml",
+                               shallow=False)
+            print(f"N={count:5}: 1 thread {serial:6.2f}s, {pool_size} threads {pooled:6.2f}s, "
+                  f"library.xml {'identical' if same else 'DIFFERENT'}")
+            shutil.rmtree(source)
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
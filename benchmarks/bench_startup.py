@@ -0,0 +1,63 @@
+"""Startup: time until the API answers vs until library.xml is complete.
+
+Fills the storage with N copies of a small ZIM that are not yet in
+library.xml, drops the page cache (as root) and starts the manager
+through slow_open.py, which delays every ZIM open (20ms by default) to
+mimic SD-card or HDD seeks. Reports when the first HTTP answer came and
+when /api/health turned 200 (the library scan finished). Revisions
+without /api/health scan before serving, so their library is complete
+when the API first answers.
+
+    python3 bench_startup.py [--books 100 1000] [--delay-ms 20] [--manager OLD.py]
+"""
+import argparse
+import os
+import shutil
+import time
+from pathlib import Path
+
+from common import MANAGER, Manager, drop_page_cache, scratch_dir
+from mkzim import build
+
+HERE = Path(__file__).resolve().parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--delay-ms", type=float, default=20, help="Delay per ZIM open, 0 for none")
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    os.environ["KIWIX_BENCH_OPEN_DELAY_MS"] = str(args.delay_ms)
+    work = scratch_dir("startup")
+    try:
+        small = build(work / "small.zim")
+        for count in args.books:
+            storage = work / f"storage-{count}"
+            storage.mkdir()
+            for i in range(count):
+                shutil.copy(small, storage / f"book{i:04d}.zim")
+            drop_page_cache(*storage.glob("*.zim"))
+            manager = Manager(storage, "--log-level", "warning", script=args.manager,
+                              launcher=HERE / "slow_open.py", wait=False)
+            answered = complete = None
+            while complete is None:
+                status = manager.status("/api/health")
+                now = time.monotonic() - manager.started
+                if status is not None and answered is None:
+                    answered = now
+                if status in (200, 404):
+                    complete = now
+                time.sleep(0.02)
+            manager.stop()
+            books = (storage / "library.xml").read_text().count("<book ")
+            print(f"N={count:5}: API answering after {answered:6.2f}s, library complete after {complete:6.2f}s "
+                  f"({books} books)")
+            shutil.rmtree(storage)
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
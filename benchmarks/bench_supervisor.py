@@ -0,0 +1,92 @@
+"""kiwix-serve supervision: recovery from crashes and hangs.
+
+Runs KiwixServeSupervisor in-process on fake_kiwix_serve.py with its
+timings scaled down (probe every 0.5s, 1s startup grace, stable after
+3s) and switches the fake between healthy, crashed, hung and 404, then
+reports how long each fault took to be noticed and repaired, and the
+restart times of a crash loop (which should back off exponentially).
+
+    python3 bench_supervisor.py [--manager OLD.py]
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from common import MANAGER, free_port, load_manager, scratch_dir
+
+HERE = Path(__file__).resolve().parent
+
+
+def wait(predicate, timeout: float = 30):
+    """Seconds until predicate() held, or None after timeout."""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if predicate():
+            return round(time.monotonic() - started, 2)
+        time.sleep(0.05)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manager", default=MANAGER, help="kiwix-manager.py to test (e.g. an older revision)")
+    args = parser.parse_args()
+
+    manager = load_manager(args.manager)
+    supervisor_class = getattr(manager, "KiwixServeSupervisor", None)
+    if supervisor_class is None:
+        sys.exit("this revision does not supervise kiwix-serve")
+    supervisor_class.PROBE_INTERVAL = 0.5
+    supervisor_class.PROBE_TIMEOUT = 0.5
+    supervisor_class.STARTUP_GRACE = 1
+    supervisor_class.STABLE_SECONDS = 3
+    supervisor_class.STOP_TIMEOUT = 1
+
+    work = scratch_dir("supervisor")
+    mode_file = work / "mode"
+    os.environ["KIWIX_FAKE_MODE_FILE"] = str(mode_file)
+    mode_file.write_text("ok")
+    supervisor = supervisor_class(sys.executable, work / "library.xml", free_port())
+    supervisor.command = [sys.executable, str(HERE / "fake_kiwix_serve.py"), *supervisor.command[1:]]
+    state = supervisor.state
+    try:
+        supervisor.start()
+        print(f"running after        {wait(lambda: state['state'] == 'running')}s")
+
+        pid = state["pid"]
+        mode_file.write_text("crash")
+        noticed = wait(lambda: state["restarts"] == 1)
+        mode_file.write_text("ok")
+        repaired = wait(lambda: state["state"] == "running" and state["pid"] != pid)
+        print(f"crash: restarted after {noticed}s ({state['last_restart_reason']}), running again {repaired}s later")
+
+        time.sleep(supervisor_class.STABLE_SECONDS + 0.5)
+        mode_file.write_text("hang")
+        noticed = wait(lambda: state["restarts"] == 2)
+        mode_file.write_text("ok")
+        repaired = wait(lambda: state["state"] == "running")
+        print(f"hang:  restarted after {noticed}s ({state['last_restart_reason']}), running again {repaired}s later")
+
+        mode_file.write_text("404")
+        time.sleep(3 * supervisor_class.PROBE_INTERVAL)
+        print(f"404:   state {state['state']}, restarts {state['restarts']}")
+
+        mode_file.write_text("crash")
+        started = time.monotonic()
+        times = []
+        for restarts in range(3, 8):
+            wait(lambda: state["restarts"] == restarts, 120)
+            times.append(round(time.monotonic() - started, 1))
+        mode_file.write_text("ok")
+        print(f"crash loop: restarts at {times}s")
+    finally:
+        supervisor.stop()
+        print(f"stopped, child exit code {supervisor._process.poll() if supervisor._process else None}")
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Upload throughput and bytes written: multipart vs raw PUT vs chunked.
+
+Uploads one synthetic ZIM file through each endpoint and reports the
+time and how many bytes the manager process wrote to storage
+(/proc/<pid>/io write_bytes, which includes starlette's multipart spool
+file). multipart and PUT use curl; chunked uploads use this script as
+the client, one PATCH per chunk.
+
+This talks to uvicorn directly. In the add-on the requests go through
+nginx, whose /api/ location must not buffer request bodies
+(proxy_request_buffering off) for the PUT and chunked numbers to hold.
+
+    python3 bench_upload.py [--size-mb 1024] [--rounds 2]
+"""
+import argparse
+import shutil
+import subprocess
+import time
+import urllib.request
+
+from common import Manager, scratch_dir
+from mkzim import build
+
+
+def upload_multipart(manager, path):
+    return subprocess.run(["curl", "-s", "-o", "/dev/null", "-w", "%{http_code}",
+                           "-F", f"file=@{path};filename=upload.zim", f"{manager.base}/api/zim/upload"],
+                          capture_output=True, text=True, check=True).stdout
+
+
+def upload_put(manager, path):
+    return subprocess.run(["curl", "-s", "-o", "/dev/null", "-w", "%{http_code}",
+                           "-T", str(path), f"{manager.base}/api/zim/upload.zim"],
+                          capture_output=True, text=True, check=True).stdout
+
+
+def upload_chunked(manager, path):
+    size = path.stat().st_size
+    code, session = manager.call("POST", "/api/upload", {"filename": "upload.zim", "size": size})
+    if code != 201:
+        return str(code)
+    offset = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(session["chunk_size"])
+            request = urllib.request.Request(f"{manager.base}/api/upload/{session['upload_id']}", data=chunk,
+                                             method="PATCH", headers={"Upload-Offset": str(offset),
+                                                                      "Content-Type": "application/offset+octet-stream"})
+            with urllib.request.urlopen(request, timeout=600) as response:
+                offset = int(response.headers["Upload-Offset"])
+                if offset >= size:
+                    return str(response.status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    work = scratch_dir("upload")
+    try:
+        source = build(work / "source.zim", articles=args.size_mb * 2, body_kb=512,
+                       compression="none", random_body=True)
+        size = source.stat().st_size
+        storage = work / "storage"
+        with Manager(storage, "--min-free-space", 0, "--max-upload-size", args.size_mb * 2) as manager:
+            for _ in range(args.rounds):
+                for name, upload in (("multipart", upload_multipart), ("put", upload_put), ("chunked", upload_chunked)):
+                    written = manager.io_written()
+                    started = time.monotonic()
+                    code = upload(manager, source)
+                    seconds = time.monotonic() - started
+                    written = manager.io_written() - written
+                    print(f"{name:10} HTTP {code}  {seconds:6.1f}s  {size / seconds / 1e6:6.0f} MB/s  "
+                          f"written by the manager {written / 1e9:.2f} GB ({written / size:.2f}x the file)")
+                    manager.call("DELETE", "/api/zim/upload.zim")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Several kiwix-serve workers: page latency under a search-heavy load.
+
+Starts N kiwix_worker.py processes and runs 32 clients against them for
+a while, 20% of the requests being full-text searches, over kept-alive
+connections. Each request goes to the worker with the fewest requests in
+flight (what nginx's least_conn does) or, with --balance round_robin, to
+the next worker in turn. With --nginx the clients talk to nginx instead,
+running the add-on's nginx.conf and the upstream rendered from
+upstream.gtpl (least_conn, or plain round robin with --balance
+round_robin), with the response cache off so every page reaches a worker.
+
+    python3 bench_workers.py [--workers 1 2 4] [--balance least_conn] [--seconds 15] [--nginx [BINARY]]
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from common import free_port, percentile, scratch_dir
+from nginx_fixture import Nginx
+
+HERE = Path(__file__).resolve().parent
+CLIENTS = 32
+SEARCH_SHARE = 0.2
+
+
+async def load(ports, balance: str, seconds: float, prefix: str = ""):
+    in_flight = {port: 0 for port in ports}
+    turn = itertools.cycle(ports)
+    latency = {"page": [], "search": []}
+
+    async def client(seed: int):
+        connections = {}
+        rng = random.Random(seed)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            kind = "search" if rng.random() < SEARCH_SHARE else "page"
+            port = min(ports, key=in_flight.get) if balance == "least_conn" else next(turn)
+            in_flight[port] += 1
+            if port not in connections:
+                connections[port] = await asyncio.open_connection("127.0.0.1", port)
+            reader, writer = connections[port]
+            started = time.monotonic()
+            path = "/search?pattern=water" if kind == "search" else f"/content/book/A/Page_{rng.randrange(1000)}"
+            writer.write(f"GET {prefix}{path} HTTP/1.1\r\nHost: kiwix\r\n\r\n".encode())
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                          if line.lower().startswith(b"content-length"))
+            await reader.readexactly(length)
+            latency[kind].append(time.monotonic() - started)
+            in_flight[port] -= 1
+        for _, writer in connections.values():
+            writer.close()
+
+    await asyncio.gather(*(client(i) for i in range(CLIENTS)))
+    return latency
+
+
+def wait_listening(port: int):
+    for _ in range(100):
+        try:
+            subprocess.run(["curl", "-sf", "-o", "/dev/null", f"http://127.0.0.1:{port}/"], check=True)
+            return
+        except subprocess.CalledProcessError:
+            time.sleep(0.05)
+    raise TimeoutError(f"worker on port {port} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--balance", choices=["least_conn", "round_robin"], default="least_conn")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--nginx", nargs="?", const="nginx", metavar="BINARY",
+                        help="Send the load through nginx with the add-on's configuration")
+    args = parser.parse_args()
+
+    for count in args.workers:
+        ports = [free_port() for _ in range(count)]
+        workers = [subprocess.Popen([sys.executable, str(HERE / "kiwix_worker.py"), str(port)]) for port in ports]
+        nginx = None
+        try:
+            for port in ports:
+                wait_listening(port)
+            if args.nginx:
+                nginx = Nginx(scratch_dir("nginx"), ports, binary=args.nginx)
+                if args.balance == "round_robin":
+                    upstream = nginx.conf.parent / "includes" / "upstream.conf"
+                    upstream.write_text(upstream.read_text().replace("    least_conn;\n", ""))
+                print(nginx.test())
+                nginx.start()
+                latency = asyncio.run(load([nginx.port], args.balance, args.seconds, prefix="/wiki"))
+            else:
+                latency = asyncio.run(load(ports, args.balance, args.seconds))
+        finally:
+            if nginx is not None:
+                nginx.stop()
+                shutil.rmtree(nginx.prefix)
+            for worker in workers:
+                worker.kill()
+                worker.wait()
+        pages, searches = latency["page"], latency["search"]
+        route = " via nginx" if args.nginx else ""
+        print(f"workers={count} {args.balance}{route}: {(len(pages) + len(searches)) / args.seconds:.0f} req/s, "
+              f"{len(searches) / args.seconds:.1f} searches/s, page p50 {percentile(pages, .5) * 1000:.0f}ms "
+              f"p95 {percentile(pages, .95) * 1000:.0f}ms, search p95 {percentile(searches, .95) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""ZIM metadata read: the manager's native header reader vs libzim.
+
+Builds three ZIM files (small, a 4000-article zstd file and a large
+uncompressed one) and times read_zim_metadata() against opening the
+file with libzim.reader.Archive and reading all of its metadata, warm
+(averaged) and with the file evicted from the page cache.
+
+    python3 bench_zim_metadata.py [--large-mb 1024] [--repeat 200]
+"""
+import argparse
+import shutil
+import time
+
+import libzim.reader
+
+from common import drop_page_cache, load_manager, scratch_dir
+from mkzim import build
+
+
+def read_libzim(path):
+    archive = libzim.reader.Archive(str(path))
+    metadata = {key: archive.get_metadata(key) for key in archive.metadata_keys}
+    return metadata, archive.article_count
+
+
+def timed(function, path, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(path)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--large-mb", type=int, default=1024, help="Size of the large file, 0 to skip it")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    manager = load_manager()
+    work = scratch_dir("metadata")
+    try:
+        files = [
+            build(work / "small.zim", articles=20),
+            build(work / "articles.zim", articles=4000, body_kb=256),
+        ]
+        if args.large_mb:
+            # Random 512KB bodies do not compress: about 0.5MB per article
+            files.append(build(work / "large.zim", articles=args.large_mb * 2, body_kb=512,
+                               compression="none", random_body=True))
+        for path in files:
+            metadata = manager.read_zim_metadata(path)
+            native = timed(manager.read_zim_metadata, path, args.repeat)
+            libzim_ms = timed(read_libzim, path, args.repeat)
+            drop_page_cache(path)
+            cold_native = timed(manager.read_zim_metadata, path, 1)
+            drop_page_cache(path)
+            cold_libzim = timed(read_libzim, path, 1)
+            print(f"{path.name:13} {path.stat().st_size / 2**20:8.1f}MB  {metadata['article_count']:5} articles  "
+                  f"warm native {native:.2f}ms, libzim {libzim_ms:.2f}ms  "
+                  f"cold native {cold_native:.1f}ms, libzim {cold_libzim:.1f}ms")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Helpers shared by the benchmark scripts."""
+import importlib.util
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+MANAGER = REPO / "rootfs" / "usr" / "local" / "bin" / "kiwix-manager.py"
+
+
+def load_manager(path=MANAGER):
+    """Import kiwix-manager.py as a module (its file name is not importable)."""
+    spec = importlib.util.spec_from_file_location("kiwix_manager", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["kiwix_manager"] = module
+    spec.loader.exec_module(module)
+    logging.getLogger().setLevel(logging.WARNING)
+    return module
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def drop_page_cache(*paths) -> bool:
+    """Evict paths (or, as root, the whole page cache) so the next read goes to disk."""
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        for path in paths:
+            fd = os.open(path, os.O_RDONLY)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.close(fd)
+        return False
+
+
+def supported_options(script, options):
+    """Drop "--flag value" pairs an older revision of the manager does not know."""
+    known = set(re.findall(r"--[a-z][a-z-]*", subprocess.run(
+        [sys.executable, str(script), "--help"], capture_output=True, text=True).stdout))
+    kept = []
+    for flag, value in zip(options[::2], options[1::2]):
+        if flag in known:
+            kept += [flag, value]
+    return kept
+
+
+class Manager:
+    """kiwix-manager.py running as a subprocess on a free port.
+
+    The catalog is off unless catalog_url is given, so nothing reaches
+    the network. Extra arguments are "--flag value" pairs; flags the
+    script does not know (older revisions) are left out. A launcher script
+    (such as slow_open.py) runs the manager if given. The log goes to
+    <storage>.log next to the storage directory.
+    """
+
+    def __init__(self, storage, *args, script=MANAGER, catalog_url="", wait=True, launcher=None):
+        self.storage = Path(storage)
+        self.storage.mkdir(parents=True, exist_ok=True)
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.log_path = self.storage.with_name(self.storage.name + ".log")
+        options = ["--catalog-url", catalog_url, *map(str, args)]
+        command = [sys.executable, *([str(launcher)] if launcher else []), str(script),
+                   "--host", "127.0.0.1", "--port", str(self.port),
+                   "--storage-path", str(self.storage), *supported_options(script, options)]
+        self.started = time.monotonic()
+        with open(self.log_path, "ab") as log:
+            self.process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        if wait:
+            self.wait_ready()
+
+    def status(self, path: str):
+        """HTTP status of a GET, or None while nothing is listening."""
+        try:
+            with urllib.request.urlopen(self.base + path, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return None
+
+    def wait_ready(self, path: str = "/api/zim", timeout: float = 120):
+        deadline = time.monotonic() + timeout
+        while self.status(path) != 200:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"kiwix-manager exited, see {self.log_path}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"kiwix-manager not ready after {timeout}s, see {self.log_path}")
+            time.sleep(0.05)
+
+    def call(self, method: str, path: str, body=None, headers=None):
+        """JSON API call; returns (status, decoded body)."""
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json", **(headers or {})})
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b"null")
+
+    def download(self, url: str, poll: float = 0.05, **options):
+        """Queue a download and wait for it to finish; returns (final status, seconds)."""
+        started = time.monotonic()
+        code, job = self.call("POST", "/api/zim/download", dict(options, url=url))
+        if code != 200:
+            raise RuntimeError(f"download refused: {code} {job}")
+        while True:
+            _, status = self.call("GET", f"/api/download/{job['job_id']}/status")
+            if status["status"] in ("completed", "failed", "cancelled"):
+                return status, time.monotonic() - started
+            time.sleep(poll)
+
+    def io_written(self) -> int:
+        """Bytes this process has caused to be written to storage (/proc/<pid>/io)."""
+        with open(f"/proc/{self.process.pid}/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("write_bytes"))
+
+    def stop(self):
+        self.process.kill()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def scratch_dir(prefix: str) -> Path:
+    """Fresh directory for a benchmark run (under $BENCH_TMP, default /tmp)."""
+    return Path(tempfile.mkdtemp(prefix=f"kiwix-{prefix}-", dir=os.environ.get("BENCH_TMP")))
@@ -0,0 +1,46 @@
+"""Stand-in for kiwix-serve whose health can be switched from outside.
+
+Accepts kiwix-serve's command line (only --port is used) and answers
+every GET according to the first word of the file named by
+KIWIX_FAKE_MODE_FILE, read on each request:
+
+- ok (or no file): 200
+- 404: 404, which the supervisor must still treat as alive
+- hang: never answers
+- crash: the process exits with code 3
+"""
+import http.server
+import os
+import sys
+import time
+
+MODE_FILE = os.environ.get("KIWIX_FAKE_MODE_FILE", "")
+
+
+def mode() -> str:
+    try:
+        with open(MODE_FILE) as f:
+            return f.read().strip() or "ok"
+    except OSError:
+        return "ok"
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        current = mode()
+        if current == "crash":
+            os._exit(3)
+        if current == "hang":
+            time.sleep(3600)
+        self.send_response(404 if current == "404" else 200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[sys.argv.index("--port") + 1])
+    http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
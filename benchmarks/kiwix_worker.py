@@ -0,0 +1,47 @@
+"""Stand-in for one kiwix-serve worker: a fixed pool of request threads.
+
+kiwix-serve answers from 4 threads by default; a full-text search holds
+one for the index reads (150ms here) while a page takes about 2ms, so a
+few searches are enough to queue every other request behind them.
+
+    python3 kiwix_worker.py PORT [--threads 4] [--search-ms 150] [--page-ms 2]
+"""
+import argparse
+import http.server
+import socketserver
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("port", type=int)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--search-ms", type=float, default=150)
+    parser.add_argument("--page-ms", type=float, default=2)
+    args = parser.parse_args()
+    pool = ThreadPoolExecutor(args.threads)
+    body = b"x" * 2048
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            delay = args.search_ms if self.path.startswith("/search") else args.page_ms
+            pool.submit(time.sleep, delay / 1000).result()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    Server(("127.0.0.1", args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Synthetic ZIM files for benchmarks, written with libzim.
+
+The files carry the usual M/ metadata (Name, Title, Language, Date, ...),
+a 48x48 illustration, a main page, N articles and two images, so the
+manager's header reader, checksum and library code see a realistic
+layout. Article bodies are repetitive text by default (compresses well),
+random bytes with random_body=True (does not compress, for large files),
+or whatever a body(i) callable returns.
+
+    python3 mkzim.py OUT.zim [--articles 20] [--body-kb 1] [--compression zstd|none] [--random]
+"""
+import argparse
+import contextlib
+import os
+import struct
+import sys
+import zlib
+
+from libzim.writer import Creator, Hint, Item, StringProvider
+
+
+def png(width: int = 48, height: int = 48) -> bytes:
+    """A solid red PNG."""
+    raw = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class Page(Item):
+    def __init__(self, path, title, content, mimetype="text/html"):
+        super().__init__()
+        self.path, self.title, self.content, self.mimetype = path, title, content, mimetype
+
+    def get_path(self):
+        return self.path
+
+    def get_title(self):
+        return self.title
+
+    def get_mimetype(self):
+        return self.mimetype
+
+    def get_contentprovider(self):
+        return StringProvider(self.content)
+
+    def get_hints(self):
+        return {Hint.FRONT_ARTICLE: self.mimetype == "text/html"}
+
+
+@contextlib.contextmanager
+def quiet_stdout():
+    """Silence libzim's progress lines, which it prints from C++ to fd 1."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    try:
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def build(path, name="bench_en_all", title="Bench Wiki", language="eng", date="2026-01-01",
+          articles=20, body_kb=1, compression="zstd", random_body=False, body=None):
+    """Write a ZIM file to path (replacing it) and return the path."""
+    if os.path.exists(path):
+        os.unlink(path)
+    if body is None and random_body:
+        blob = os.urandom(body_kb * 1024)
+
+        def body(i):
+            return blob[i % len(blob):] + blob[:i % len(blob)] + str(i).encode()
+    elif body is None:
+        def body(i):
+            return f"<html><body>{'x' * 1024 * body_kb} {i} {os.urandom(8).hex()}</body></html>"
+    creator = Creator(str(path)).config_indexing(False, language).config_compression(compression)
+    with quiet_stdout(), creator:
+        creator.set_mainpath("index")
+        for key, value in [("Name", name), ("Title", title), ("Language", language), ("Creator", "Benchmark"),
+                           ("Publisher", "Benchmark"), ("Date", date), ("Description", f"{title} description"),
+                           ("Tags", "_category:wikipedia;_pictures:no"), ("Flavour", "maxi")]:
+            creator.add_metadata(key, value)
+        creator.add_illustration(48, png())
+        creator.add_item(Page("index", "Index", "<html><body>index</body></html>"))
+        for i in range(articles):
+            creator.add_item(Page(f"A{i}", f"Article {i}", body(i)))
+        creator.add_item(Page("img/a.png", "", "PNGDATA", "image/png"))
+        creator.add_item(Page("img/b.png", "", "PNGDATA2", "image/png"))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--name", default="bench_en_all")
+    parser.add_argument("--articles", type=int, default=20)
+    parser.add_argument("--body-kb", type=int, default=1)
+    parser.add_argument("--compression", default="zstd", choices=["zstd", "none"])
+    parser.add_argument("--random", action="store_true", help="Random article bodies (incompressible)")
+    args = parser.parse_args()
+    build(args.path, name=args.name, articles=args.articles, body_kb=args.body_kb,
+          compression=args.compression, random_body=args.random)
+    print(f"{args.path}: {os.path.getsize(args.path):,} bytes")
@@ -0,0 +1,187 @@
+"""nginx running the add-on's own configuration, for benchmarks that need the proxy.
+
+Renders rootfs/etc/nginx/templates the way 30-kiwix-workers.sh does
+(with tempio when it is installed, otherwise with the few Go template
+actions the templates use), copies nginx.conf and kiwix-proxy.conf into a
+scratch prefix with their absolute paths pointed into it, and runs nginx
+from there as a foreground subprocess. Directives from modules the nginx
+binary lacks (brotli_static, gzip_static) are commented out and listed in
+Nginx.dropped; everything else is the shipped configuration.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from common import REPO, free_port
+
+NGINX_CONF = REPO / "rootfs" / "etc" / "nginx"
+ACTION = re.compile(r"(\{\{-?\s*.*?\s*-?\}\})", re.S)
+MIME_TYPES = """types {
+    text/html html;
+    text/css css;
+    application/javascript js;
+    image/svg+xml svg;
+}
+"""
+
+
+def _lookup(name: str, dot):
+    if name == ".":
+        return dot
+    return dot[name[1:]]
+
+
+def _parse(tokens, pos=0):
+    nodes = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if not token.startswith("{{"):
+            nodes.append(token)
+            continue
+        action = token.strip("{}").strip("-").strip()
+        if action == "end":
+            return nodes, pos
+        word, _, arg = action.partition(" ")
+        if word in ("range", "if"):
+            body, pos = _parse(tokens, pos)
+            nodes.append((word, arg, body))
+        else:
+            nodes.append(("value", action, None))
+    return nodes, pos
+
+
+def _execute(nodes, dot) -> str:
+    out = []
+    for node in nodes:
+        if isinstance(node, str):
+            out.append(node)
+            continue
+        word, arg, body = node
+        value = _lookup(arg, dot)
+        if word == "range":
+            out.extend(_execute(body, item) for item in value)
+        elif word == "if":
+            if value:
+                out.append(_execute(body, dot))
+        else:
+            out.append(json.dumps(value) if isinstance(value, bool) else str(value))
+    return "".join(out)
+
+
+def render(template: Path, values: dict) -> str:
+    """Output of `tempio -template TEMPLATE` for these values."""
+    if shutil.which("tempio"):
+        return subprocess.run(["tempio", "-template", str(template), "-out", "/dev/stdout"],
+                              input=json.dumps(values), capture_output=True, text=True, check=True).stdout
+    tokens = [token for token in ACTION.split(template.read_text()) if token]
+    for i, token in enumerate(tokens):
+        if token.startswith("{{-") and i > 0:
+            tokens[i - 1] = tokens[i - 1].rstrip()
+        if token.endswith("-}}") and i + 1 < len(tokens):
+            tokens[i + 1] = tokens[i + 1].lstrip()
+    return _execute(_parse(tokens)[0], values)
+
+
+def unsupported_directives(binary: str):
+    """Directives of nginx.conf whose module this nginx binary does not have."""
+    built_with = subprocess.run([binary, "-V"], capture_output=True, text=True).stderr
+    modules = "".join(path.read_text() for path in Path("/etc/nginx/modules").glob("*.conf"))
+    dropped = []
+    if "http_gzip_static_module" not in built_with:
+        dropped.append("gzip_static")
+    if "brotli" not in built_with and "brotli" not in modules:
+        dropped.append("brotli_static")
+    return dropped
+
+
+class Nginx:
+    """nginx with the add-on's nginx.conf in front of the given kiwix-serve ports.
+
+    cache_size is the cache_size option in MB (0 turns the cache off, as
+    in the add-on). The cache files end up under cache_path.
+    """
+
+    def __init__(self, prefix, ports, cache_size: int = 0, binary: str = "nginx"):
+        self.prefix = Path(prefix)
+        self.binary = binary
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.cache_path = self.prefix / "cache" / "kiwix"
+        self.conf = self.prefix / "etc" / "nginx" / "nginx.conf"
+        self.dropped = unsupported_directives(binary)
+        self.process = None
+
+        includes = self.conf.parent / "includes"
+        includes.mkdir(parents=True)
+        upstream = render(NGINX_CONF / "templates" / "upstream.gtpl", {"ports": list(ports)})
+        (includes / "upstream.conf").write_text(upstream)
+        if cache_size > 0:
+            cache = {"enabled": True, "max_size": cache_size, "keys_zone": cache_size // 128 + 1}
+        else:
+            cache = {"enabled": False, "max_size": 1, "keys_zone": 1}
+        (includes / "cache.conf").write_text(self._localize(render(NGINX_CONF / "templates" / "cache.gtpl", cache)))
+        mime_types = Path("/etc/nginx/mime.types")
+        (self.conf.parent / "mime.types").write_text(mime_types.read_text() if mime_types.exists() else MIME_TYPES)
+        self.cache_path.mkdir(parents=True)  # Created by the cont-init script in the add-on
+        (self.prefix / "html").mkdir()
+        for name in ("nginx.conf", "kiwix-proxy.conf"):
+            (self.conf.parent / name).write_text(self._localize((NGINX_CONF / name).read_text()))
+
+    def _localize(self, text: str) -> str:
+        """Point the shipped configuration's absolute paths and ports into the prefix."""
+        prefix = str(self.prefix)
+        # Dynamic modules (brotli) stay where the system installed them
+        text = re.sub(r"/etc/nginx/(?!modules/)", f"{prefix}/etc/nginx/", text)
+        text = text.replace("/var/cache/nginx/", f"{prefix}/cache/")
+        text = text.replace("/usr/share/nginx/html", f"{prefix}/html")
+        text = text.replace("/proc/1/fd/2", f"{prefix}/error.log").replace("/proc/1/fd/1", f"{prefix}/access.log")
+        text = text.replace("/tmp/nginx.pid", f"{prefix}/nginx.pid")
+        text = text.replace("listen 8111;", f"listen 127.0.0.1:{self.port};")
+        for directive in self.dropped:
+            text = re.sub(rf"^(\s*)({directive}\b.*)$", r"\1# \2  (not in this nginx build)", text, flags=re.M)
+        return text
+
+    def _command(self, *args):
+        # As root, workers would run as "nobody" and could not read the private scratch directory
+        user = "user root;" if os.geteuid() == 0 else ""
+        return [self.binary, "-p", str(self.prefix), "-c", str(self.conf), "-g", f"daemon off; {user}", *args]
+
+    def test(self) -> str:
+        """`nginx -t` on the rendered configuration; returns its output, raises if it fails."""
+        result = subprocess.run(self._command("-t"), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"nginx -t failed:\n{result.stderr}")
+        return result.stderr.strip()
+
+    def start(self):
+        self.process = subprocess.Popen(self._command())
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                with urllib.request.urlopen(self.base + "/health", timeout=1):
+                    return
+            except (urllib.error.URLError, OSError):
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"nginx did not start, see {self.prefix / 'error.log'}")
+                time.sleep(0.05)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def __enter__(self):
+        self.test()
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
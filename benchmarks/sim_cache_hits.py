@@ -0,0 +1,60 @@
+"""Proxy cache sizing: hit ratio of a size-bounded LRU cache on a Zipf trace.
+
+Replays page views drawn from a Zipf distribution (s=0.9) over a set of
+articles with log-normal sizes (median 15 kB) through an LRU bounded by
+bytes, as nginx's proxy_cache max_size is; every view also loads 6 skin
+assets. Reports the share of requests, article pages and bytes served
+from the cache for several cache sizes. A model, not a measurement:
+nothing is started.
+
+    python3 sim_cache_hits.py [--articles 300000] [--views 300000] [--sizes-mb 0 64 256 512 1024]
+"""
+import argparse
+import bisect
+import collections
+import itertools
+import math
+import random
+
+SKIN_ASSETS = 6
+SKIN_SIZE = 8000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=300_000)
+    parser.add_argument("--views", type=int, default=300_000)
+    parser.add_argument("--zipf", type=float, default=0.9)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[0, 64, 256, 512, 1024])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    weights = list(itertools.accumulate(1 / (i + 1) ** args.zipf for i in range(args.articles)))
+    sizes = [int(min(400_000, rng.lognormvariate(math.log(15_000), 0.9))) for _ in range(args.articles)]
+    trace = [bisect.bisect_left(weights, rng.random() * weights[-1]) for _ in range(args.views)]
+    skin = [(("skin", i), SKIN_SIZE) for i in range(SKIN_ASSETS)]
+
+    for megabytes in args.sizes_mb:
+        capacity, used, lru = megabytes << 20, 0, collections.OrderedDict()
+        hits = requests = page_hits = hit_bytes = total_bytes = 0
+        for article in trace:
+            for key, size in [(("article", article), sizes[article])] + skin:
+                requests += 1
+                total_bytes += size
+                if key in lru:
+                    lru.move_to_end(key)
+                    hits += 1
+                    hit_bytes += size
+                    page_hits += key[0] == "article"
+                    continue
+                if size <= capacity:
+                    lru[key] = size
+                    used += size
+                    while used > capacity:
+                        used -= lru.popitem(last=False)[1]
+        print(f"cache {megabytes:5d} MB: requests from cache {hits / requests:6.1%}, "
+              f"article pages {page_hits / args.views:6.1%}, bytes {hit_bytes / total_bytes:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Run a script with every open of a .zim file delayed, to mimic slow storage.
+
+The delay (KIWIX_BENCH_OPEN_DELAY_MS, default 20) stands for the few
+seeks an SD card or spinning disk needs before the first read of a
+file. Both builtins.open and os.open are wrapped, so revisions of the
+manager that read headers through mmap or pread are slowed alike.
+
+    KIWIX_BENCH_OPEN_DELAY_MS=20 python3 slow_open.py kiwix-manager.py ARGS...
+"""
+import builtins
+import os
+import runpy
+import sys
+import time
+
+DELAY = float(os.environ.get("KIWIX_BENCH_OPEN_DELAY_MS", "20")) / 1000
+
+
+def delayed(function):
+    def wrapper(file, *args, **kwargs):
+        if isinstance(file, (str, os.PathLike)) and os.fspath(file).endswith(".zim"):
+            time.sleep(DELAY)
+        return function(file, *args, **kwargs)
+    return wrapper
+
+
+builtins.open = delayed(builtins.open)
+os.open = delayed(os.open)
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+runpy.run_path(script, run_name="__main__")
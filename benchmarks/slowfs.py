@@ -0,0 +1,144 @@
+"""Read-only FUSE view of a flat directory that adds a delay to every request.
+
+Simulates network storage (a NAS share, a USB disk on a busy hub): each
+lookup, getattr, open and read waits DELAY_MS before it is answered,
+with THREADS requests served in parallel. Talks to /dev/fuse directly,
+so it needs root but no libfuse. Unmount with `umount MOUNTPOINT`.
+
+    python3 slowfs.py SOURCE MOUNTPOINT DELAY_MS [THREADS]
+"""
+import ctypes
+import errno
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+
+IN_HEADER = struct.Struct("<IIQQIIII")
+OUT_HEADER = struct.Struct("<IiQ")
+ATTR = struct.Struct("<QQQQQQIIIIIIIIII")
+LOOKUP, FORGET, GETATTR, OPEN, READ, STATFS, RELEASE, FLUSH, INIT = 1, 2, 3, 14, 15, 17, 18, 25, 26
+OPENDIR, READDIR, RELEASEDIR, ACCESS, INTERRUPT, DESTROY, BATCH_FORGET = 27, 28, 29, 34, 36, 38, 42
+NO_REPLY = {FORGET, BATCH_FORGET, INTERRUPT}
+DELAYED = {LOOKUP, GETATTR, OPEN, READ, READDIR}
+MS_NOSUID, MS_NODEV = 2, 4
+
+
+class SlowFS:
+    def __init__(self, source: str, delay: float):
+        self.source = source
+        self.delay = delay
+        self.names = {}  # node id -> file name
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def node(self, name: str) -> int:
+        with self.lock:
+            if name not in self.ids:
+                self.ids[name] = len(self.ids) + 2
+                self.names[self.ids[name]] = name
+            return self.ids[name]
+
+    def path(self, nodeid: int) -> str:
+        return self.source if nodeid == 1 else os.path.join(self.source, self.names[nodeid])
+
+    def attr(self, nodeid: int) -> bytes:
+        st = os.stat(self.path(nodeid))
+        return ATTR.pack(nodeid, st.st_size, st.st_blocks, int(st.st_atime), int(st.st_mtime), int(st.st_ctime),
+                         0, 0, 0, st.st_mode, st.st_nlink, 0, 0, 0, 4096, 0)
+
+    def handle(self, opcode: int, nodeid: int, body: bytes):
+        if opcode == INIT:
+            major, minor, readahead, flags = struct.unpack_from("<IIII", body)
+            return struct.pack("<IIIIHHIIHHI7I", 7, min(minor, 31), readahead, 1, 16, 12, 131072, 1, 32, 0, 0,
+                               *[0] * 7)
+        if opcode in DELAYED:
+            time.sleep(self.delay)
+        if opcode == LOOKUP:
+            name = body.split(b"\0")[0].decode()
+            if not os.path.exists(os.path.join(self.source, name)):
+                return -errno.ENOENT
+            nodeid = self.node(name)
+            return struct.pack("<QQQQII", nodeid, 0, 1, 1, 0, 0) + self.attr(nodeid)
+        if opcode == GETATTR:
+            return struct.pack("<QII", 1, 0, 0) + self.attr(nodeid)
+        if opcode in (OPEN, OPENDIR):
+            return struct.pack("<QII", os.open(self.path(nodeid), os.O_RDONLY), 0, 0)
+        if opcode == READ:
+            fh, offset, size = struct.unpack_from("<QQI", body)
+            return os.pread(fh, size, offset)
+        if opcode in (RELEASE, RELEASEDIR):
+            os.close(struct.unpack_from("<Q", body)[0])
+            return b""
+        if opcode == READDIR:
+            fh, offset, size = struct.unpack_from("<QQI", body)
+            entries = [".", ".."] + sorted(os.listdir(self.source))
+            out = b""
+            for index in range(offset, len(entries)):
+                name = entries[index].encode()
+                nodeid = 1 if index < 2 else self.node(entries[index])
+                mode = stat.S_IFDIR if index < 2 else os.stat(self.path(nodeid)).st_mode
+                dirent = struct.pack("<QQII", nodeid, index + 1, len(name), (mode >> 12) & 0xF) + name
+                dirent += b"\0" * (-len(dirent) % 8)
+                if len(out) + len(dirent) > size:
+                    break
+                out += dirent
+            return out
+        if opcode == STATFS:
+            st = os.statvfs(self.source)
+            return struct.pack("<QQQQQIII7I", st.f_blocks, st.f_bfree, st.f_bavail, st.f_files, st.f_ffree,
+                               st.f_bsize, 255, st.f_frsize, 0, *[0] * 6)
+        if opcode in (FLUSH, ACCESS):
+            return b""
+        return -errno.ENOSYS
+
+    def serve(self, fd: int):
+        while True:
+            try:
+                request = os.read(fd, (1 << 20) + 4096)
+            except OSError as e:
+                if e.errno in (errno.ENODEV, errno.EBADF):
+                    return  # unmounted
+                if e.errno in (errno.EINTR, errno.EAGAIN, errno.ENOENT):
+                    continue
+                raise
+            length, opcode, unique, nodeid = IN_HEADER.unpack_from(request)[:4]
+            if opcode in NO_REPLY:
+                continue
+            if opcode == DESTROY:
+                return
+            try:
+                result = self.handle(opcode, nodeid, request[IN_HEADER.size:length])
+            except OSError as e:
+                result = -e.errno
+            if isinstance(result, int):
+                reply = OUT_HEADER.pack(OUT_HEADER.size, result, unique)
+            else:
+                reply = OUT_HEADER.pack(OUT_HEADER.size + len(result), 0, unique) + result
+            try:
+                os.write(fd, reply)
+            except OSError:
+                pass
+
+
+def main():
+    source, mountpoint, delay_ms = sys.argv[1], sys.argv[2], float(sys.argv[3])
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 16
+    fd = os.open("/dev/fuse", os.O_RDWR)
+    libc = ctypes.CDLL(None, use_errno=True)
+    options = f"fd={fd},rootmode=40000,user_id=0,group_id=0,allow_other,max_read=131072".encode()
+    if libc.mount(b"slowfs", mountpoint.encode(), b"fuse", MS_NOSUID | MS_NODEV, options) != 0:
+        sys.exit(f"mount failed: {os.strerror(ctypes.get_errno())}")
+    print("mounted", flush=True)
+    fs = SlowFS(source, delay_ms / 1000)
+    workers = [threading.Thread(target=fs.serve, args=(fd,), daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
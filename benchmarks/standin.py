@@ -0,0 +1,114 @@
+"""Range-capable HTTP file server standing in for download.kiwix.org mirrors.
+
+Serves the files of one directory with ETag/Last-Modified, Range and
+If-Range support. Options:
+- per_conn_rate: cap each connection at this many bytes/s
+- ranges=False: ignore Range headers and omit Accept-Ranges
+It also counts the body bytes it sends (Server.bytes_sent), which the
+delta download benchmark uses.
+
+    python3 standin.py DIRECTORY [--port N] [--rate-mb N] [--no-ranges]
+"""
+import argparse
+import http.server
+import os
+import re
+import socketserver
+import threading
+import time
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    root = "."
+    per_conn_rate = 0  # bytes/s, 0 = unlimited
+    ranges = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        path = os.path.join(self.root, self.path.split("?")[0].lstrip("/"))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        st = os.stat(path)
+        size = st.st_size
+        etag = f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{size:x}"'
+        start, end, status = 0, size - 1, 200
+        requested = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if requested and self.ranges and if_range in (None, etag):
+            start = int(requested.group(1))
+            end = min(int(requested.group(2)) if requested.group(2) else size - 1, size - 1)
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if head:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            left = end - start + 1
+            started = time.monotonic()
+            sent = 0
+            while left > 0:
+                chunk = f.read(min(65536, left))
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                self.server.count(len(chunk))
+                left -= len(chunk)
+                sent += len(chunk)
+                if self.per_conn_rate:
+                    ahead = sent / self.per_conn_rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def count(self, nbytes: int):
+        with self._lock:
+            self.bytes_sent += nbytes
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def serve(root, port: int = 0, **options) -> Server:
+    """Start a stand-in for root in a background thread."""
+    handler = type("Handler", (Handler,), dict(options, root=str(root)))
+    server = Server(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--rate-mb", type=float, default=0, help="Per-connection cap in MB/s")
+    parser.add_argument("--no-ranges", action="store_true")
+    args = parser.parse_args()
+    server = serve(args.directory, args.port, per_conn_rate=int(args.rate_mb * 1024 * 1024), ranges=not args.no_ranges)
+    print(f"Serving {args.directory} on {server.url}")
+    threading.Event().wait()
@@ -34,5 +34,16 @@ else
     bashio::log.info "No ZIM files found. You can add them via the management interface."
 fi
 
+# kiwix-serve needs a library.xml to start; the management API fills it in
+LIBRARY_XML="${ZIM_STORAGE_PATH}/library.xml"
+if [[ ! -f "${LIBRARY_XML}" ]]; then
+    bashio::log.info "Creating empty library..."
+    cat > "${LIBRARY_XML}" << 'XML'
+<?xml version="1.0" encoding="UTF-8"?>
+<library version="2.0" />
+XML
+    chown kiwix:kiwix "${LIBRARY_XML}"
+fi
+
 bashio::log.info "Kiwix configuration completed!"
 
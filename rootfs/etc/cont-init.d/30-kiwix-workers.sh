@@ -0,0 +1,43 @@
+#!/usr/bin/with-contenv bashio
+# ==============================================================================
+# Home Assistant Community Add-on: Kiwix
+# Assigns kiwix-serve worker ports and writes the nginx upstream and cache
+# ==============================================================================
+
+KIWIX_WORKERS=$(bashio::config 'kiwix_workers')
+CACHE_SIZE=$(bashio::config 'cache_size')
+
+# Internal ports (not exposed externally)
+KIWIX_INTERNAL_PORT=8080
+MANAGEMENT_INTERNAL_PORT=8081
+
+# One port per kiwix-serve worker, counting up from 8080 and skipping the management port
+KIWIX_PORTS=()
+port=${KIWIX_INTERNAL_PORT}
+while (( ${#KIWIX_PORTS[@]} < KIWIX_WORKERS )); do
+    (( port == MANAGEMENT_INTERNAL_PORT )) || KIWIX_PORTS+=("${port}")
+    (( port++ ))
+done
+
+# Read by the kiwix-serve service
+mkdir -p /run/kiwix
+echo "${KIWIX_PORTS[*]}" > /run/kiwix/worker-ports
+bashio::log.info "Kiwix internal port(s): ${KIWIX_PORTS[*]} (${KIWIX_WORKERS} worker(s))"
+
+# Point nginx at the kiwix-serve workers
+mkdir -p /etc/nginx/includes
+bashio::var.json ports "^[$(IFS=,; echo "${KIWIX_PORTS[*]}")]" \
+    | tempio -template /etc/nginx/templates/upstream.gtpl -out /etc/nginx/includes/upstream.conf
+
+# Size the response cache: about one key per 16KB of cache, 8000 keys per MB of zone
+PROXY_CACHE_PATH=/var/cache/nginx/kiwix
+mkdir -p "${PROXY_CACHE_PATH}"
+chown nginx:nginx "${PROXY_CACHE_PATH}"
+if (( CACHE_SIZE > 0 )); then
+    bashio::var.json enabled "^true" max_size "^${CACHE_SIZE}" keys_zone "^$(( CACHE_SIZE / 128 + 1 ))" \
+        | tempio -template /etc/nginx/templates/cache.gtpl -out /etc/nginx/includes/cache.conf
+else
+    bashio::var.json enabled "^false" max_size "^1" keys_zone "^1" \
+        | tempio -template /etc/nginx/templates/cache.gtpl -out /etc/nginx/includes/cache.conf
+fi
+bashio::log.info "Wiki cache size: ${CACHE_SIZE} MB"
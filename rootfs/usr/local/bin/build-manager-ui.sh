@@ -0,0 +1,31 @@
+#!/bin/bash
+# ==============================================================================
+# Home Assistant Community Add-on: Kiwix
+# Builds the management UI for nginx (run once at image build time):
+# stylesheets and scripts get a content hash in their name so browsers can
+# cache them forever, and every file gets gzip and brotli variants for
+# gzip_static/brotli_static.
+# ==============================================================================
+set -euo pipefail
+
+SOURCE_DIR=${1:-/usr/share/kiwix-manager/ui}
+OUTPUT_DIR=${2:-/usr/share/nginx/html/manage}
+
+rm -rf "${OUTPUT_DIR}"
+mkdir -p "${OUTPUT_DIR}"
+cp "${SOURCE_DIR}/index.html" "${OUTPUT_DIR}/index.html"
+
+for asset in "${SOURCE_DIR}"/*.css "${SOURCE_DIR}"/*.js; do
+    name=$(basename "${asset}")
+    hash=$(sha256sum "${asset}" | cut -c1-12)
+    hashed="${name%.*}.${hash}.${name##*.}"
+    cp "${asset}" "${OUTPUT_DIR}/${hashed}"
+    sed -i "s|\"${name}\"|\"${hashed}\"|g" "${OUTPUT_DIR}/index.html"
+    echo "${name} -> ${hashed}"
+done
+
+for file in "${OUTPUT_DIR}"/*; do
+    gzip -9 -k -n "${file}"
+    brotli -q 11 -k "${file}"
+    touch -r "${file}" "${file}.gz" "${file}.br"
+done
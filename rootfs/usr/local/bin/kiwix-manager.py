@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Kiwix Management API
-Provides REST API and web interface for managing ZIM files
+Provides the REST API for managing ZIM files (the web interface is served by nginx)
 """
 
 import os
@@ -9,29 +9,56 @@ import sys
 import json
 import argparse
 import asyncio
+import base64
+import bisect
+import errno
+import ctypes
+import hashlib
 import logging
+import lzma
+import platform
+import re
+import shutil
+import signal
+import sqlite3
+import struct
 import subprocess
+import tempfile
+import uuid
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
-from urllib.parse import urlparse
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+import heapq
 import threading
 import time
+import urllib.request
+import urllib.error
 
 import aiofiles
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 import uvicorn
 
-# Configure logging
+try:
+    import zstandard
+except ImportError:  # Optional: needed to read zstd-compressed ZIM metadata natively
+    zstandard = None
+
+# Configure logging: INFO and below to stdout, warnings and errors to stderr
+_stdout_handler = logging.StreamHandler(sys.stdout)
+_stdout_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+_stderr_handler = logging.StreamHandler(sys.stderr)
+_stderr_handler.setLevel(logging.WARNING)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.StreamHandler(sys.stderr)
-    ]
+    handlers=[_stdout_handler, _stderr_handler]
 )
 logger = logging.getLogger(__name__)
 
@@ -40,6 +67,40 @@ app = FastAPI(title="Kiwix Management API")
 download_jobs: Dict[str, Dict] = {}
 storage_path: Path = None
 max_upload_size: int = 10000 * 1024 * 1024  # Default 10GB in bytes
+download_connections: int = 4
+max_concurrent_downloads: int = 2
+min_free_space: int = 1024 * 1024 * 1024  # Default 1GB kept free, in bytes
+
+# Blocking work started by request handlers (file I/O, library.xml, subprocesses)
+# runs in this bounded pool so it never stalls the event loop
+BLOCKING_WORKERS = 4
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args):
+    """Run a blocking call in the bounded executor and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, func, *args)
+
+# Download tuning
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB reads per connection
+DOWNLOAD_TIMEOUT = 60  # Socket timeout in seconds
+DOWNLOAD_RETRIES = 3  # Retries per segment before the download fails
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+MAX_SEGMENT_SIZE = 256 * 1024 * 1024
+USER_AGENT = "ha-kiwix-manager"
+
+# Delta downloads: files are split into content-defined blocks, each ending
+# after the first BLOCK_ANCHOR at least BLOCK_MIN bytes in (at most BLOCK_MAX)
+BLOCK_ANCHOR = b"\x9e\x37"  # ~64KB apart in compressed data, so blocks average ~256KB
+BLOCK_MIN = 192 * 1024
+BLOCK_MAX = 1024 * 1024
+BLOCK_READ_SIZE = 4 * 1024 * 1024
+BLOCKMAP_TIMEOUT = 600  # A block map may be built on request by the remote side
+
+# Chunked uploads
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # Chunk size suggested to clients
+UPLOAD_WRITE_SIZE = 4 * 1024 * 1024  # Request bodies are written in blocks of this size
+UPLOAD_SESSION_MAX_AGE = 7 * 24 * 3600  # Unfinished uploads untouched this long are discarded
 
 # CORS middleware for cross-origin requests
 app.add_middleware(
@@ -48,9 +109,164 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Upload-Offset", "Upload-Length", "Location", "ETag"],
 )
 
 
+def format_metric_labels(labels: Dict[str, str]) -> str:
+    """Render a label set as {key="value",...}, escaped per the exposition format."""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {} if labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield self.name, dict(zip(self.labelnames, labelvalues)), value
+
+
+class Gauge:
+    """Value read when the metrics are scraped.
+
+    collect() returns either a number or a list of (labels, value) pairs,
+    so nothing has to be kept up to date on the hot paths.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, collect):
+        self.name = name
+        self.help = help
+        self._collect = collect
+
+    def samples(self):
+        values = self._collect()
+        if not isinstance(values, list):
+            values = [({}, values)]
+        for labels, value in values:
+            yield self.name, labels, value
+
+
+class CollectedCounter(Gauge):
+    """Counter kept by another process, read when the metrics are scraped."""
+
+    kind = "counter"
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values (seconds by default)."""
+
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f"{self.name}_bucket", {"le": repr(float(bound))}, cumulative
+        cumulative += counts[-1]
+        yield f"{self.name}_bucket", {"le": "+Inf"}, cumulative
+        yield f"{self.name}_sum", {}, total
+        yield f"{self.name}_count", {}, cumulative
+
+
+class MetricsRegistry:
+    """Renders registered metrics in the Prometheus text exposition format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, collect) -> Gauge:
+        return self.register(Gauge(name, help, collect))
+
+    def histogram(self, name: str, help: str, buckets: tuple = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.warning(f"Could not collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{format_metric_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+downloaded_bytes = metrics.counter(
+    "kiwix_manager_downloaded_bytes_total", "Bytes received by ZIM downloads")
+uploaded_bytes = metrics.counter(
+    "kiwix_manager_uploaded_bytes_total", "Bytes received by ZIM uploads", ("method",))
+delta_saved_bytes = metrics.counter(
+    "kiwix_manager_delta_saved_bytes_total", "Download bytes copied from an installed edition instead of fetched")
+transfers_finished = metrics.counter(
+    "kiwix_manager_transfers_total", "Finished downloads and uploads", ("kind", "result"))
+library_write_seconds = metrics.histogram(
+    "kiwix_manager_library_write_seconds", "Time to rewrite library.xml")
+zim_list_seconds = metrics.histogram(
+    "kiwix_manager_zim_list_request_seconds", "Time to answer GET /api/zim")
+
+
 def get_file_size(filepath: Path) -> int:
     """Get file size in bytes."""
     try:
@@ -69,10 +285,10 @@ def format_size(size_bytes: int) -> str:
 
 
 def get_zim_info(filepath: Path) -> Dict:
-    """Get ZIM file information."""
+    """Get ZIM file information, including book details read from its header."""
     try:
         stat = filepath.stat()
-        return {
+        info = {
             "name": filepath.name,
             "size": stat.st_size,
             "size_formatted": format_size(stat.st_size),
@@ -82,598 +298,3196 @@ def get_zim_info(filepath: Path) -> Dict:
     except OSError as e:
         logger.error(f"Error getting file info for {filepath}: {e}")
         return None
+    try:
+        details = read_zim_metadata(filepath)
+    except (OSError, ZimFormatError, lzma.LZMAError, struct.error) as e:
+        logger.debug(f"Could not read ZIM metadata of {filepath.name}: {e}")
+        return info
+    details["has_illustration"] = details.pop("illustration") is not None
+    details["book_name"] = details.pop("name")
+    info.update(details)
+    return info
 
 
-def add_zim_to_library(filepath: Path, library_xml: Path):
-    """Add ZIM file to Kiwix library using kiwix-manage."""
-    try:
+ZIM_MAGIC = 72173914
+ZIM_HEADER = struct.Struct("<IHH16sIIQQQQIIQ")
+ZIM_REDIRECT = 0xFFFF
+ZIM_COMPRESSION_NONE = (0, 1)
+ZIM_COMPRESSION_XZ = 4
+ZIM_COMPRESSION_ZSTD = 5
+
+
+class ZimFormatError(ValueError):
+    """The file is not a ZIM archive this reader understands."""
+
+
+class ZimReader:
+    """Reads the header and metadata of a ZIM archive.
+
+    Only the header, the MIME list, the directory entries that are looked
+    up and the clusters holding the requested blobs are ever read; content
+    clusters are never touched, so opening a 100GB archive costs a handful
+    of small reads. Reads are positioned reads rather than page faults on
+    a memory map: pread releases the GIL while it waits for the disk, so
+    several files can be read in parallel threads without stalling the
+    event loop.
+    """
+
+    STRING_READ_SIZE = 256  # Paths and MIME types are almost always shorter
+
+    def __init__(self, filepath: Path):
+        self.filepath = Path(filepath)
+        self._clusters: Dict[int, bytes] = {}
+        self._fd = os.open(self.filepath, os.O_RDONLY)
+        try:
+            self._size = os.fstat(self._fd).st_size
+            if not self._size:
+                raise ZimFormatError(f"{self.filepath.name} is empty")
+            self._read_header()
+            self.mimetypes = self._read_mimetypes()
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def close(self):
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if offset < 0 or offset + size > self._size:
+            raise ZimFormatError(f"Truncated ZIM file {self.filepath.name} (read past end at {offset})")
+        data = os.pread(self._fd, size, offset)
+        if len(data) < size:
+            raise ZimFormatError(f"Truncated ZIM file {self.filepath.name} (short read at {offset})")
+        return data
+
+    def _u64(self, offset: int) -> int:
+        return struct.unpack("<Q", self._read(offset, 8))[0]
+
+    def _cstring(self, offset: int) -> (str, int):
+        """Return the NUL-terminated string at offset and the offset after it."""
+        data = b""
+        while True:
+            chunk = os.pread(self._fd, self.STRING_READ_SIZE, offset + len(data)) if offset >= 0 else b""
+            if not chunk:
+                raise ZimFormatError(f"Unterminated string at {offset} in {self.filepath.name}")
+            end = chunk.find(b"\0")
+            if end >= 0:
+                data += chunk[:end]
+                return data.decode("utf-8", "replace"), offset + len(data) + 1
+            data += chunk
+
+    def _read_header(self):
+        (magic, self.major_version, self.minor_version, uuid_bytes, self.entry_count,
+         self.cluster_count, self.path_ptr_pos, self.title_ptr_pos, self.cluster_ptr_pos,
+         self.mime_list_pos, self.main_page, self.layout_page, self.checksum_pos) = \
+            ZIM_HEADER.unpack(self._read(0, ZIM_HEADER.size))
+        if magic != ZIM_MAGIC:
+            raise ZimFormatError(f"{self.filepath.name} is not a ZIM file")
+        self.uuid = str(uuid.UUID(bytes=uuid_bytes))
+
+    def _read_mimetypes(self) -> List[str]:
+        """The MIME list: NUL-terminated strings ending with an empty one."""
+        mimetypes = []
+        offset = self.mime_list_pos
+        while True:
+            mimetype, offset = self._cstring(offset)
+            if not mimetype:
+                return mimetypes
+            mimetypes.append(mimetype)
+
+    def dirent(self, index: int) -> Dict:
+        """Parse the directory entry with the given (path-ordered) index."""
+        offset = self._u64(self.path_ptr_pos + 8 * index)
+        # The fixed fields and (usually) the whole path in a single read
+        data = os.pread(self._fd, 16 + self.STRING_READ_SIZE, offset)
+        if len(data) < 16:
+            data = self._read(offset, 8)
+        mimetype, _, namespace = struct.unpack_from("<HBc", data)
+        if mimetype == ZIM_REDIRECT:
+            strings_at = 12
+        elif mimetype >= 0xFFFD:  # Link target / deleted entry
+            strings_at = 8
+        else:
+            strings_at = 16
+        end = data.find(b"\0", strings_at)
+        if end >= 0:
+            path = data[strings_at:end].decode("utf-8", "replace")
+        else:
+            path, _ = self._cstring(offset + strings_at)
+        entry = {
+            "namespace": namespace.decode("latin-1"),
+            "path": path,
+            "mimetype": mimetype,
+        }
+        if mimetype == ZIM_REDIRECT:
+            entry["redirect"] = struct.unpack_from("<I", data, 8)[0]
+        elif strings_at == 16:
+            entry["cluster"], entry["blob"] = struct.unpack_from("<II", data, 8)
+        return entry
+
+    def _key(self, index: int):
+        entry = self.dirent(index)
+        return entry["namespace"], entry["path"].encode("utf-8")
+
+    def _lower_bound(self, namespace: str, path: str = "") -> int:
+        target = (namespace, path.encode("utf-8"))
+        lo, hi = 0, self.entry_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, namespace: str, path: str) -> Optional[Dict]:
+        """Look up an entry by namespace and path, following redirects."""
+        index = self._lower_bound(namespace, path)
+        if index >= self.entry_count:
+            return None
+        entry = self.dirent(index)
+        if (entry["namespace"], entry["path"]) != (namespace, path):
+            return None
+        for _ in range(16):
+            if "redirect" not in entry:
+                return entry
+            entry = self.dirent(entry["redirect"])
+        return None
+
+    def namespace_entries(self, namespace: str) -> List[Dict]:
+        """All entries of a (small) namespace such as M."""
+        start = self._lower_bound(namespace)
+        end = self._lower_bound(chr(ord(namespace) + 1))
+        return [self.dirent(index) for index in range(start, end)]
+
+    def namespace_size(self, namespace: str) -> int:
+        return self._lower_bound(chr(ord(namespace) + 1)) - self._lower_bound(namespace)
+
+    def _cluster_bounds(self, number: int):
+        start = self._u64(self.cluster_ptr_pos + 8 * number)
+        if number + 1 < self.cluster_count:
+            end = self._u64(self.cluster_ptr_pos + 8 * (number + 1))
+        else:
+            end = self.checksum_pos
+        return start, end
+
+    def _cluster_data(self, number: int, needed: int):
+        """Return (info byte, cluster data with at least needed bytes decompressed)."""
+        start, end = self._cluster_bounds(number)
+        info = self._read(start, 1)[0]
+        compression = info & 0x0F
+        if compression in ZIM_COMPRESSION_NONE:
+            return info, None
+        cached = self._clusters.get(number)
+        if cached is not None and len(cached) >= needed:
+            return info, cached
+        if compression == ZIM_COMPRESSION_XZ:
+            decompressor = lzma.LZMADecompressor()
+        elif compression == ZIM_COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise ZimFormatError("zstd-compressed cluster and the zstandard module is not installed")
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise ZimFormatError(f"Unknown cluster compression {compression}")
+        chunks = []
+        decompressed = 0
+        offset = start + 1
+        end = min(end, self._size)
+        while decompressed < needed and offset < end:
+            data = os.pread(self._fd, min(65536, end - offset), offset)
+            if not data:
+                break
+            offset += len(data)
+            chunk = decompressor.decompress(data)
+            chunks.append(chunk)
+            decompressed += len(chunk)
+        self._clusters[number] = b"".join(chunks)
+        return info, self._clusters[number]
+
+    def _blob_bounds(self, cluster: int, blob: int):
+        """Return (cluster start, info, data or None, blob start, blob end)."""
+        width = 8 if self._cluster_data(cluster, 0)[0] & 0x10 else 4
+        fmt = "<QQ" if width == 8 else "<II"
+        info, data = self._cluster_data(cluster, (blob + 2) * width)
+        cluster_start = self._cluster_bounds(cluster)[0]
+        if data is None:
+            blob_start, blob_end = struct.unpack(fmt, self._read(cluster_start + 1 + blob * width, 2 * width))
+        else:
+            blob_start, blob_end = struct.unpack_from(fmt, data, blob * width)
+        return cluster_start, data, blob_start, blob_end
+
+    def blob_size(self, entry: Dict) -> int:
+        _, _, blob_start, blob_end = self._blob_bounds(entry["cluster"], entry["blob"])
+        return blob_end - blob_start
+
+    def read_blob(self, entry: Dict) -> bytes:
+        cluster_start, data, blob_start, blob_end = self._blob_bounds(entry["cluster"], entry["blob"])
+        if data is None:
+            return self._read(cluster_start + 1 + blob_start, blob_end - blob_start)
+        _, data = self._cluster_data(entry["cluster"], blob_end)
+        return data[blob_start:blob_end]
+
+    def metadata(self) -> Dict[str, bytes]:
+        """Raw values of all M/ metadata entries."""
+        values = {}
+        for entry in self.namespace_entries("M"):
+            if "redirect" in entry:
+                entry = self.find("M", entry["path"])
+            if entry and "cluster" in entry:
+                values[entry["path"]] = self.read_blob(entry)
+        return values
+
+    def article_count(self) -> int:
+        """Number of front articles, as reported by libzim."""
+        listing = self.find("X", "listing/titleOrdered/v1")
+        if listing and "cluster" in listing:
+            return self.blob_size(listing) // 4
+        # Archives without a title listing use the old A namespace
+        return self.namespace_size("A")
+
+    def illustration(self, size: int = 48) -> Optional[bytes]:
+        """PNG illustration of the given size (falls back to the old -/favicon)."""
+        for namespace, path in (("M", f"Illustration_{size}x{size}@1"), ("-", "favicon")):
+            entry = self.find(namespace, path)
+            if entry and "cluster" in entry:
+                return self.read_blob(entry)
+        return None
+
+
+def parse_zim_counter(counter: str) -> Dict[str, int]:
+    """Parse the M/Counter value ("mime=count;mime=count")."""
+    counts = {}
+    for item in counter.split(";"):
+        mimetype, _, count = item.rpartition("=")
+        if mimetype and count.isdigit():
+            counts[mimetype] = int(count)
+    return counts
+
+
+ZIM_TEXT_METADATA = ("Title", "Description", "Language", "Creator", "Publisher",
+                     "Name", "Flavour", "Tags", "Date")
+
+
+def read_zim_metadata(filepath: Path) -> Dict:
+    """Read book details from a ZIM file without touching its content clusters."""
+    with ZimReader(filepath) as zim:
+        metadata = zim.metadata()
+        details = {key.lower(): metadata.get(key, b"").decode("utf-8", "replace")
+                   for key in ZIM_TEXT_METADATA}
+        counts = parse_zim_counter(metadata.get("Counter", b"").decode("utf-8", "replace"))
+        details.update({
+            "id": zim.uuid,
+            "article_count": zim.article_count(),
+            "media_count": sum(
+                count for mimetype, count in counts.items()
+                if mimetype.startswith(("image/", "video/", "audio/"))
+            ),
+            "mimetypes": zim.mimetypes,
+            "illustration": metadata.get("Illustration_48x48@1") or zim.illustration(),
+        })
+    return details
+
+
+def read_book_attributes(filepath: Path) -> Dict[str, str]:
+    """Build library.xml <book> attributes from a ZIM file's header and metadata."""
+    details = read_zim_metadata(filepath)
+    attributes = {key.lower(): details[key.lower()] for key in ZIM_TEXT_METADATA}
+    attributes["title"] = attributes["title"] or filepath.stem
+    attributes = {
+        "id": details["id"],
+        **attributes,
+        "articleCount": str(details["article_count"]),
+        "mediaCount": str(details["media_count"]),
+        "size": str(filepath.stat().st_size // 1024),
+    }
+    if details["illustration"]:
+        attributes["favicon"] = base64.b64encode(details["illustration"]).decode("ascii")
+        attributes["faviconMimeType"] = "image/png"
+    return attributes
+
+
+class ZimChecksumMismatch(IOError):
+    """A ZIM file's content does not match its embedded MD5 checksum."""
+
+
+class ZimChecksum:
+    """Incremental check of the MD5 checksum stored at the end of a ZIM file.
+
+    The last 16 bytes of a ZIM file are the MD5 of everything before them.
+    Data passed to update() in file order is hashed as it streams past,
+    holding back the latest 16 bytes as the candidate checksum, so the
+    final size does not need to be known up front. Out-of-order writers
+    (segmented downloads) use catch_up(), which hashes the contiguous
+    prefix of the file by reading it back, usually while the fresh data
+    is still in the page cache (see PrefixHasher). Data that was already
+    on disk when the transfer started (a resumed download, blocks copied
+    from another edition) is read back from disk once.
+    """
+
+    READ_SIZE = 8 * 1024 * 1024
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._header = b""
+        self._held = b""
+        self._lock = threading.Lock()
+        self.position = 0
+
+    def update(self, data: bytes):
+        """Hash the next bytes of the file."""
+        if len(self._header) < ZIM_HEADER.size:
+            self._header += bytes(data[:ZIM_HEADER.size - len(self._header)])
+        if len(data) >= 16:
+            self._md5.update(self._held)
+            self._md5.update(memoryview(data)[:-16])
+            self._held = bytes(data[-16:])
+        else:
+            held = self._held + bytes(data)
+            self._md5.update(held[:-16])
+            self._held = held[-16:]
+        self.position += len(data)
+
+    def catch_up(self, fd: int, upto: int):
+        """Hash the file behind fd from the current position up to upto."""
+        with self._lock:
+            while self.position < upto:
+                data = os.pread(fd, min(self.READ_SIZE, upto - self.position), self.position)
+                if not data:
+                    raise IOError(f"Unexpected end of file at {self.position}")
+                self.update(data)
+
+    def result(self) -> Optional[bool]:
+        """True if the checksum matches, False if not, None if there is none to check."""
+        if len(self._header) < ZIM_HEADER.size:
+            return None
+        fields = ZIM_HEADER.unpack(self._header)
+        magic, checksum_pos = fields[0], fields[-1]
+        if magic != ZIM_MAGIC or checksum_pos == 0:
+            return None
+        # A truncated (or over-long) file fails here too
+        return checksum_pos == self.position - 16 and self._md5.digest() == self._held
+
+
+class PrefixHasher:
+    """Feeds the growing contiguous prefix of a file to a ZimChecksum on its own thread.
+
+    Segment workers report how far the completed prefix reaches with
+    advance(), which never blocks, so no worker stops reading its socket
+    to hash data (after a resume the prefix can already be gigabytes
+    long). The hasher thread reads the new bytes back READ_SIZE at a time
+    and checks for new targets and stop() in between.
+    """
+
+    def __init__(self, checksum: ZimChecksum, fd: int):
+        self.checksum = checksum
+        self.fd = fd
+        self._target = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="checksum", daemon=True)
+        self._thread.start()
+
+    def advance(self, upto: int):
+        """Hash up to upto once the thread gets to it."""
+        with self._cond:
+            if upto > self._target:
+                self._target = upto
+                self._cond.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while self.checksum.position >= self._target and not self._closing:
+                        self._cond.wait()
+                    if self.checksum.position >= self._target:
+                        return
+                    upto = min(self._target, self.checksum.position + ZimChecksum.READ_SIZE)
+                self.checksum.catch_up(self.fd, upto)
+        except Exception as e:
+            self._error = e
+
+    def finish(self):
+        """Wait until everything passed to advance() is hashed; re-raises read errors."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Abandon the remaining work (transfer stopped or failed)."""
+        with self._cond:
+            self._closing = True
+            self._target = 0
+            self._cond.notify()
+        self._thread.join()
+
+
+# Kiwix names editions <book>_<YYYY-MM>.zim; kiwix-serve (--nodatealiases)
+# also serves the newest edition under the undated name
+EDITION_PATTERN = re.compile(r"^(?P<name>.+)_(?P<date>\d{4}-\d{2})$")
+
+
+def split_edition(filename: str) -> Tuple[str, Optional[str]]:
+    """Split a ZIM file name into its book name and edition date (None if undated)."""
+    stem = filename[:-len(".zim")] if filename.endswith(".zim") else filename
+    match = EDITION_PATTERN.match(stem)
+    if match is None:
+        return stem, None
+    return match.group("name"), match.group("date")
+
+
+class ProxyCache:
+    """nginx's cache of kiwix-serve responses (proxy_cache_path in nginx.conf).
+
+    Cache keys start with "<book>|", where the book is the ZIM file name
+    without extension as it appears in kiwix-serve URLs, and nginx writes
+    the key into the header of every cache file (for a dated edition,
+    pages requested through its undated alias carry the alias instead).
+    A book's entries can
+    therefore be dropped without the ngx_cache_purge module by deleting
+    the files whose key carries its name; nginx treats a missing file as
+    a miss. Purges run PURGE_DELAY seconds after library.xml is written,
+    once kiwix-serve has reloaded it, so pages from the old file do not
+    find their way back into the cache.
+    """
+
+    PURGE_DELAY = 3
+    HEADER_SIZE = 1024  # Binary header plus the "KEY: ..." line
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def purge_later(self, books):
+        timer = threading.Timer(self.PURGE_DELAY, self.purge, (set(books),))
+        timer.daemon = True
+        timer.start()
+
+    def purge(self, books) -> int:
+        """Delete the cached responses of these books. Returns the number of files removed."""
+        markers = tuple(f"\nKEY: {book}|".encode() for book in books)
+        removed = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                cache_file = os.path.join(root, name)
+                try:
+                    with open(cache_file, 'rb') as f:
+                        header = f.read(self.HEADER_SIZE)
+                    if any(marker in header for marker in markers):
+                        os.unlink(cache_file)
+                        removed += 1
+                except OSError:
+                    continue  # Evicted by nginx meanwhile
+        logger.info(f"Purged {removed} cached response(s) of {', '.join(sorted(books))}")
+        return removed
+
+
+proxy_cache: Optional[ProxyCache] = None
+
+
+class KiwixLibrary:
+    """In-memory model of library.xml.
+
+    Books are read from ZIM headers in-process; kiwix-manage is only used
+    as a fallback for archives the native reader cannot parse. Every change
+    rewrites the whole file atomically (temp file + rename), so kiwix-serve
+    never sees a half-written library. Inside ``with library.batch():``
+    the rewrite is deferred to the end of the block, so any number of
+    adds and removes cost a single write (and a single kiwix-serve reload).
+    Changes outside a batch are written WRITE_DELAY seconds after the
+    first one, so a burst of uploads or deletes also reloads kiwix-serve
+    only once; flush() writes anything pending right away. Books whose
+    file was replaced or removed are purged from the proxy cache once the
+    new library.xml is written, along with the undated alias of any
+    edition that was added or removed, which may now resolve to another
+    file.
+    """
+
+    WRITE_DELAY = 1.0
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._books: Dict[str, ET.Element] = {}
+        self._attrib = {"version": "20110515"}
+        self._batch_depth = 0
+        self._dirty = False
+        self._write_timer: Optional[threading.Timer] = None
+        self._stale: set = set()
+        self.load()
+
+    def _key(self, zim_path: str) -> str:
+        return os.path.normpath(os.path.join(str(self.path.parent), zim_path))
+
+    def _relative_path(self, filepath: Path) -> str:
+        if filepath.parent.resolve() == self.path.parent.resolve():
+            return filepath.name
+        return str(filepath)
+
+    def load(self):
+        """(Re)read library.xml from disk."""
+        with self._lock:
+            self._books = {}
+            if not self.path.exists():
+                return
+            try:
+                root = ET.parse(self.path).getroot()
+            except ET.ParseError as e:
+                backup = self.path.with_name(self.path.name + ".corrupt")
+                logger.warning(f"Could not parse {self.path} ({e}), moved to {backup.name} and starting empty")
+                os.replace(self.path, backup)
+                return
+            self._attrib = dict(root.attrib) or self._attrib
+            for book in root.findall("book"):
+                if book.get("path"):
+                    self._books[self._key(book.get("path"))] = book
+
+    def __contains__(self, filepath: Path) -> bool:
+        with self._lock:
+            return self._key(str(filepath)) in self._books
+
+    def __len__(self) -> int:
+        return len(self._books)
+
+    def paths(self) -> List[Path]:
+        """Absolute paths of every book in the library."""
+        with self._lock:
+            return [Path(key) for key in self._books]
+
+    @contextmanager
+    def batch(self):
+        """Defer the library.xml rewrite until the outermost batch ends."""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._dirty:
+                    self.save()
+
+    def _changed(self):
+        self._dirty = True
+        if self._batch_depth == 0 and self._write_timer is None:
+            self._write_timer = threading.Timer(self.WRITE_DELAY, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+                self._write_timer = None
+            if self._dirty:
+                self.save()
+
+    def save(self):
+        """Atomically rewrite library.xml from the in-memory model."""
+        with self._lock, library_write_seconds.time():
+            root = ET.Element("library", self._attrib)
+            root.extend(self._books.values())
+            ET.indent(root)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+                f.write(ET.tostring(root, encoding="utf-8"))
+                f.write(b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._dirty = False
+            logger.debug(f"Wrote {self.path} ({len(self._books)} books)")
+            if self._stale:
+                if proxy_cache is not None:
+                    proxy_cache.purge_later(self._stale)
+                self._stale = set()
+
+    def book_element(self, filepath: Path) -> Optional[ET.Element]:
+        """Read a ZIM file into a <book> element (native reader, kiwix-manage fallback)."""
+        try:
+            attributes = read_book_attributes(filepath)
+        except (OSError, ZimFormatError, lzma.LZMAError, struct.error) as e:
+            logger.warning(f"Native reader failed for {filepath.name} ({e}), trying kiwix-manage")
+            return self._book_via_kiwix_manage(filepath)
+        attributes["path"] = self._relative_path(filepath)
+        return ET.Element("book", attributes)
+
+    def _book_via_kiwix_manage(self, filepath: Path) -> Optional[ET.Element]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            scratch = Path(tmpdir) / "library.xml"
+            try:
+                result = subprocess.run(
+                    ['kiwix-manage', str(scratch), 'add', str(filepath)],
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
+            except (OSError, subprocess.TimeoutExpired) as e:
+                logger.error(f"kiwix-manage failed for {filepath.name}: {e}")
+                return None
+            if result.returncode != 0 or not scratch.exists():
+                logger.error(f"kiwix-manage failed for {filepath.name}: {result.stderr}")
+                return None
+            book = ET.parse(scratch).getroot().find("book")
+        if book is None:
+            return None
+        book.set("path", self._relative_path(filepath))
+        return book
+
+    def _mark_stale(self, filepath: Path, alias_only: bool = False):
+        name, date = split_edition(filepath.name)
+        if date is not None:
+            self._stale.add(name)
+        if not alias_only:
+            self._stale.add(filepath.stem)
+
+    def add(self, filepath: Path, book: Optional[ET.Element] = None) -> bool:
+        """Add (or refresh) a ZIM file's entry. Returns False if it cannot be read."""
         if not filepath.exists():
             logger.error(f"Cannot add {filepath.name} to library: file does not exist")
             return False
-        
-        # Ensure library.xml exists
-        if not library_xml.exists():
-            logger.info(f"Creating library.xml at {library_xml}")
-            library_xml.parent.mkdir(parents=True, exist_ok=True)
-            with open(library_xml, 'w') as f:
-                f.write('<?xml version="1.0" encoding="UTF-8"?>\n<library version="2.0" />\n')
-        
-        # Use kiwix-manage to add the ZIM file to library
-        logger.info(f"Adding {filepath.name} to library.xml using kiwix-manage")
-        result = subprocess.run(
-            ['kiwix-manage', str(library_xml), 'add', str(filepath)],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode == 0:
-            logger.info(f"Successfully added {filepath.name} to library.xml")
-            return True
-        else:
-            logger.error(f"Failed to add {filepath.name} to library: {result.stderr}")
+        if book is None:
+            book = self.book_element(filepath)
+        if book is None:
             return False
-            
-    except subprocess.TimeoutExpired:
-        logger.error(f"Timeout adding {filepath.name} to library")
-        return False
-    except Exception as e:
-        logger.error(f"Error adding {filepath.name} to library: {e}")
-        return False
+        with self._lock:
+            key = self._key(book.get("path"))
+            previous = self._books.get(key)
+            if previous is None:
+                self._mark_stale(filepath, alias_only=True)
+            elif previous.get("id") != book.get("id"):
+                self._mark_stale(filepath)
+            self._books[key] = book
+            self._changed()
+        logger.info(f"Added {filepath.name} to library.xml")
+        return True
 
+    def remove(self, filepath: Path) -> bool:
+        """Remove a ZIM file's entry. Returns False if it was not in the library."""
+        with self._lock:
+            if self._books.pop(self._key(str(filepath)), None) is None:
+                return False
+            self._mark_stale(filepath)
+            self._changed()
+        logger.info(f"Removed {filepath.name} from library.xml")
+        return True
 
-def download_file_with_progress(url: str, filepath: Path, job_id: str):
-    """Download file with progress tracking."""
-    import urllib.request
-    import urllib.error
-    
-    try:
-        logger.info(f"Starting download: {url} -> {filepath}")
-        download_jobs[job_id]["status"] = "downloading"
-        download_jobs[job_id]["progress"] = 0
-        
-        def report_progress(block_num, block_size, total_size):
-            if total_size > 0:
-                downloaded = block_num * block_size
-                progress = min(int((downloaded / total_size) * 100), 100)
-                download_jobs[job_id]["progress"] = progress
-                download_jobs[job_id]["downloaded"] = downloaded
-                download_jobs[job_id]["total_size"] = total_size
-                logger.info(f"Download progress: {progress}% ({format_size(downloaded)}/{format_size(total_size)})")
-        
-        urllib.request.urlretrieve(url, filepath, reporthook=report_progress)
-        
-        # Verify file was downloaded
-        if filepath.exists() and filepath.stat().st_size > 0:
-            download_jobs[job_id]["status"] = "completed"
-            download_jobs[job_id]["progress"] = 100
-            download_jobs[job_id]["file_size"] = filepath.stat().st_size
-            logger.info(f"Download completed: {filepath.name} ({format_size(filepath.stat().st_size)})")
-            
-            # Add to library.xml
-            library_xml = filepath.parent / "library.xml"
-            if add_zim_to_library(filepath, library_xml):
-                logger.info(f"ZIM file {filepath.name} added to library successfully")
-            else:
-                logger.warning(f"ZIM file {filepath.name} downloaded but failed to add to library")
-        else:
-            download_jobs[job_id]["status"] = "failed"
-            download_jobs[job_id]["error"] = "Downloaded file is empty or doesn't exist"
-            logger.error(f"Download failed: file is empty")
-            
-    except Exception as e:
-        download_jobs[job_id]["status"] = "failed"
-        download_jobs[job_id]["error"] = str(e)
-        logger.error(f"Download error: {e}")
-        if filepath.exists():
+
+library: Optional[KiwixLibrary] = None
+
+
+class RetiredEditions:
+    """Old editions of ZIM files that a newer edition has replaced.
+
+    A replaced file leaves the storage directory RETIRE_DELAY seconds after
+    library.xml stopped listing it, once every kiwix-serve worker has
+    reloaded, and moves into the retired directory on the same volume (a
+    rename, so it costs no I/O). Its mtime then records when it was
+    retired. Files older than retention_days are deleted hourly; with a
+    retention of 0 a replaced file is deleted at once. Downloads that are
+    short of space may reclaim retired files early, oldest first.
+    """
+
+    RETIRE_DELAY = 10
+    COLLECT_INTERVAL = 3600
+
+    def __init__(self, directory: Path, retention_days: int = 7):
+        self.directory = directory
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="retired-editions", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.collect()
+            except OSError as e:
+                logger.warning(f"Could not clean up retired editions: {e}")
+            time.sleep(self.COLLECT_INTERVAL)
+
+    def retire_later(self, filepath: Path):
+        timer = threading.Timer(self.RETIRE_DELAY, self.retire, (filepath,))
+        timer.daemon = True
+        timer.start()
+
+    def retire(self, filepath: Path):
+        """Move a replaced file out of the storage directory (or delete it without retention)."""
+        if filepath in library:
+            logger.info(f"{filepath.name} is back in the library, not retiring it")
+            return
+        try:
+            if self.retention_days <= 0:
+                filepath.unlink()
+                logger.info(f"Deleted replaced edition {filepath.name}")
+                return
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                target = self.directory / filepath.name
+                os.replace(filepath, target)
+                os.utime(target)
+            logger.info(f"Retired {filepath.name}, deleting it in {self.retention_days} day(s)")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Could not retire {filepath.name}: {e}")
+
+    def _files(self) -> List[Tuple[float, int, Path]]:
+        """(retired at, size, path) of every retired file, oldest first."""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, Path(entry.path)))
+        return sorted(files)
+
+    def _delete(self, filepath: Path, reason: str) -> bool:
+        try:
             filepath.unlink()
+        except FileNotFoundError:
+            return False
+        logger.info(f"Deleted retired edition {filepath.name} ({reason})")
+        return True
 
+    def collect(self) -> int:
+        """Delete retired files past the retention period. Returns the number deleted."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            return sum(self._delete(path, f"retired over {self.retention_days} day(s) ago")
+                       for retired_at, _, path in self._files() if retired_at < cutoff)
 
-@app.get("/", response_class=HTMLResponse)
-async def management_ui():
-    """Serve the management UI."""
-    html_content = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Kiwix ZIM File Manager</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-            background: #f5f5f5;
-            padding: 20px;
-            color: #333;
-        }
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 8px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            padding: 30px;
-        }
-        h1 {
-            color: #2c3e50;
-            margin-bottom: 30px;
-            border-bottom: 3px solid #3498db;
-            padding-bottom: 10px;
-        }
-        .section {
-            margin-bottom: 40px;
-        }
-        .section h2 {
-            color: #34495e;
-            margin-bottom: 20px;
-            font-size: 1.5em;
-        }
-        .form-group {
-            margin-bottom: 20px;
-        }
-        label {
-            display: block;
-            margin-bottom: 8px;
-            font-weight: 600;
-            color: #555;
-        }
-        input[type="text"], input[type="file"] {
-            width: 100%;
-            padding: 12px;
-            border: 2px solid #ddd;
-            border-radius: 4px;
-            font-size: 14px;
-            transition: border-color 0.3s;
-        }
-        input[type="text"]:focus, input[type="file"]:focus {
-            outline: none;
-            border-color: #3498db;
-        }
-        button {
-            background: #3498db;
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 14px;
-            font-weight: 600;
-            transition: background 0.3s;
-        }
-        button:hover {
-            background: #2980b9;
-        }
-        button.delete {
-            background: #e74c3c;
-        }
-        button.delete:hover {
-            background: #c0392b;
-        }
-        .file-list {
-            display: grid;
-            gap: 15px;
-        }
-        .file-item {
-            background: #f8f9fa;
-            border: 1px solid #dee2e6;
-            border-radius: 6px;
-            padding: 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        .file-info {
-            flex: 1;
-        }
-        .file-name {
-            font-weight: 600;
-            color: #2c3e50;
-            margin-bottom: 8px;
-            font-size: 16px;
-        }
-        .file-meta {
-            color: #7f8c8d;
-            font-size: 14px;
-        }
-        .file-actions {
-            display: flex;
-            gap: 10px;
-        }
-        .progress-container {
-            margin-top: 10px;
-            display: none;
-        }
-        .progress-container.active {
-            display: block;
-        }
-        .progress-bar {
-            width: 100%;
-            height: 20px;
-            background: #e9ecef;
-            border-radius: 10px;
-            overflow: hidden;
-            margin-top: 5px;
-        }
-        .progress-fill {
-            height: 100%;
-            background: #3498db;
-            transition: width 0.3s;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: white;
-            font-size: 12px;
-            font-weight: 600;
-        }
-        .status {
-            padding: 10px;
-            border-radius: 4px;
-            margin-bottom: 20px;
-            display: none;
-        }
-        .status.success {
-            background: #d4edda;
-            color: #155724;
-            border: 1px solid #c3e6cb;
-        }
-        .status.error {
-            background: #f8d7da;
-            color: #721c24;
-            border: 1px solid #f5c6cb;
-        }
-        .status.active {
-            display: block;
-        }
-        .upload-progress {
-            margin-top: 10px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>📚 Kiwix ZIM File Manager</h1>
-        
-        <div id="status" class="status"></div>
-        
-        <div class="section">
-            <h2>Download ZIM File from URL</h2>
-            <form id="downloadForm">
-                <div class="form-group">
-                    <label for="downloadUrl">ZIM File URL:</label>
-                    <input type="text" id="downloadUrl" name="url" placeholder="https://download.kiwix.org/zim/wikipedia_en_all_2023-01.zim" required>
-                </div>
-                <button type="submit">Download</button>
-                <div id="downloadProgress" class="progress-container">
-                    <div class="progress-bar">
-                        <div id="downloadProgressFill" class="progress-fill" style="width: 0%">0%</div>
-                    </div>
-                </div>
-            </form>
-        </div>
-        
-        <div class="section">
-            <h2>Upload ZIM File</h2>
-            <form id="uploadForm">
-                <div class="form-group">
-                    <label for="uploadFile">Select ZIM file:</label>
-                    <input type="file" id="uploadFile" name="file" accept=".zim" required>
-                </div>
-                <button type="submit">Upload</button>
-                <div id="uploadProgress" class="progress-container">
-                    <div class="progress-bar">
-                        <div id="uploadProgressFill" class="progress-fill" style="width: 0%">0%</div>
-                    </div>
-                </div>
-            </form>
-        </div>
-        
-        <div class="section">
-            <h2>ZIM Files</h2>
-            <div id="fileList" class="file-list">
-                <p>Loading...</p>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        // Detect base path (for ingress compatibility)
-        // When accessed via ingress, the iframe's pathname is stripped by the proxy
-        // So we need to get it from the parent window or from postMessage
-        function getBasePath() {
-            // First, try to get from parent window (if in iframe)
-            try {
-                if (window.parent && window.parent !== window) {
-                    const parentPath = window.parent.location.pathname;
-                    // Home Assistant ingress pattern: /api/hassio_ingress/<token>
-                    let ingressMatch = parentPath.match(/^(\/api\/hassio_ingress\/[^/]+)/);
-                    if (ingressMatch) {
-                        console.log('[Management] Detected HA ingress from parent:', ingressMatch[1]);
-                        return ingressMatch[1];
-                    }
-                    // Old ingress pattern: /<addon_id>/ingress
-                    ingressMatch = parentPath.match(/^(\/[^\/]+\/ingress)/);
-                    if (ingressMatch) {
-                        console.log('[Management] Detected old ingress from parent:', ingressMatch[1]);
-                        return ingressMatch[1];
-                    }
-                }
-            } catch (e) {
-                // Cross-origin restriction - use postMessage or fallback
-            }
-            
-            // Check if base path was set via postMessage
-            if (window.__INGRESS_BASE_PATH__) {
-                console.log('[Management] Using base path from postMessage:', window.__INGRESS_BASE_PATH__);
-                return window.__INGRESS_BASE_PATH__;
-            }
-            
-            // Listen for postMessage from parent
-            window.addEventListener('message', function(event) {
-                if (event.data && event.data.type === 'ingress-path') {
-                    console.log('[Management] Received base path via postMessage:', event.data.basePath);
-                    window.__INGRESS_BASE_PATH__ = event.data.basePath;
+    def reclaim(self, nbytes: int) -> int:
+        """Delete retired files, oldest first, until nbytes are freed. Returns the bytes freed."""
+        freed = 0
+        with self._lock:
+            for _, size, path in self._files():
+                if freed >= nbytes:
+                    break
+                if self._delete(path, "space needed"):
+                    freed += size
+        return freed
+
+    def to_dict(self) -> Dict:
+        files = self._files()
+        return {
+            "retention_days": self.retention_days,
+            "files": [
+                {
+                    "filename": path.name,
+                    "size": size,
+                    "retired_at": datetime.fromtimestamp(retired_at).isoformat(),
+                    "expires_at": datetime.fromtimestamp(retired_at + self.retention_days * 86400).isoformat(),
                 }
-            });
-            
-            // Fallback: try to detect from current pathname
-            const pathname = window.location.pathname;
-            // Home Assistant ingress pattern
-            let ingressMatch = pathname.match(/^(\/api\/hassio_ingress\/[^\/]+)/);
-            if (ingressMatch) {
-                console.log('[Management] Detected HA ingress from pathname:', ingressMatch[1]);
-                return ingressMatch[1];
-            }
-            // Old ingress pattern
-            ingressMatch = pathname.match(/^(\/[^\/]+\/ingress)/);
-            if (ingressMatch) {
-                console.log('[Management] Detected old ingress from pathname:', ingressMatch[1]);
-                return ingressMatch[1];
-            }
-            
-            // If pathname is just / or /manage/, no ingress path
-            if (pathname === '/' || pathname === '/manage/' || pathname.match(/^\/manage\/?$/)) {
-                console.log('[Management] No ingress path - direct access');
-                return '';
-            }
-            
-            // Fallback: extract ingress path from pathname
-            const parts = pathname.split('/').filter(p => p);
-            const ingressIndex = parts.indexOf('ingress');
-            if (ingressIndex >= 0) {
-                const fallbackPath = '/' + parts.slice(0, ingressIndex + 1).join('/');
-                console.log('[Management] Fallback ingress path:', fallbackPath);
-                return fallbackPath;
-            }
-            
-            console.log('[Management] No ingress path detected');
-            return '';
+                for retired_at, size, path in files
+            ],
+            "size": sum(size for _, size, _ in files),
         }
-        
-        // Wait a bit for postMessage to arrive, then get base path
-        let basePath = '';
-        let apiBase = '/api';
-        
-        function initPaths() {
-            basePath = getBasePath();
-            apiBase = basePath + '/api';
-            console.log('Management: Detected base path:', basePath);
-            console.log('Management: API base:', apiBase);
+
+
+retired_editions: Optional[RetiredEditions] = None
+
+
+def replace_edition(filepath: Path, old_path: Path) -> bool:
+    """Swap an installed edition of a book for a new one without a gap.
+
+    The new book is added and the old one removed in one library.xml
+    write, so kiwix-serve reloads once and serves one edition or the
+    other throughout; the old file is retired afterwards. Returns False
+    (leaving the old edition in place) if the new file cannot be read.
+    """
+    book = library.book_element(filepath)
+    if book is None:
+        logger.warning(f"{filepath.name} is not readable, keeping {old_path.name}")
+        return False
+    with library.batch():
+        library.add(filepath, book)
+        replaced = library.remove(old_path)
+    if old_path.exists():
+        retired_editions.retire_later(old_path)
+    logger.info(f"Replaced {old_path.name} with {filepath.name}" if replaced
+                else f"Added {filepath.name} ({old_path.name} was not in the library)")
+    return True
+
+
+class ZimIndex:
+    """Persisted index of per-file ZIM info behind /api/zim.
+
+    Entries are keyed on (inode, size, mtime), so a file is only re-read
+    when it actually changed. A refresh costs one stat of the storage
+    directory unless its mtime moved (a file was added, removed or
+    renamed into place); in-place changes are picked up through
+    ``invalidate()``, which every library change calls. The serialized
+    listing and its ETag are kept in memory, so answering /api/zim does
+    not depend on the number of books.
+    """
+
+    VERSION = 1
+    # Directory mtimes this recent may still change within the same tick
+    MTIME_SETTLE_SECONDS = 2
+
+    def __init__(self, directory: Path, path: Path):
+        self.directory = directory
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._dir_mtime: Optional[int] = None
+        self.listing: List[Dict] = []
+        self.body = b"[]"
+        self.etag = '"empty"'
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data["entries"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable ZIM index {self.path}: {e}")
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump({"version": self.VERSION, "entries": self._entries}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def invalidate(self):
+        """Force the next refresh to re-stat every file."""
+        self._dir_mtime = None
+
+    def is_current(self) -> bool:
+        """Cheap check (one stat) whether refresh() would have nothing to do."""
+        try:
+            return self.directory.stat().st_mtime_ns == self._dir_mtime
+        except OSError:
+            return True
+
+    def refresh(self):
+        """Bring the index up to date with the storage directory."""
+        with self._lock:
+            try:
+                dir_mtime = self.directory.stat().st_mtime_ns
+            except OSError:
+                return
+            if dir_mtime == self._dir_mtime:
+                return
+            changed = False
+            seen = set()
+            with os.scandir(self.directory) as it:
+                for dirent in it:
+                    if not dirent.name.endswith(".zim") or not dirent.is_file():
+                        continue
+                    seen.add(dirent.name)
+                    stat = dirent.stat()
+                    key = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+                    entry = self._entries.get(dirent.name)
+                    if entry and entry["key"] == key:
+                        continue
+                    info = get_zim_info(Path(dirent.path))
+                    if info:
+                        self._entries[dirent.name] = {"key": key, "info": info}
+                        changed = True
+            for name in set(self._entries) - seen:
+                del self._entries[name]
+                changed = True
+            if changed or not self.listing and self._entries:
+                # Newest first, by numeric mtime
+                ordered = sorted(self._entries.values(), key=lambda e: e["key"][2], reverse=True)
+                self.listing = [entry["info"] for entry in ordered]
+                self.body = json.dumps(self.listing).encode()
+                self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:16]}"'
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.warning(f"Could not save ZIM index {self.path}: {e}")
+            # Saving the index never touches the storage directory itself, but
+            # a change landing in the same mtime tick as the scan would be missed
+            if time.time_ns() - dir_mtime > self.MTIME_SETTLE_SECONDS * 1_000_000_000:
+                self._dir_mtime = dir_mtime
+
+
+zim_index: Optional[ZimIndex] = None
+
+
+# ioprio_set syscall numbers for the architectures the add-on is built for
+IOPRIO_SYSCALLS = {"x86_64": 251, "i686": 289, "i386": 289, "aarch64": 30, "armv7l": 314, "armv6l": 314}
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+
+
+def set_idle_io_priority() -> bool:
+    """Best effort: move the calling thread to the idle I/O scheduling class."""
+    number = IOPRIO_SYSCALLS.get(platform.machine())
+    if number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        # who=0 with IOPRIO_WHO_PROCESS means the calling thread
+        if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0:
+            return True
+        logger.debug(f"ioprio_set failed: {os.strerror(ctypes.get_errno())}")
+    except (OSError, AttributeError) as e:
+        logger.debug(f"ioprio_set unavailable: {e}")
+    return False
+
+
+def verify_zim_file(filepath: Path, stop: Optional[threading.Event] = None, on_bytes=None) -> Optional[bool]:
+    """Check a ZIM file against its embedded MD5 (see ZimChecksum.result)."""
+    checksum = ZimChecksum()
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        size = os.fstat(fd).st_size
+        while checksum.position < size:
+            if stop is not None and stop.is_set():
+                raise DownloadStopped()
+            start = checksum.position
+            checksum.catch_up(fd, min(size, start + ZimChecksum.READ_SIZE))
+            # Keep a full pass over the library from evicting kiwix-serve's pages
+            os.posix_fadvise(fd, start, checksum.position - start, os.POSIX_FADV_DONTNEED)
+            if on_bytes:
+                on_bytes(checksum.position - start)
+    finally:
+        os.close(fd)
+    return checksum.result()
+
+
+class ZimVerifier:
+    """Background "verify all" job checking ZIM files against their MD5.
+
+    Runs in a single thread at idle I/O priority, reading each file
+    sequentially in large blocks. Results are kept until the next run
+    and published as "verify" events.
+    """
+
+    RESULT_NAMES = {True: "ok", False: "corrupt", None: "no_checksum"}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.state: Dict = {"status": "idle", "results": {}}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, files: List[Path]) -> bool:
+        """Start verifying files. Returns False if a run is already in progress."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self.state = {
+                "status": "running",
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "current": None,
+                "files_total": len(files),
+                "files_done": 0,
+                "bytes_total": sum(get_file_size(path) for path in files),
+                "bytes_done": 0,
+                "results": {},
+            }
+            self._thread = threading.Thread(target=self._run, args=(files,), name="zim-verify", daemon=True)
+            self._thread.start()
+            return True
+
+    def cancel(self) -> bool:
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+
+    def status(self) -> Dict:
+        return dict(self.state, results=dict(self.state["results"]))
+
+    def _run(self, files: List[Path]):
+        set_idle_io_priority()
+        logger.info(f"Verifying {len(files)} ZIM file(s)")
+
+        def on_bytes(nbytes: int):
+            self.state["bytes_done"] += nbytes
+
+        for filepath in files:
+            if self._stop.is_set():
+                break
+            self.state["current"] = filepath.name
+            started = time.monotonic()
+            try:
+                result = {"result": self.RESULT_NAMES[verify_zim_file(filepath, self._stop, on_bytes)]}
+            except DownloadStopped:
+                break
+            except OSError as e:
+                result = {"result": "error", "error": str(e)}
+            result["checked_at"] = datetime.now().isoformat()
+            result["duration"] = round(time.monotonic() - started, 1)
+            self.state["results"][filepath.name] = result
+            self.state["files_done"] += 1
+            log = logger.warning if result["result"] in ("corrupt", "error") else logger.info
+            log(f"Verified {filepath.name}: {result['result']}")
+            events.publish("verify", self.status())
+        self.state["current"] = None
+        self.state["status"] = "cancelled" if self._stop.is_set() else "completed"
+        self.state["finished_at"] = datetime.now().isoformat()
+        logger.info(f"ZIM verification {self.state['status']}: {self.state['files_done']}/{self.state['files_total']} file(s)")
+        events.publish("verify", self.status())
+
+
+zim_verifier = ZimVerifier()
+
+
+def format_duration(seconds: Optional[float]) -> Optional[str]:
+    """Format seconds as a short human-readable duration."""
+    if seconds is None:
+        return None
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
+
+class ProgressTracker:
+    """Byte counter with a moving-average throughput and ETA for one transfer.
+
+    add() is called for every chunk from any number of threads and is
+    cheap: it only calls on_update when a whole percent is crossed or
+    STATUS_INTERVAL has passed, and only logs every LOG_PERCENT_STEP
+    percent or LOG_INTERVAL seconds.
+    """
+
+    SAMPLE_INTERVAL = 1.0  # Seconds per throughput sample
+    SMOOTHING = 0.3  # Weight of the newest sample in the moving average
+    STATUS_INTERVAL = 0.5
+    LOG_INTERVAL = 30.0
+    LOG_PERCENT_STEP = 10
+
+    def __init__(self, label: str, total: int, done: int = 0, on_update=None):
+        self.label = label
+        self.total = total
+        self.done = done
+        self.speed = 0.0
+        self._on_update = on_update
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._started = now
+        self._started_bytes = done
+        self._sample_time = now
+        self._sample_bytes = done
+        self._status_time = now
+        self._log_time = now
+        self._percent = self._percent_of(done)
+        self._logged_percent = self._percent
+
+    def _percent_of(self, done: int) -> int:
+        return min(int(done * 100 / self.total), 100) if self.total > 0 else 0
+
+    def add(self, nbytes: int):
+        with self._lock:
+            self.done += nbytes
+            now = time.monotonic()
+            if now - self._sample_time >= self.SAMPLE_INTERVAL:
+                sample = (self.done - self._sample_bytes) / (now - self._sample_time)
+                self.speed = sample if not self.speed else (
+                    self.SMOOTHING * sample + (1 - self.SMOOTHING) * self.speed
+                )
+                self._sample_time = now
+                self._sample_bytes = self.done
+            percent = self._percent_of(self.done)
+            emit = percent != self._percent or now - self._status_time >= self.STATUS_INTERVAL
+            log = (percent >= self._logged_percent + self.LOG_PERCENT_STEP
+                   or now - self._log_time >= self.LOG_INTERVAL)
+            if emit:
+                self._percent = percent
+                self._status_time = now
+                snapshot = self._snapshot()
+            if log:
+                self._logged_percent = percent - percent % self.LOG_PERCENT_STEP
+                self._log_time = now
+        if emit and self._on_update:
+            self._on_update(snapshot)
+        if log:
+            logger.info(f"{self.label}: {self.describe()}")
+
+    @property
+    def eta(self) -> Optional[float]:
+        if self.total <= 0 or self.speed <= 0:
+            return None
+        return max(self.total - self.done, 0) / self.speed
+
+    def _snapshot(self) -> Dict:
+        return {
+            "progress": self._percent_of(self.done),
+            "downloaded": self.done,
+            "total_size": self.total,
+            "speed": int(self.speed),
+            "eta": int(self.eta) if self.eta is not None else None,
+        }
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return self._snapshot()
+
+    def describe(self) -> str:
+        eta = format_duration(self.eta)
+        return (f"{self._percent_of(self.done)}% ({format_size(self.done)}/{format_size(self.total)}) "
+                f"at {format_size(self.speed)}/s" + (f", {eta} left" if eta else ""))
+
+    def average_speed(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return (self.done - self._started_bytes) / elapsed if elapsed > 0 else 0.0
+
+
+def preallocate_file(fd: int, size: int):
+    """Reserve size bytes for an open file, falling back to a sparse file.
+
+    Running out of space (ENOSPC) is raised, so transfers fail before any
+    data moves.
+    """
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except AttributeError:
+        os.ftruncate(fd, size)
+    except OSError as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+            raise
+        # Filesystem does not support fallocate
+        os.ftruncate(fd, size)
+
+
+class InsufficientStorage(IOError):
+    """Not enough free space for a transfer (plus the configured margin)."""
+
+
+class SpaceReservations:
+    """Admission control for disk space across concurrent transfers.
+
+    Every download and upload reserves its full size before any data
+    moves. What a reservation still needs is its size minus what its file
+    already has allocated on disk, so preallocated (or partly written)
+    files are not counted twice against statvfs free space. A new
+    reservation is refused if it would leave less than min_free_space,
+    unless deleting retired editions frees enough.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reservations: Dict[str, Dict] = {}
+
+    @staticmethod
+    def _allocated(path: Path) -> int:
+        try:
+            return path.stat().st_blocks * 512
+        except OSError:
+            return 0
+
+    def _outstanding(self, reservation: Dict) -> int:
+        return max(0, reservation["size"] - self._allocated(reservation["path"]))
+
+    def reserve(self, key: str, path: Path, size: int, kind: str):
+        """Reserve size bytes for the file at path, or raise InsufficientStorage."""
+        with self._lock:
+            self._reservations.pop(key, None)
+            reservation = {"path": path, "size": size, "kind": kind}
+            needed = self._outstanding(reservation)
+            free = shutil.disk_usage(path.parent).free
+            pending = sum(self._outstanding(r) for r in self._reservations.values())
+            available = free - pending - min_free_space
+            if needed > available and retired_editions is not None:
+                # Old editions kept for the retention period give way to new files
+                if retired_editions.reclaim(needed - available):
+                    available = shutil.disk_usage(path.parent).free - pending - min_free_space
+            if needed > available:
+                raise InsufficientStorage(
+                    f"Not enough disk space for {path.name}: needs {format_size(needed)}, "
+                    f"{format_size(max(available, 0))} available "
+                    f"({format_size(pending)} reserved, {format_size(min_free_space)} kept free)"
+                )
+            self._reservations[key] = reservation
+            logger.debug(f"Reserved {format_size(needed)} for {kind} {path.name}")
+
+    def release(self, key: str):
+        with self._lock:
+            self._reservations.pop(key, None)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            reservations = [
+                {
+                    "id": key,
+                    "kind": reservation["kind"],
+                    "filename": reservation["path"].name,
+                    "size": reservation["size"],
+                    "outstanding": self._outstanding(reservation),
+                }
+                for key, reservation in self._reservations.items()
+            ]
+        usage = shutil.disk_usage(storage_path)
+        reserved = sum(r["outstanding"] for r in reservations)
+        return {
+            "path": str(storage_path),
+            "total": usage.total,
+            "used": usage.used,
+            "free": usage.free,
+            "reserved": reserved,
+            "min_free_space": min_free_space,
+            "available": max(0, usage.free - reserved - min_free_space),
+            "reservations": reservations,
+        }
+
+
+space_reservations = SpaceReservations()
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting a byte rate.
+
+    consume() may overdraw the bucket (a 1MB chunk against a 100KB/s limit);
+    the caller then sleeps until the debt is paid back, which keeps the
+    long-run rate exact regardless of chunk size. A rate of 0 is unlimited.
+    """
+
+    BURST_SECONDS = 1.0
+
+    def __init__(self, rate: int = 0):
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> int:
+        return self._rate
+
+    def set_rate(self, rate: int):
+        with self._lock:
+            if rate != self._rate:
+                self._rate = max(0, int(rate))
+                self._tokens = min(self._tokens, self._rate * self.BURST_SECONDS)
+                self._updated = time.monotonic()
+
+    def chunk_size(self, default: int) -> int:
+        """Read size that keeps throttled transfers smooth rather than bursty."""
+        if self._rate <= 0:
+            return default
+        return max(16 * 1024, min(default, self._rate // 10))
+
+    def consume(self, nbytes: int, stop: Optional[threading.Event] = None):
+        """Take nbytes from the bucket, sleeping while it is in debt."""
+        with self._lock:
+            if self._rate <= 0:
+                return
+            now = time.monotonic()
+            capacity = self._rate * self.BURST_SECONDS
+            self._tokens = min(capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            if stop is not None:
+                stop.wait(wait)
+            else:
+                time.sleep(wait)
+
+
+class BandwidthSchedule:
+    """Download rate limit that varies by time of day.
+
+    Windows are "HH:MM-HH:MM=KBPS" strings; a window may cross midnight
+    (e.g. "22:00-06:00=0" for unlimited at night). Outside every window
+    the default limit applies. Limits are in KB/s, 0 meaning unlimited.
+    """
+
+    def __init__(self, default_kbps: int = 0, windows: Optional[List[str]] = None):
+        self.default_kbps = default_kbps
+        self.windows = [self.parse_window(window) for window in windows or []]
+
+    @staticmethod
+    def parse_window(window: str) -> Dict:
+        try:
+            span, kbps = window.strip().split("=")
+            start, end = span.split("-")
+            start_minute, end_minute = (
+                int(hours) * 60 + int(minutes)
+                for hours, minutes in (part.strip().split(":") for part in (start, end))
+            )
+            if not (0 <= start_minute < 1440 and 0 <= end_minute <= 1440 and int(kbps) >= 0):
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid rate schedule window '{window}', expected HH:MM-HH:MM=KBPS")
+        return {"window": window.strip(), "start": start_minute, "end": end_minute, "kbps": int(kbps)}
+
+    def current_kbps(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for window in self.windows:
+            start, end = window["start"], window["end"]
+            if start <= end:
+                active = start <= minute < end
+            else:
+                active = minute >= start or minute < end
+            if active:
+                return window["kbps"]
+        return self.default_kbps
+
+    def to_dict(self) -> Dict:
+        return {
+            "rate_limit": self.default_kbps,
+            "schedule": [window["window"] for window in self.windows],
+            "current_rate_limit": self.current_kbps(),
         }
+
+
+bandwidth_schedule = BandwidthSchedule()
+download_limiter = TokenBucket()
+job_limiters: Dict[str, TokenBucket] = {}
+
+
+def throttle_download(job_id: str, nbytes: int, stop: Optional[threading.Event] = None):
+    """Charge nbytes against the global (scheduled) and per-job rate limits."""
+    download_limiter.set_rate(bandwidth_schedule.current_kbps() * 1024)
+    download_limiter.consume(nbytes, stop)
+    limiter = job_limiters.get(job_id)
+    if limiter is not None:
+        limiter.consume(nbytes, stop)
+
+
+def part_path(filepath: Path) -> Path:
+    """Path of the in-progress download for filepath."""
+    return filepath.with_name(filepath.name + ".part")
+
+
+def manifest_path(filepath: Path) -> Path:
+    """Path of the sidecar manifest describing an in-progress download."""
+    return filepath.with_name(filepath.name + ".part.json")
+
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    """Merge overlapping or adjacent half-open byte ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(completed: List[List[int]], total_size: int) -> List[List[int]]:
+    """Return the byte ranges of [0, total_size) not covered by completed."""
+    missing = []
+    position = 0
+    for start, end in merge_ranges(completed):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+class DownloadManifest:
+    """On-disk record of a partial download.
+
+    Stores the source URL, the validators (ETag/Last-Modified) the partial
+    data was fetched against and the byte ranges already written to the
+    .part file, so the download can resume after a restart.
+    """
+
+    SAVE_INTERVAL = 5  # Seconds between manifest flushes
+
+    def __init__(self, filepath: Path, data: Dict):
+        self.filepath = filepath
+        self.data = data
+        self.data.setdefault("completed", [])
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+
+    @classmethod
+    def load(cls, filepath: Path) -> Optional["DownloadManifest"]:
+        """Load the manifest for filepath, if one exists and is readable."""
+        try:
+            with open(manifest_path(filepath)) as f:
+                return cls(filepath, json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable download manifest for {filepath.name}: {e}")
+            return None
+
+    @property
+    def completed_bytes(self) -> int:
+        return sum(end - start for start, end in self.data["completed"])
+
+    @property
+    def contiguous_bytes(self) -> int:
+        """Length of the completed prefix starting at byte 0."""
+        completed = self.data["completed"]
+        return completed[0][1] if completed and completed[0][0] == 0 else 0
+
+    @property
+    def validator(self) -> Optional[str]:
+        """Value for If-Range: a strong ETag, else Last-Modified."""
+        etag = self.data.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return self.data.get("last_modified")
+
+    def reset(self):
+        with self._lock:
+            self.data["completed"] = []
+
+    def mark(self, start: int, end: int):
+        """Record that bytes [start, end) are written to the .part file."""
+        with self._lock:
+            self.data["completed"] = merge_ranges(self.data["completed"] + [[start, end]])
+
+    def save(self, fd: Optional[int] = None, force: bool = False):
+        """Atomically write the manifest, at most every SAVE_INTERVAL seconds.
+
+        When fd is given it is flushed first so the manifest never claims
+        bytes that are not on disk. Segment threads call this concurrently;
+        one writer at a time holds the save lock, and a periodic save that
+        finds it taken is skipped since that writer covers it.
+        """
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._last_save < self.SAVE_INTERVAL:
+                return
+            self._last_save = now
+            with self._lock:
+                payload = json.dumps(self.data)
+            if fd is not None:
+                os.fdatasync(fd)
+            path = manifest_path(self.filepath)
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, 'w') as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        finally:
+            self._save_lock.release()
+
+    def remove(self):
+        manifest_path(self.filepath).unlink(missing_ok=True)
+
+
+def probe_download(url: str, validator: Optional[str] = None) -> Dict:
+    """Probe a URL for its final location, size, validators and Range support.
+
+    Uses a one-byte ranged GET rather than HEAD so that redirects to mirrors
+    are followed the same way the actual transfer will follow them. With a
+    validator, the request carries If-Range and "unchanged" reports whether
+    the server still honoured the range (i.e. the remote file is the same).
+    """
+    headers = {"Range": "bytes=0-0", "User-Agent": USER_AGENT}
+    if validator:
+        headers["If-Range"] = validator
+    request = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+        info = {
+            "url": response.geturl(),
+            "total_size": 0,
+            "accept_ranges": False,
+            "unchanged": response.status == 206,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        content_range = response.headers.get("Content-Range", "")
+        if response.status == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                info["total_size"] = int(total)
+                info["accept_ranges"] = True
+        else:
+            info["total_size"] = int(response.headers.get("Content-Length") or 0)
+            info["accept_ranges"] = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return info
+
+
+def plan_segments(ranges: List[List[int]], connections: int) -> List[List[int]]:
+    """Split byte ranges into half-open segments for parallel fetching.
+
+    Segments are smaller than the remaining size / connections so that faster
+    connections pick up more work and the tail of the download stays busy.
+    """
+    remaining = sum(end - start for start, end in ranges)
+    segment_size = remaining // max(connections * 4, 1)
+    segment_size = max(MIN_SEGMENT_SIZE, min(segment_size, MAX_SEGMENT_SIZE))
+    return [
+        [start, min(start + segment_size, end)]
+        for range_start, end in ranges
+        for start in range(range_start, end, segment_size)
+    ]
+
+
+def fetch_segment(url: str, fd: int, start: int, end: int, on_bytes, abort: threading.Event,
+                  validator: Optional[str] = None):
+    """Fetch bytes [start, end) with a Range request and pwrite them into fd.
+
+    on_bytes(offset, length) is called after each write. With a validator the
+    request carries If-Range, so a changed remote file fails the segment
+    instead of splicing two versions together.
+    """
+    offset = start
+    attempt = 0
+    while offset < end:
+        if abort.is_set():
+            return
+        headers = {"Range": f"bytes={offset}-{end - 1}", "User-Agent": USER_AGENT}
+        if validator:
+            headers["If-Range"] = validator
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status != 206:
+                    raise RemoteFileChanged(f"Server ignored range request (HTTP {response.status})")
+                while offset < end:
+                    if abort.is_set():
+                        return
+                    chunk = response.read(min(download_limiter.chunk_size(DOWNLOAD_CHUNK_SIZE), end - offset))
+                    if not chunk:
+                        raise IOError(f"Connection closed at byte {offset}")
+                    chunk_offset = offset
+                    view = memoryview(chunk)
+                    while view:
+                        written = os.pwrite(fd, view, offset)
+                        view = view[written:]
+                        offset += written
+                    on_bytes(chunk_offset, len(chunk))
+        except RemoteFileChanged:
+            raise
+        except (OSError, urllib.error.URLError) as e:
+            attempt += 1
+            if attempt > DOWNLOAD_RETRIES:
+                raise
+            logger.warning(f"Segment {start}-{end} failed at byte {offset} ({e}), retrying ({attempt}/{DOWNLOAD_RETRIES})")
+            time.sleep(attempt)
+
+
+class RemoteFileChanged(IOError):
+    """The remote file no longer matches the partial data on disk."""
+
+
+class DownloadStopped(Exception):
+    """A running download was paused or cancelled through the scheduler."""
+
+
+def download_segmented(url: str, manifest: DownloadManifest, connections: int, on_bytes,
+                       checksum: Optional[ZimChecksum] = None):
+    """Fetch the missing ranges of a range-capable download into its .part file.
+
+    If checksum is given, the contiguous prefix is hashed as it grows, by
+    a PrefixHasher thread, and is complete when this returns normally.
+    """
+    total_size = manifest.data["total_size"]
+    segments = plan_segments(missing_ranges(manifest.data["completed"], total_size), connections)
+    pending = list(reversed(segments))
+    pending_lock = threading.Lock()
+    abort = threading.Event()
+    validator = manifest.validator
+
+    def record(offset: int, length: int):
+        manifest.mark(offset, offset + length)
+        manifest.save(fd)
+        if hasher is not None:
+            hasher.advance(manifest.contiguous_bytes)
+        on_bytes(length)
+
+    def worker():
+        while not abort.is_set():
+            with pending_lock:
+                if not pending:
+                    return
+                start, end = pending.pop()
+            try:
+                fetch_segment(url, fd, start, end, record, abort, validator)
+            except Exception:
+                abort.set()
+                raise
+
+    fd = os.open(part_path(manifest.filepath), os.O_RDWR | os.O_CREAT, 0o644)
+    hasher = None
+    try:
+        if os.fstat(fd).st_size != total_size:
+            preallocate_file(fd, total_size)
+        if checksum is not None:
+            # Data from before a resume or delta seed is hashed while the rest downloads
+            hasher = PrefixHasher(checksum, fd)
+            hasher.advance(manifest.contiguous_bytes)
+        workers = min(connections, len(segments))
+        try:
+            with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="segment") as pool:
+                futures = [pool.submit(worker) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        finally:
+            manifest.save(fd, force=True)
+        if hasher is not None:
+            hasher.advance(manifest.contiguous_bytes)
+            hasher.finish()
+    finally:
+        if hasher is not None:
+            hasher.stop()
+        os.close(fd)
+
+
+def download_single_stream(url: str, filepath: Path, on_bytes, checksum: Optional[ZimChecksum] = None,
+                           total_size: int = 0):
+    """Download a URL over one connection (server without range support)."""
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+        with open(part_path(filepath), 'wb') as f:
+            if total_size:
+                preallocate_file(f.fileno(), total_size)
+            while chunk := response.read(download_limiter.chunk_size(DOWNLOAD_CHUNK_SIZE)):
+                f.write(chunk)
+                if checksum is not None:
+                    checksum.update(chunk)
+                on_bytes(len(chunk))
+            # Drop any preallocated tail if the server sent less than announced
+            f.truncate(f.tell())
+
+
+def iter_blocks(fd: int, size: int, stop: Optional[threading.Event] = None):
+    """Split a file into content-defined blocks, yielding (offset, length, digest).
+
+    Cut points depend on the bytes around them rather than on offsets,
+    so data that moved between two editions still splits into the same
+    blocks. Finding them is a substring search and hashing is BLAKE2b,
+    both in C.
+    """
+    buf = bytearray()
+    start = 0  # File offset of buf[0]
+    position = 0  # Start of the current block in buf
+    read_to = 0
+    while start + position < size:
+        if len(buf) - position < BLOCK_MAX and read_to < size:
+            if stop is not None and stop.is_set():
+                raise DownloadStopped()
+            del buf[:position]
+            start += position
+            position = 0
+            chunk = os.pread(fd, BLOCK_READ_SIZE, read_to)
+            if not chunk:
+                raise IOError(f"File ended at byte {read_to} instead of {size}")
+            buf += chunk
+            read_to += len(chunk)
+            continue
+        end = min(position + BLOCK_MAX, len(buf))
+        cut = buf.find(BLOCK_ANCHOR, position + BLOCK_MIN - len(BLOCK_ANCHOR), end)
+        length = (cut + len(BLOCK_ANCHOR) if cut != -1 else end) - position
+        with memoryview(buf) as view:
+            digest = hashlib.blake2b(view[position:position + length], digest_size=16).digest()
+        yield start + position, length, digest
+        position += length
+
+
+def copy_range(src_fd: int, src_offset: int, dst_fd: int, dst_offset: int, length: int):
+    """Copy bytes between two files, inside the kernel where it supports that."""
+    while length > 0:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, length, src_offset, dst_offset)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            copied = os.pwrite(dst_fd, os.pread(src_fd, min(length, BLOCK_READ_SIZE), src_offset), dst_offset)
+        if copied == 0:
+            raise IOError(f"Source file ended at byte {src_offset}")
+        src_offset += copied
+        dst_offset += copied
+        length -= copied
+
+
+class BlockMap:
+    """Block checksums of a file: the manifest of a delta download.
+
+    Like a zsync control file, it lets a client holding an older edition
+    copy the blocks it already has and fetch only the rest with Range
+    requests. Blocks are content-defined (see iter_blocks) rather than
+    fixed-size, so the client needs no per-byte rolling checksum to find
+    blocks that moved. Serialized as MAGIC, a JSON header line and one
+    (length, BLAKE2b-128 digest) record per block. The header carries the
+    file's last 16 bytes (a ZIM file's MD5), which tells whether the map
+    still describes the file a server currently has.
+    """
+
+    MAGIC = b"KIWIX-BLOCKMAP 1\n"
+    RECORD = struct.Struct("<I16s")
+
+    def __init__(self, header: Dict, blocks: List[Tuple[int, bytes]]):
+        self.header = header
+        self.blocks = blocks
+
+    @property
+    def size(self) -> int:
+        return self.header["size"]
+
+    @classmethod
+    def build(cls, filepath: Path) -> "BlockMap":
+        with open(filepath, 'rb') as f:
+            st = os.fstat(f.fileno())
+            blocks = [(length, digest) for _, length, digest in iter_blocks(f.fileno(), st.st_size)]
+            tail = os.pread(f.fileno(), 16, max(0, st.st_size - 16))
+        return cls(cls.parameters() | {
+            "filename": filepath.name,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "tail": tail.hex(),
+            "blocks": len(blocks),
+        }, blocks)
+
+    @staticmethod
+    def parameters() -> Dict:
+        """How blocks are cut and hashed; a map made with others cannot be matched."""
+        return {"hash": "blake2b-128", "anchor": BLOCK_ANCHOR.hex(), "min": BLOCK_MIN, "max": BLOCK_MAX}
+
+    @classmethod
+    def parse(cls, data: bytes) -> "BlockMap":
+        if not data.startswith(cls.MAGIC):
+            raise ValueError("Not a block map")
+        header_end = data.index(b"\n", len(cls.MAGIC)) + 1
+        header = json.loads(data[len(cls.MAGIC):header_end])
+        records = memoryview(data)[header_end:]
+        if len(records) != header["blocks"] * cls.RECORD.size:
+            raise ValueError("Block map is truncated")
+        blocks = list(cls.RECORD.iter_unpack(records))
+        if sum(length for length, _ in blocks) != header["size"]:
+            raise ValueError("Block map does not add up to the file size")
+        return cls(header, blocks)
+
+    def compatible(self) -> bool:
+        return all(self.header.get(key) == value for key, value in self.parameters().items())
+
+    def to_bytes(self) -> bytes:
+        return b"".join([self.MAGIC, json.dumps(self.header).encode(), b"\n"]
+                        + [self.RECORD.pack(length, digest) for length, digest in self.blocks])
+
+
+blockmap_lock = threading.Lock()
+
+
+def blockmap_for(filepath: Path) -> bytes:
+    """The serialized block map of a local file, built once and cached until the file changes."""
+    cache = storage_path / ".kiwix-manager" / "blockmaps" / (filepath.name + ".blockmap")
+    with blockmap_lock:
+        st = filepath.stat()
+        try:
+            data = cache.read_bytes()
+            cached = BlockMap.parse(data)
+            if cached.compatible() and (cached.size, cached.header["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                return data
+        except (OSError, ValueError, KeyError):
+            pass
+        started = time.monotonic()
+        data = BlockMap.build(filepath).to_bytes()
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_name(cache.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, cache)
+        # Maps of files that are gone are not needed any more
+        for other in cache.parent.glob("*.blockmap"):
+            if not (storage_path / other.name[:-len(".blockmap")]).exists():
+                other.unlink(missing_ok=True)
+        logger.info(f"Built block map of {filepath.name} ({format_size(len(data))}) "
+                    f"in {time.monotonic() - started:.1f}s")
+        return data
+
+
+def fetch_blockmap(url: str) -> Optional[BlockMap]:
+    """Download and parse a block map. None if the server has none (or a different kind)."""
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=BLOCKMAP_TIMEOUT) as response:
+            blockmap = BlockMap.parse(response.read())
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            logger.warning(f"Could not fetch block map {url}: HTTP {e.code}")
+        return None
+    except (OSError, ValueError, KeyError, urllib.error.URLError) as e:
+        logger.warning(f"Could not use block map {url}: {e}")
+        return None
+    if not blockmap.compatible():
+        logger.warning(f"Block map {url} was made with different block parameters, ignoring it")
+        return None
+    return blockmap
+
+
+def fetch_tail(url: str, size: int, validator: Optional[str] = None) -> Optional[bytes]:
+    """The last 16 bytes of a remote file (None if the server would not send just those)."""
+    headers = {"Range": f"bytes={max(0, size - 16)}-{size - 1}", "User-Agent": USER_AGENT}
+    if validator:
+        headers["If-Range"] = validator
+    request = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+        return response.read() if response.status == 206 else None
+
+
+def previous_edition(filename: str) -> Optional[Path]:
+    """The newest installed edition of the same book that is older than filename."""
+    name, date = split_edition(filename)
+    if date is None:
+        return None
+    editions = []
+    for filepath in storage_path.glob("*.zim"):
+        other_name, other_date = split_edition(filepath.name)
+        if other_name == name and other_date is not None and other_date < date:
+            editions.append((other_date, filepath))
+    return max(editions)[1] if editions else None
+
+
+def seed_from_edition(manifest: DownloadManifest, seed: Path, blockmap: BlockMap, on_reused,
+                      stop: Optional[threading.Event] = None) -> int:
+    """Copy the blocks of a download that an installed edition already has into its .part file.
+
+    The seed is split into blocks the same way as the remote file; every
+    block whose digest is in the block map is copied to wherever the new
+    file has it and marked complete in the manifest, so download_segmented
+    only fetches what is left. Returns the number of bytes reused.
+    """
+    # One target per digest, plus a list for the rare blocks the file repeats
+    targets: Dict[bytes, int] = {}
+    repeats: Dict[bytes, List[int]] = {}
+    offset = 0
+    for length, digest in blockmap.blocks:
+        if digest in targets:
+            repeats.setdefault(digest, []).append(offset)
+        else:
+            targets[digest] = offset
+        offset += length
+
+    total_size = manifest.data["total_size"]
+    reused = 0
+    fd = os.open(part_path(manifest.filepath), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != total_size:
+            preallocate_file(fd, total_size)
+        with open(seed, 'rb') as f:
+            for seed_offset, length, digest in iter_blocks(f.fileno(), os.fstat(f.fileno()).st_size, stop):
+                target = targets.pop(digest, None)
+                if target is None:
+                    continue
+                for target in [target] + repeats.pop(digest, []):
+                    copy_range(f.fileno(), seed_offset, fd, target, length)
+                    manifest.mark(target, target + length)
+                    reused += length
+                manifest.save(fd)
+                on_reused(reused)
+    finally:
+        manifest.save(fd, force=True)
+        os.close(fd)
+    return reused
+
+
+def delta_seed(job_id: str, url: str, probe: Dict, manifest: DownloadManifest,
+               stop: Optional[threading.Event] = None):
+    """Reuse what an installed edition shares with a download, if the server has a block map of it.
+
+    The seed is the edition the download replaces, else the newest older
+    edition of the same book. The block map is looked up at "blockmap_url",
+    else next to the file (<url>.blockmap). Anything that goes wrong just
+    means the rest of the file is downloaded normally.
+    """
+    job = download_jobs[job_id]
+    seed = storage_path / job["replaces"] if job.get("replaces") else previous_edition(job["filename"])
+    if seed is None or not seed.exists():
+        return
+    blockmap_url = job.get("blockmap_url") or url + ".blockmap"
+    try:
+        blockmap = fetch_blockmap(blockmap_url)
+        if blockmap is None:
+            return
+        total_size = manifest.data["total_size"]
+        tail = fetch_tail(probe["url"], total_size, manifest.validator)
+        if blockmap.size != total_size or tail is None or tail.hex() != blockmap.header.get("tail"):
+            logger.warning(f"Block map {blockmap_url} does not describe the current remote file, "
+                           f"downloading {job['filename']} in full")
+            return
+        logger.info(f"Delta download of {job['filename']}: copying matching blocks from {seed.name}")
+        job["delta_seed"] = seed.name
         
-        // Try immediately
-        initPaths();
+        def on_reused(nbytes: int):
+            job["bytes_saved"] = nbytes
+            events.publish_progress(job_id)
         
-        // Also try after a short delay (for postMessage)
-        setTimeout(initPaths, 100);
-        setTimeout(initPaths, 500);
+        started = time.monotonic()
+        reused = seed_from_edition(manifest, seed, blockmap, on_reused, stop)
+    except DownloadStopped:
+        raise
+    except Exception as e:
+        logger.warning(f"Delta download of {job['filename']} from {seed.name} failed ({e}), "
+                       f"downloading the rest in full")
+        return
+    job["bytes_saved"] = reused
+    manifest.data.update(seeded=True, bytes_saved=reused, delta_seed=seed.name)
+    manifest.save(force=True)
+    delta_saved_bytes.inc(reused)
+    logger.info(f"Reused {format_size(reused)} of {format_size(total_size)} from {seed.name} "
+                f"in {time.monotonic() - started:.1f}s, "
+                f"{format_size(total_size - manifest.completed_bytes)} left to fetch")
+
+
+def download_file_with_progress(url: str, filepath: Path, job_id: str, stop: Optional[threading.Event] = None):
+    """Download file with progress tracking.
+
+    Data is written to <name>.part and renamed into place once complete.
+    Range-capable servers are fetched in segments over download_connections
+    parallel connections, with completed ranges recorded in a sidecar
+    manifest so an interrupted download resumes where it stopped.
+    Anything else falls back to a single, non-resumable stream. Before a
+    range-capable download starts, blocks it shares with an installed
+    edition of the same book are copied from that file (see delta_seed).
+    Setting stop interrupts the transfer; the scheduler decides what
+    happens to the partial data.
+    """
+    stop = stop or threading.Event()
+    if download_jobs[job_id].get("rate_limit"):
+        job_limiters[job_id] = TokenBucket(download_jobs[job_id]["rate_limit"] * 1024)
+    try:
+        logger.info(f"Starting download: {url} -> {filepath}")
+        download_jobs[job_id]["progress"] = 0
         
-        let downloadJobId = null;
-        let downloadInterval = null;
+        manifest = DownloadManifest.load(filepath)
+        if manifest and manifest.data.get("url") != url:
+            raise ValueError(f"A different download for {filepath.name} is already in progress")
+        if manifest and not part_path(filepath).exists():
+            manifest.reset()
         
-        function showStatus(message, type) {
-            const status = document.getElementById('status');
-            status.textContent = message;
-            status.className = `status ${type} active`;
-            setTimeout(() => {
-                status.classList.remove('active');
-            }, 5000);
-        }
+        probe = probe_download(url, manifest.validator if manifest else None)
+        total_size = probe["total_size"]
+        if manifest and (not probe["unchanged"] or manifest.data.get("total_size") != total_size):
+            logger.warning(f"Remote file for {filepath.name} changed since the download started, restarting")
+            manifest.reset()
+        if manifest is None or not manifest.data["completed"]:
+            manifest = DownloadManifest(filepath, {
+                "job_id": job_id,
+                "url": url,
+                "filename": filepath.name,
+                "total_size": total_size,
+                "etag": probe["etag"],
+                "last_modified": probe["last_modified"],
+                "started_at": download_jobs[job_id].get("started_at", datetime.now().isoformat()),
+            })
+        manifest.data["job_id"] = job_id
+        manifest.data["priority"] = download_jobs[job_id].get("priority", 0)
+        manifest.data["rate_limit"] = download_jobs[job_id].get("rate_limit", 0)
+        manifest.data["replaces"] = download_jobs[job_id].get("replaces")
+        manifest.data["paused"] = False
         
-        async function loadFiles() {
-            try {
-                // Ensure apiBase is up to date
-                initPaths();
-                const response = await fetch(apiBase + '/zim');
-                const files = await response.json();
-                const fileList = document.getElementById('fileList');
-                
-                if (files.length === 0) {
-                    fileList.innerHTML = '<p style="color: #7f8c8d;">No ZIM files found. Upload or download files to get started.</p>';
-                    return;
-                }
-                
-                fileList.innerHTML = files.map(file => `
-                    <div class="file-item">
-                        <div class="file-info">
-                            <div class="file-name">${file.name}</div>
-                            <div class="file-meta">
-                                Size: ${file.size_formatted} | 
-                                Modified: ${new Date(file.modified).toLocaleString()}
-                            </div>
-                        </div>
-                        <div class="file-actions">
-                            <button class="delete" onclick="deleteFile('${file.name}')">Delete</button>
-                        </div>
-                    </div>
-                `).join('');
-            } catch (error) {
-                console.error('Error loading files:', error);
-                showStatus('Error loading files: ' + error.message, 'error');
-            }
-        }
+        if total_size:
+            # Fails before any data moves if the disk cannot take the whole file
+            space_reservations.reserve(job_id, part_path(filepath), total_size, "download")
         
-        async function deleteFile(filename) {
-            if (!confirm(`Are you sure you want to delete "${filename}"?`)) {
-                return;
-            }
-            
-            try {
-                const response = await fetch(`${apiBase}/zim/${encodeURIComponent(filename)}`, {
-                    method: 'DELETE'
-                });
-                
-                if (response.ok) {
-                    showStatus(`File "${filename}" deleted successfully.`, 'success');
-                    loadFiles();
-                } else {
-                    const error = await response.json();
-                    showStatus('Error deleting file: ' + error.detail, 'error');
-                }
-            } catch (error) {
-                showStatus('Error deleting file: ' + error.message, 'error');
-            }
-        }
+        if manifest.data.get("seeded"):
+            download_jobs[job_id]["bytes_saved"] = manifest.data.get("bytes_saved", 0)
+            download_jobs[job_id]["delta_seed"] = manifest.data.get("delta_seed")
+        elif probe["accept_ranges"] and total_size > 0 and download_jobs[job_id].get("delta", True):
+            delta_seed(job_id, url, probe, manifest, stop)
         
-        document.getElementById('downloadForm').addEventListener('submit', async (e) => {
-            e.preventDefault();
-            const url = document.getElementById('downloadUrl').value;
-            const progressContainer = document.getElementById('downloadProgress');
-            const progressFill = document.getElementById('downloadProgressFill');
-            
-            progressContainer.classList.add('active');
-            progressFill.style.width = '0%';
-            progressFill.textContent = 'Starting...';
-            
-            try {
-                const response = await fetch(apiBase + '/zim/download', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ url: url })
-                });
-                
-                const result = await response.json();
-                if (response.ok) {
-                    downloadJobId = result.job_id;
-                    showStatus('Download started. Progress will be shown below.', 'success');
-                    
-                    // Poll for progress
-                    downloadInterval = setInterval(async () => {
-                        try {
-                            const statusResponse = await fetch(`${apiBase}/download/${downloadJobId}/status`);
-                            const status = await statusResponse.json();
-                            
-                            progressFill.style.width = status.progress + '%';
-                            progressFill.textContent = status.progress + '%';
-                            
-                            if (status.status === 'completed') {
-                                clearInterval(downloadInterval);
-                                showStatus('Download completed successfully!', 'success');
-                                progressContainer.classList.remove('active');
-                                document.getElementById('downloadUrl').value = '';
-                                loadFiles();
-                            } else if (status.status === 'failed') {
-                                clearInterval(downloadInterval);
-                                showStatus('Download failed: ' + status.error, 'error');
-                                progressContainer.classList.remove('active');
-                            }
-                        } catch (error) {
-                            console.error('Error checking download status:', error);
-                        }
-                    }, 1000);
-                } else {
-                    showStatus('Error starting download: ' + result.detail, 'error');
-                    progressContainer.classList.remove('active');
-                }
-            } catch (error) {
-                showStatus('Error: ' + error.message, 'error');
-                progressContainer.classList.remove('active');
-            }
-        });
+        resumed_from = manifest.completed_bytes
+        download_jobs[job_id]["total_size"] = total_size
+        download_jobs[job_id]["downloaded"] = resumed_from
+        download_jobs[job_id]["resumed_from"] = resumed_from
+        if resumed_from:
+            logger.info(f"Resuming {filepath.name} at {format_size(resumed_from)}/{format_size(total_size)}")
         
-        document.getElementById('uploadForm').addEventListener('submit', async (e) => {
-            e.preventDefault();
-            const fileInput = document.getElementById('uploadFile');
-            const file = fileInput.files[0];
-            
-            if (!file) {
-                showStatus('Please select a file to upload.', 'error');
-                return;
-            }
-            
-            const formData = new FormData();
-            formData.append('file', file);
-            
-            const progressContainer = document.getElementById('uploadProgress');
-            const progressFill = document.getElementById('uploadProgressFill');
-            progressContainer.classList.add('active');
-            progressFill.style.width = '0%';
-            progressFill.textContent = 'Uploading...';
-            
-            try {
-                const xhr = new XMLHttpRequest();
-                
-                xhr.upload.addEventListener('progress', (e) => {
-                    if (e.lengthComputable) {
-                        const percentComplete = (e.loaded / e.total) * 100;
-                        progressFill.style.width = percentComplete + '%';
-                        progressFill.textContent = Math.round(percentComplete) + '%';
-                    }
-                });
-                
-                xhr.addEventListener('load', () => {
-                    if (xhr.status === 200) {
-                        showStatus('File uploaded successfully!', 'success');
-                        progressContainer.classList.remove('active');
-                        fileInput.value = '';
-                        loadFiles();
-                    } else {
-                        const error = JSON.parse(xhr.responseText);
-                        showStatus('Upload failed: ' + error.detail, 'error');
-                        progressContainer.classList.remove('active');
-                    }
-                });
-                
-                xhr.addEventListener('error', () => {
-                    showStatus('Upload error occurred.', 'error');
-                    progressContainer.classList.remove('active');
-                });
-                
-                xhr.open('POST', apiBase + '/zim/upload');
-                xhr.send(formData);
-            } catch (error) {
-                showStatus('Error: ' + error.message, 'error');
-                progressContainer.classList.remove('active');
-            }
-        });
+        def update_status(snapshot: Dict):
+            download_jobs[job_id].update(snapshot)
+            events.publish_progress(job_id)
+        
+        tracker = ProgressTracker(f"Download {filepath.name}", total_size, resumed_from, update_status)
+        update_status(tracker.snapshot())
         
-        // Load files on page load
-        loadFiles();
+        def report_progress(nbytes: int):
+            if stop.is_set():
+                raise DownloadStopped()
+            throttle_download(job_id, nbytes, stop)
+            tracker.add(nbytes)
+            downloaded_bytes.inc(nbytes)
+        
+        checksum = ZimChecksum()
+        if probe["accept_ranges"] and total_size > 0:
+            manifest.save(force=True)
+            download_jobs[job_id]["connections"] = min(
+                download_connections,
+                len(plan_segments(missing_ranges(manifest.data["completed"], total_size), download_connections)),
+            )
+            logger.info(f"Server supports ranges, using {download_jobs[job_id]['connections']} connection(s)")
+            download_segmented(probe["url"], manifest, download_connections, report_progress, checksum)
+            if missing_ranges(manifest.data["completed"], total_size):
+                raise IOError("Download incomplete")
+        else:
+            download_jobs[job_id]["connections"] = 1
+            download_single_stream(probe["url"], filepath, report_progress, checksum, total_size)
         
-        // Refresh file list every 30 seconds
-        setInterval(loadFiles, 30000);
-    </script>
-</body>
-</html>
+        if stop.is_set():
+            raise DownloadStopped()
+        verified = checksum.result()
+        if verified is False:
+            raise ZimChecksumMismatch(f"{filepath.name} failed its ZIM checksum, the download is corrupt")
+        download_jobs[job_id]["verified"] = verified
+        if verified is None:
+            logger.warning(f"{filepath.name} has no ZIM checksum, adding it unverified")
+        os.replace(part_path(filepath), filepath)
+        space_reservations.release(job_id)
+        manifest.remove()
+        
+        # Verify file was downloaded
+        if filepath.exists() and filepath.stat().st_size > 0:
+            download_jobs[job_id].update(tracker.snapshot())
+            download_jobs[job_id]["status"] = "completed"
+            download_jobs[job_id]["progress"] = 100
+            transfers_finished.inc(1, "download", "completed")
+            download_jobs[job_id]["eta"] = None
+            download_jobs[job_id]["file_size"] = filepath.stat().st_size
+            saved = download_jobs[job_id].get("bytes_saved", 0)
+            logger.info(f"Download completed: {filepath.name} ({format_size(filepath.stat().st_size)}, "
+                        f"average {format_size(tracker.average_speed())}/s"
+                        + (f", {format_size(saved)} reused from {download_jobs[job_id]['delta_seed']}" if saved else "")
+                        + ")")
+            
+            # Add to library.xml, in place of the edition it updates if any
+            replaces = download_jobs[job_id].get("replaces")
+            if replaces:
+                if not replace_edition(filepath, storage_path / replaces):
+                    logger.warning(f"ZIM file {filepath.name} downloaded but could not replace {replaces}")
+            elif library.add(filepath):
+                logger.info(f"ZIM file {filepath.name} added to library successfully")
+            else:
+                logger.warning(f"ZIM file {filepath.name} downloaded but failed to add to library")
+            notify_library_changed()
+        else:
+            download_jobs[job_id]["status"] = "failed"
+            download_jobs[job_id]["error"] = "Downloaded file is empty or doesn't exist"
+            transfers_finished.inc(1, "download", "failed")
+            logger.error("Download failed: file is empty")
+            
+    except Exception as e:
+        if stop.is_set():
+            # Paused or cancelled: the scheduler has already set the status
+            logger.info(f"Download {job_id} stopped ({download_jobs[job_id]['status']})")
+            if download_jobs[job_id]["status"] == "cancelled":
+                transfers_finished.inc(1, "download", "cancelled")
+                discard_partial_download(filepath)
+            elif (manifest := DownloadManifest.load(filepath)) is not None:
+                manifest.data["paused"] = True
+                manifest.save(force=True)
+            else:
+                part_path(filepath).unlink(missing_ok=True)
+            return
+        download_jobs[job_id]["status"] = "failed"
+        download_jobs[job_id]["error"] = str(e)
+        transfers_finished.inc(1, "download", "failed")
+        logger.error(f"Download error: {e}")
+        if isinstance(e, (RemoteFileChanged, ZimChecksumMismatch)):
+            manifest_path(filepath).unlink(missing_ok=True)
+        # Keep resumable partial data; anything else cannot be continued
+        if not manifest_path(filepath).exists():
+            part_path(filepath).unlink(missing_ok=True)
+    finally:
+        job_limiters.pop(job_id, None)
+        space_reservations.release(job_id)
+
+
+def set_job_rate_limit(job_id: str, kbps: int):
+    """Change a job's own rate limit (KB/s, 0 = unlimited), live if it is running."""
+    download_jobs[job_id]["rate_limit"] = kbps
+    record_job(job_id)
+    limiter = job_limiters.get(job_id)
+    if limiter is not None:
+        limiter.set_rate(kbps * 1024)
+    elif kbps and download_jobs[job_id]["status"] == "downloading":
+        job_limiters[job_id] = TokenBucket(kbps * 1024)
+
+
+class JobStore:
+    """SQLite-backed history of download jobs.
+
+    Every state change of a job is written here, so job history survives
+    restarts and the in-memory download_jobs only needs to hold active
+    jobs and the most recent finished ones. Finished jobs are kept for
+    retention_days, and at most MAX_FINISHED of them.
+    """
+
+    ACTIVE_STATES = ("pending", "queued", "downloading", "paused")
+    FINISHED_STATES = ("completed", "failed", "cancelled")
+    MAX_FINISHED = 1000
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+        CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+    """
+
+    def __init__(self, path: Path, retention_days: int = 30):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    def save(self, job: Dict):
+        """Insert or update a job (a copy of its download_jobs entry)."""
+        now = time.time()
+        finished_at = now if job["status"] in self.FINISHED_STATES else None
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO jobs (job_id, filename, status, created_at, updated_at, finished_at, data)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (job_id) DO UPDATE SET
+                       status = excluded.status,
+                       updated_at = excluded.updated_at,
+                       finished_at = CASE WHEN excluded.finished_at IS NULL THEN NULL
+                                          ELSE COALESCE(jobs.finished_at, excluded.finished_at) END,
+                       data = excluded.data""",
+                (job["job_id"], job["filename"], job["status"], now, now, finished_at, json.dumps(job)),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, statuses: Optional[List[str]] = None, since: Optional[float] = None,
+              limit: int = 100) -> List[Dict]:
+        """Jobs in the given states updated since a Unix time, most recent first."""
+        sql = "SELECT data FROM jobs"
+        conditions, params = [], []
+        if statuses:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if since is not None:
+            conditions.append("updated_at >= ?")
+            params.append(since)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune(self) -> int:
+        """Drop finished jobs past the retention period or beyond MAX_FINISHED."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            removed = self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,)).rowcount
+            removed += self._db.execute(
+                """DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN (
+                       SELECT job_id FROM jobs WHERE finished_at IS NOT NULL
+                       ORDER BY finished_at DESC LIMIT ?)""",
+                (self.MAX_FINISHED,),
+            ).rowcount
+        return removed
+
+
+job_store: Optional[JobStore] = None
+
+# Finished jobs kept in download_jobs (and so in GET /api/download); older
+# ones are only in the job store
+MAX_FINISHED_JOBS_IN_MEMORY = 50
+
+
+def new_job_id() -> str:
+    return f"download_{uuid.uuid4().hex[:16]}"
+
+
+def record_job(job_id: str):
+    """Persist a job after a state change and evict old finished jobs from memory."""
+    job = download_jobs.get(job_id)
+    if job is None or job_store is None:
+        return
+    job_store.save(dict(job))
+    if job["status"] in JobStore.FINISHED_STATES:
+        finished = [other_id for other_id, other in list(download_jobs.items())
+                    if other["status"] in JobStore.FINISHED_STATES and other_id != job_id]
+        for old_job_id in finished[:max(0, len(finished) + 1 - MAX_FINISHED_JOBS_IN_MEMORY)]:
+            if scheduler.forget(old_job_id):
+                download_jobs.pop(old_job_id, None)
+        job_store.prune()
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """A job from memory, or from the job store once it has been evicted."""
+    job = download_jobs.get(job_id)
+    if job is None and job_store is not None:
+        job = job_store.get(job_id)
+    return job
+
+
+def discard_partial_download(filepath: Path):
+    """Delete the .part file and manifest of a download."""
+    part_path(filepath).unlink(missing_ok=True)
+    manifest_path(filepath).unlink(missing_ok=True)
+
+
+class CatalogMirror:
+    """Local copy of a Kiwix OPDS catalog, searchable offline.
+
+    The feed (an OPDS v2 Atom document, e.g. library.kiwix.org's
+    /catalog/v2/entries) is fetched with If-None-Match/If-Modified-Since,
+    so an unchanged catalog costs one 304; a local file is only re-read
+    when its mtime changes. Entries are streamed with iterparse and
+    upserted into SQLite only when their <updated> changed, entries gone
+    from the feed are deleted, and an FTS5 index over title, summary,
+    name and tags is kept in sync by triggers. Searches never touch the
+    network.
+    """
+
+    ATOM = "{http://www.w3.org/2005/Atom}"
+    ACQUISITION = "http://opds-spec.org/acquisition/open-access"
+    THUMBNAIL = "http://opds-spec.org/image/thumbnail"
+    FETCH_TIMEOUT = 60
+    RETRY_SECONDS = 3600
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            rowid INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            language TEXT NOT NULL,
+            category TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            flavour TEXT NOT NULL,
+            author TEXT NOT NULL,
+            publisher TEXT NOT NULL,
+            updated TEXT NOT NULL,
+            size INTEGER,
+            article_count INTEGER,
+            media_count INTEGER,
+            url TEXT NOT NULL,
+            illustration_url TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_category ON entries (category);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            title, summary, name, tags, content='entries', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2');
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, title, summary, name, tags)
+            VALUES (new.rowid, new.title, new.summary, new.name, new.tags);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, summary, name, tags)
+            VALUES ('delete', old.rowid, old.title, old.summary, old.name, old.tags);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, summary, name, tags)
+            VALUES ('delete', old.rowid, old.title, old.summary, old.name, old.tags);
+            INSERT INTO entries_fts (rowid, title, summary, name, tags)
+            VALUES (new.rowid, new.title, new.summary, new.name, new.tags);
+        END;
     """
-    return HTMLResponse(content=html_content)
+    COLUMNS = ("id", "name", "title", "summary", "language", "category", "tags", "flavour", "author",
+               "publisher", "updated", "size", "article_count", "media_count", "url", "illustration_url")
+
+    def __init__(self, path: Path, source: str, refresh_hours: float = 24):
+        self.path = path
+        self.source = source
+        self.refresh_hours = refresh_hours
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._force = False
+        self.refreshing = False
+        self.last_error: Optional[str] = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, None if value is None else str(value)) for key, value in values.items()])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def start(self):
+        threading.Thread(target=self._run, name="catalog-refresh", daemon=True).start()
+
+    def refresh_soon(self, force: bool = False):
+        """Refresh in the background now instead of waiting for the schedule."""
+        self._force = self._force or force
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                checked_at = float(self._meta("checked_at") or 0)
+            due = self.refresh_hours > 0 and time.time() - checked_at >= self.refresh_hours * 3600
+            if due or self._wakeup.is_set():
+                self._wakeup.clear()
+                force, self._force = self._force, False
+                try:
+                    self.refresh(force)
+                except Exception:
+                    pass  # Logged and reported in status(); the old copy stays searchable
+            if self.refresh_hours <= 0:
+                wait = None
+            elif self.last_error is not None:
+                wait = self.RETRY_SECONDS
+            else:
+                wait = self.refresh_hours * 3600
+            self._wakeup.wait(wait)
+
+    def _open(self, force: bool):
+        """The feed as a binary stream, or None if it has not changed."""
+        with self._lock:
+            etag, last_modified = self._meta("etag"), self._meta("last_modified")
+        if urlparse(self.source).scheme not in ("http", "https"):
+            path = Path(self.source[len("file://"):] if self.source.startswith("file://") else self.source)
+            mtime = str(path.stat().st_mtime_ns)
+            if not force and mtime == last_modified:
+                return None, None, mtime
+            return open(path, 'rb'), None, mtime
+        headers = {"User-Agent": USER_AGENT}
+        if not force:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        request = urllib.request.Request(self.source, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.FETCH_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, etag, last_modified
+            raise
+        return response, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+    def _parse_entry(self, entry: ET.Element) -> Optional[Dict]:
+        atom = self.ATOM
+        row = {
+            "id": (entry.findtext(f"{atom}id") or "").strip(),
+            "name": entry.findtext(f"{atom}name") or "",
+            "title": entry.findtext(f"{atom}title") or "",
+            "summary": entry.findtext(f"{atom}summary") or "",
+            "language": entry.findtext(f"{atom}language") or "",
+            "category": entry.findtext(f"{atom}category") or "",
+            "tags": entry.findtext(f"{atom}tags") or "",
+            "flavour": entry.findtext(f"{atom}flavour") or "",
+            "author": entry.findtext(f"{atom}author/{atom}name") or "",
+            "publisher": entry.findtext(f"{atom}publisher/{atom}name") or "",
+            "updated": entry.findtext(f"{atom}updated") or "",
+            "size": None,
+            "article_count": None,
+            "media_count": None,
+            "url": "",
+            "illustration_url": None,
+        }
+        for field, tag in (("article_count", "articleCount"), ("media_count", "mediaCount")):
+            value = entry.findtext(f"{atom}{tag}")
+            row[field] = int(value) if value and value.isdigit() else None
+        for link in entry.iter(f"{atom}link"):
+            rel, href = link.get("rel"), link.get("href", "")
+            if rel == self.ACQUISITION:
+                # Drop the metalink suffix: the plain URL redirects to a mirror
+                row["url"] = urljoin(self.source, href.removesuffix(".meta4"))
+                length = link.get("length")
+                row["size"] = int(length) if length and length.isdigit() else None
+            elif rel == self.THUMBNAIL:
+                row["illustration_url"] = urljoin(self.source, href)
+        if not row["id"] or not row["url"]:
+            return None
+        return row
+
+    def refresh(self, force: bool = False) -> Dict:
+        """Fetch the feed and apply the changes. Returns counts of what changed."""
+        if not self._refresh_lock.acquire(blocking=False):
+            raise RuntimeError("A catalog refresh is already running")
+        self.refreshing = True
+        started = time.monotonic()
+        try:
+            stream, etag, last_modified = self._open(force)
+            result = {"changed": False, "added": 0, "updated": 0, "removed": 0}
+            if stream is not None:
+                with stream:
+                    result = self._apply(stream)
+                result["changed"] = True
+            with self._lock:
+                self._set_meta(checked_at=time.time(), etag=etag, last_modified=last_modified,
+                               **({"refreshed_at": time.time()} if stream is not None else {}))
+            self.last_error = None
+            result["duration"] = round(time.monotonic() - started, 3)
+            logger.info(f"Catalog refresh from {self.source}: " + (
+                f"{result['added']} added, {result['updated']} updated, {result['removed']} removed"
+                if result["changed"] else "not modified") + f" ({result['duration']}s)")
+            if result["added"] or result["updated"] or result["removed"]:
+                events.publish("catalog", self.status())
+            return result
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Catalog refresh from {self.source} failed: {e}")
+            raise
+        finally:
+            self.refreshing = False
+            self._refresh_lock.release()
+
+    def _apply(self, stream) -> Dict:
+        rows = {}
+        for _, element in ET.iterparse(stream):
+            if element.tag == f"{self.ATOM}entry":
+                row = self._parse_entry(element)
+                if row is not None:
+                    rows[row["id"]] = row
+                element.clear()
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.COLUMNS[1:])
+        with self._lock:
+            known = dict(self._db.execute("SELECT id, updated FROM entries").fetchall())
+            changed = [row for entry_id, row in rows.items() if known.get(entry_id) != row["updated"]]
+            removed = [entry_id for entry_id in known if entry_id not in rows]
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    f"INSERT INTO entries ({', '.join(self.COLUMNS)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                    [tuple(row[column] for column in self.COLUMNS) for row in changed])
+                self._db.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in removed])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        added = sum(1 for row in changed if row["id"] not in known)
+        return {"added": added, "updated": len(changed) - added, "removed": len(removed)}
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        # Every word must match, as a prefix; quoting keeps FTS5 operators out
+        words = re.findall(r"\w+", query)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, query: str = "", language: Optional[str] = None, category: Optional[str] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               limit: int = 50, offset: int = 0) -> Dict:
+        """Entries matching the query and filters, best match first (title order without a query)."""
+        conditions, params = [], []
+        match = self._match_expression(query)
+        if match:
+            sql_from = "entries_fts JOIN entries ON entries.rowid = entries_fts.rowid"
+            conditions.append("entries_fts MATCH ?")
+            params.append(match)
+            order = "bm25(entries_fts, 10.0, 1.0, 5.0, 2.0)"
+        else:
+            sql_from = "entries"
+            order = "entries.title COLLATE NOCASE"
+        if language:
+            conditions.append("(',' || entries.language || ',') LIKE ?")
+            params.append(f"%,{language},%")
+        if category:
+            conditions.append("entries.category = ?")
+            params.append(category)
+        if min_size is not None:
+            conditions.append("entries.size >= ?")
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append("entries.size <= ?")
+            params.append(max_size)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        columns = ", ".join(f"entries.{column}" for column in self.COLUMNS)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM {sql_from}{where}", params).fetchone()[0]
+            rows = self._db.execute(f"SELECT {columns} FROM {sql_from}{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                                    params + [limit, offset]).fetchall()
+        entries = []
+        for values in rows:
+            entry = dict(zip(self.COLUMNS, values))
+            entry["tags"] = [tag for tag in entry["tags"].split(";") if tag]
+            entry["filename"] = Path(urlparse(entry["url"]).path).name
+            entry["size_formatted"] = format_size(entry["size"]) if entry["size"] is not None else None
+            entry["downloaded"] = storage_path is not None and (storage_path / entry["filename"]).exists()
+            entries.append(entry)
+        return {"total": total, "entries": entries}
+
+    def latest_editions(self) -> Dict[str, Dict]:
+        """The newest dated edition of every book, keyed on its undated file name."""
+        with self._lock:
+            rows = self._db.execute("SELECT url, size FROM entries").fetchall()
+        latest: Dict[str, Dict] = {}
+        for url, size in rows:
+            filename = Path(urlparse(url).path).name
+            name, date = split_edition(filename)
+            if date is not None and (name not in latest or latest[name]["date"] < date):
+                latest[name] = {"filename": filename, "date": date, "url": url, "size": size}
+        return latest
+
+    def status(self) -> Dict:
+        with self._lock:
+            checked_at, refreshed_at = self._meta("checked_at"), self._meta("refreshed_at")
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            categories = self._db.execute(
+                "SELECT category, COUNT(*) FROM entries GROUP BY category ORDER BY category").fetchall()
+            languages: Dict[str, int] = {}
+            for (codes,) in self._db.execute("SELECT language FROM entries"):
+                for code in codes.split(","):
+                    if code:
+                        languages[code] = languages.get(code, 0) + 1
+        return {
+            "source": self.source,
+            "entries": count,
+            "checked_at": datetime.fromtimestamp(float(checked_at)).isoformat() if checked_at else None,
+            "refreshed_at": datetime.fromtimestamp(float(refreshed_at)).isoformat() if refreshed_at else None,
+            "refresh_hours": self.refresh_hours,
+            "refreshing": self.refreshing,
+            "last_error": self.last_error,
+            "languages": dict(sorted(languages.items())),
+            "categories": {category: n for category, n in categories if category},
+        }
+
+
+catalog: Optional[CatalogMirror] = None
+
+
+class DownloadScheduler:
+    """Bounded download queue.
+
+    At most max_concurrent downloads run at once; the rest wait in a
+    priority queue (higher priority first, FIFO within a priority).
+    Job states: queued -> downloading -> completed/failed, with paused
+    and cancelled reachable from queued or downloading, and paused jobs
+    going back to queued on resume.
+    """
+
+    ACTIVE_STATES = ("queued", "downloading")
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self._queue: List = []  # heap of (-priority, sequence, job_id)
+        self._sequence = 0
+        self._running: Dict[str, threading.Event] = {}
+        self._paths: Dict[str, Path] = {}
+        self._cond = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="download-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, job_id: str, filepath: Path, priority: int = 0):
+        """Queue a job already registered in download_jobs."""
+        with self._cond:
+            self._paths[job_id] = filepath
+            download_jobs[job_id]["priority"] = priority
+            self._enqueue(job_id)
+
+    def _enqueue(self, job_id: str):
+        self._queue = [entry for entry in self._queue if entry[2] != job_id]
+        heapq.heapify(self._queue)
+        download_jobs[job_id]["status"] = "queued"
+        self._sequence += 1
+        heapq.heappush(self._queue, (-download_jobs[job_id]["priority"], self._sequence, job_id))
+        self._cond.notify_all()
+        self._notify(job_id)
+
+    @staticmethod
+    def _notify(job_id: str):
+        record_job(job_id)
+        events.publish("job", download_status(job_id))
+
+    def forget(self, job_id: str) -> bool:
+        """Drop a finished job's bookkeeping. False if its thread is still winding down."""
+        with self._cond:
+            if job_id in self._running:
+                return False
+            self._paths.pop(job_id, None)
+            if any(entry[2] == job_id for entry in self._queue):
+                self._queue = [entry for entry in self._queue if entry[2] != job_id]
+                heapq.heapify(self._queue)
+            return True
+
+    def restore(self, job_id: str, filepath: Path):
+        """Register a failed job left by a previous run without queueing it, so it can be resumed."""
+        with self._cond:
+            self._paths[job_id] = filepath
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job, None if it is not queued."""
+        with self._cond:
+            queued = sorted(entry for entry in self._queue if download_jobs[entry[2]]["status"] == "queued")
+        for position, entry in enumerate(queued, 1):
+            if entry[2] == job_id:
+                return position
+        return None
+
+    def set_priority(self, job_id: str, priority: int):
+        with self._cond:
+            download_jobs[job_id]["priority"] = priority
+            if download_jobs[job_id]["status"] == "queued":
+                self._enqueue(job_id)
+
+    def pause(self, job_id: str):
+        with self._cond:
+            status = download_jobs[job_id]["status"]
+            if status not in self.ACTIVE_STATES:
+                raise ValueError(f"Cannot pause a {status} download")
+            download_jobs[job_id]["status"] = "paused"
+            if job_id in self._running:
+                self._running[job_id].set()
+            else:
+                self._mark_manifest_paused(job_id, True)
+            self._cond.notify_all()
+        self._notify(job_id)
+
+    def resume(self, job_id: str):
+        with self._cond:
+            status = download_jobs[job_id]["status"]
+            if status not in ("paused", "failed"):
+                raise ValueError(f"Cannot resume a {status} download")
+            if job_id in self._running:
+                raise ValueError("Download is still stopping, try again shortly")
+            download_jobs[job_id].pop("error", None)
+            self._enqueue(job_id)
+
+    def cancel(self, job_id: str):
+        with self._cond:
+            status = download_jobs[job_id]["status"]
+            if status in ("completed", "cancelled"):
+                raise ValueError(f"Cannot cancel a {status} download")
+            download_jobs[job_id]["status"] = "cancelled"
+            discard = None
+            if job_id in self._running:
+                self._running[job_id].set()
+            else:
+                discard = self._paths[job_id]
+            self._cond.notify_all()
+        # Deleting a large partial file can take a while; not under the lock
+        if discard is not None:
+            discard_partial_download(discard)
+        self._notify(job_id)
+
+    def _mark_manifest_paused(self, job_id: str, paused: bool):
+        manifest = DownloadManifest.load(self._paths[job_id])
+        if manifest:
+            manifest.data["paused"] = paused
+            manifest.save(force=True)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Skip heap entries for jobs paused/cancelled while queued
+                    while self._queue and download_jobs[self._queue[0][2]]["status"] != "queued":
+                        heapq.heappop(self._queue)
+                    if self._queue and len(self._running) < self.max_concurrent:
+                        break
+                    self._cond.wait()
+                _, _, job_id = heapq.heappop(self._queue)
+                stop = threading.Event()
+                self._running[job_id] = stop
+                download_jobs[job_id]["status"] = "downloading"
+            self._notify(job_id)
+            threading.Thread(
+                target=self._run, args=(job_id, stop), name=f"download-{job_id}", daemon=True
+            ).start()
+
+    def _run(self, job_id: str, stop: threading.Event):
+        try:
+            job = download_jobs[job_id]
+            download_file_with_progress(job["url"], self._paths[job_id], job_id, stop)
+        finally:
+            with self._cond:
+                del self._running[job_id]
+                self._cond.notify_all()
+            self._notify(job_id)
+
+
+scheduler: Optional[DownloadScheduler] = None
+
+
+def resume_unfinished_downloads():
+    """Re-register downloads left unfinished by a previous run.
+
+    The job store knows every download that was queued, running or paused;
+    manifests of partial files fill in the progress (and cover downloads
+    started before the job store existed). Paused downloads stay paused
+    and failed ones stay failed (their partial data is kept for a resume);
+    everything else goes back into the queue.
+    """
+    stored = {job["job_id"]: job for job in job_store.query(list(JobStore.ACTIVE_STATES), limit=10000)}
+    unfinished = []
+    for manifest_file in sorted(storage_path.glob("*.zim.part.json")):
+        filepath = manifest_file.with_name(manifest_file.name[:-len(".part.json")])
+        manifest = DownloadManifest.load(filepath)
+        if manifest is None or not manifest.data.get("url"):
+            continue
+        job_id = manifest.data.get("job_id") or new_job_id()
+        job = stored.pop(job_id, None) or job_store.get(job_id) or {
+            "job_id": job_id,
+            "url": manifest.data["url"],
+            "filename": filepath.name,
+            "priority": manifest.data.get("priority", 0),
+            "rate_limit": manifest.data.get("rate_limit", 0),
+            "replaces": manifest.data.get("replaces"),
+            "started_at": manifest.data.get("started_at", datetime.now().isoformat()),
+        }
+        job.update({
+            "progress": 0,
+            "downloaded": manifest.completed_bytes,
+            "total_size": manifest.data.get("total_size", 0),
+        })
+        if job.get("status") == "failed":
+            download_jobs[job_id] = job
+            scheduler.restore(job_id, filepath)
+            logger.info(f"Found failed download {job_id}: {filepath.name} (resume it to retry)")
+            continue
+        if job.get("status") in JobStore.FINISHED_STATES:
+            # Cancelled or completed, but the restart came before the partial data was removed
+            discard_partial_download(filepath)
+            continue
+        unfinished.append((job, filepath, bool(manifest.data.get("paused"))))
+    
+    # Queued (or single-stream) downloads without partial data start over
+    for job in stored.values():
+        filepath = storage_path / job["filename"]
+        if filepath.exists():
+            # Finished, but the restart came before its state was saved
+            download_jobs[job["job_id"]] = dict(job, status="completed", progress=100)
+            record_job(job["job_id"])
+            if job.get("replaces") and (storage_path / job["replaces"]).exists():
+                replace_edition(filepath, storage_path / job["replaces"])
+            continue
+        job.update({"progress": 0, "downloaded": 0})
+        unfinished.append((job, filepath, job["status"] == "paused"))
+    
+    for job, filepath, paused in unfinished:
+        job_id = job["job_id"]
+        job.pop("error", None)
+        download_jobs[job_id] = dict(job, status="pending")
+        scheduler.submit(job_id, filepath, job.get("priority", 0))
+        if paused:
+            scheduler.pause(job_id)
+            logger.info(f"Found paused download {job_id}: {filepath.name}")
+        else:
+            logger.info(f"Resuming unfinished download {job_id}: {filepath.name} "
+                        f"({format_size(job['downloaded'])} already downloaded)")
+
+
+def upload_session_path(filepath: Path) -> Path:
+    """Sidecar recording an unfinished chunked upload of filepath."""
+    return filepath.with_name(filepath.name + ".upload.json")
+
+
+class UploadSession:
+    """Resumable chunked upload of one ZIM file (tus-style).
+
+    The client creates a session, PATCHes chunks at the current offset
+    and can ask for the offset again (HEAD) after a dropped connection.
+    Chunks are written with positioned writes straight into <name>.part;
+    the offset is persisted in a sidecar only after the data is synced,
+    so an interrupted upload, even across a restart, loses at most the
+    chunk in flight.
+    """
+
+    def __init__(self, filepath: Path, data: Dict):
+        self.filepath = filepath
+        self.data = data
+        self.offset = data["offset"]
+        self.lock = asyncio.Lock()
+        self.checksum: Optional[ZimChecksum] = None
+
+    @property
+    def upload_id(self) -> str:
+        return self.data["upload_id"]
+
+    @property
+    def size(self) -> int:
+        return self.data["size"]
+
+    @property
+    def reservation(self) -> str:
+        """Key of the session's disk space reservation."""
+        return f"upload:{self.upload_id}"
+
+    @classmethod
+    def load(cls, filepath: Path) -> Optional["UploadSession"]:
+        try:
+            with open(upload_session_path(filepath)) as f:
+                return cls(filepath, json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable upload session for {filepath.name}: {e}")
+            return None
+
+    def resume_checksum(self, fd: int):
+        """Start the checksum, hashing what is already on disk (fresh or restored session)."""
+        if self.checksum is None:
+            self.checksum = ZimChecksum()
+            self.checksum.catch_up(fd, self.data["offset"])
+
+    def write(self, fd: int, data: bytes):
+        """Write data at the current offset (runs in a worker thread)."""
+        self.resume_checksum(fd)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, self.offset)
+            view = view[written:]
+            self.offset += written
+        self.checksum.update(data)
+        uploaded_bytes.inc(len(data), "chunked")
+
+    def commit(self, fd: int):
+        """Make the received data durable, then record the new offset."""
+        if self.offset == self.data["offset"]:
+            return
+        os.fdatasync(fd)
+        self.data["offset"] = self.offset
+        self.data["updated_at"] = time.time()
+        self.save()
+
+    def save(self):
+        path = upload_session_path(self.filepath)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, path)
+
+    def remove(self):
+        """Forget the session and discard its partial data."""
+        upload_sessions.pop(self.upload_id, None)
+        space_reservations.release(self.reservation)
+        upload_session_path(self.filepath).unlink(missing_ok=True)
+        part_path(self.filepath).unlink(missing_ok=True)
+
+    def status(self) -> Dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filepath.name,
+            "size": self.size,
+            "offset": self.offset,
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "completed": False,
+        }
+
+
+upload_sessions: Dict[str, UploadSession] = {}
+
+
+def restore_upload_sessions():
+    """Reload unfinished chunked uploads; drop abandoned ones."""
+    for session_file in sorted(storage_path.glob("*.zim.upload.json")):
+        filepath = session_file.with_name(session_file.name[:-len(".upload.json")])
+        session = UploadSession.load(filepath)
+        if session is None:
+            continue
+        if not part_path(filepath).exists():
+            session_file.unlink(missing_ok=True)
+            continue
+        if time.time() - session.data.get("updated_at", 0) > UPLOAD_SESSION_MAX_AGE:
+            logger.info(f"Discarding abandoned upload of {filepath.name}")
+            session.remove()
+            continue
+        upload_sessions[session.upload_id] = session
+        try:
+            space_reservations.reserve(session.reservation, part_path(filepath), session.size, "upload")
+        except InsufficientStorage as e:
+            logger.warning(f"Unfinished upload of {filepath.name} may not fit: {e}")
+        logger.info(f"Found unfinished upload of {filepath.name} "
+                    f"({format_size(session.offset)}/{format_size(session.size)})")
+
+
+class EventBroker:
+    """Fan-out of server-sent events to every connected /api/events client.
+
+    publish() is thread-safe and delivers immediately. Download progress is
+    coalesced instead: publish_progress() only marks a job as changed and
+    a flusher task sends the latest state of each changed job once every
+    progress_interval seconds. With no clients connected nothing is queued.
+    """
+
+    QUEUE_SIZE = 256
+    KEEPALIVE_INTERVAL = 15  # Seconds between comments on an idle stream
+
+    def __init__(self, progress_interval: float = 1.0):
+        self.progress_interval = progress_interval
+        self._subscribers: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed_jobs: set = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def format(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        loop.create_task(self._flush_progress())
+
+    def publish(self, event: str, data):
+        if self._loop is None or not self._subscribers:
+            return
+        self._loop.call_soon_threadsafe(self._broadcast, self.format(event, data))
+
+    def publish_progress(self, job_id: str):
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._changed_jobs.add(job_id)
+
+    async def _flush_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            with self._lock:
+                changed, self._changed_jobs = self._changed_jobs, set()
+            for job_id in changed:
+                if job_id in download_jobs:
+                    self._broadcast(self.format("progress", download_status(job_id)))
+
+    def _broadcast(self, message: str):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Client is not keeping up: end its stream so it reconnects and resyncs
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self, snapshot: List[str]):
+        """Yield SSE messages for one client, starting with a snapshot."""
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield "retry: 3000\n\n"
+            for message in snapshot:
+                yield message
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subscribers)
+
+
+events = EventBroker()
+
+
+def notify_library_changed():
+    """Refresh the ZIM index and push the listing to event subscribers."""
+    if zim_index is not None:
+        zim_index.invalidate()
+    if events.client_count:
+        events.publish("library", zim_listing())
+
+
+@app.on_event("startup")
+async def start_event_broker():
+    events.start(asyncio.get_running_loop())
+
+
+@app.on_event("shutdown")
+def shutdown():
+    if library is not None:
+        library.flush()
+
+
+def zim_listing() -> List[Dict]:
+    """Info for every ZIM file in storage, newest first."""
+    if zim_index is None:
+        return []
+    zim_index.refresh()
+    return zim_index.listing
+
+
+async def refresh_zim_index():
+    """Bring the ZIM index up to date without blocking the event loop."""
+    if not zim_index.is_current():
+        await run_blocking(zim_index.refresh)
+
+
+@app.get("/api/zim")
+async def list_zim_files(request: Request):
+    """List all ZIM files (served from the index, with ETag revalidation)."""
+    if zim_index is None:
+        return JSONResponse(content=[])
+    started = time.perf_counter()
+    await refresh_zim_index()
+    headers = {"ETag": zim_index.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == zim_index.etag:
+        response = Response(status_code=304, headers=headers)
+    else:
+        response = Response(content=zim_index.body, media_type="application/json", headers=headers)
+    zim_list_seconds.observe(time.perf_counter() - started)
+    return response
+
+
+@app.get("/api/storage")
+async def get_storage():
+    """Disk usage of the storage volume, space reserved by running transfers and retired editions."""
+    def storage():
+        return dict(space_reservations.to_dict(), retired=retired_editions.to_dict())
+    
+    return JSONResponse(content=await run_blocking(storage))
+
+
+@app.get("/api/health")
+async def health():
+    """Readiness probe: 503 until the startup library reconciliation has finished."""
+    ready = library_reconciler.ready
+    return JSONResponse(
+        content={"status": "ready" if ready else "starting", "library": library_reconciler.status()},
+        status_code=200 if ready else 503,
+    )
+
 
+def job_counts() -> List:
+    counts = {status: 0 for status in ("queued", "downloading", "paused")}
+    for job in list(download_jobs.values()):
+        if job["status"] in counts:
+            counts[job["status"]] += 1
+    return [({"status": status}, count) for status, count in counts.items()]
 
-@app.get("/api/zim")
-async def list_zim_files():
-    """List all ZIM files."""
-    if storage_path is None or not storage_path.exists():
-        return JSONResponse(content=[])
-    
-    zim_files = []
-    for filepath in storage_path.glob("*.zim"):
-        info = get_zim_info(filepath)
-        if info:
-            zim_files.append(info)
+
+def job_speeds() -> List:
+    return [
+        ({"job_id": job["job_id"], "filename": job["filename"]}, job.get("speed", 0))
+        for job in list(download_jobs.values()) if job["status"] == "downloading"
+    ]
+
+
+metrics.gauge("kiwix_manager_download_jobs", "Download jobs by state", job_counts)
+metrics.gauge("kiwix_manager_download_speed_bytes", "Moving-average throughput of running downloads in bytes/s",
+              job_speeds)
+metrics.gauge("kiwix_manager_uploads_in_progress", "Unfinished chunked uploads", lambda: len(upload_sessions))
+metrics.gauge("kiwix_manager_storage_free_bytes", "Free space on the storage volume",
+              lambda: shutil.disk_usage(storage_path).free)
+metrics.gauge("kiwix_manager_storage_total_bytes", "Size of the storage volume",
+              lambda: shutil.disk_usage(storage_path).total)
+metrics.gauge("kiwix_manager_storage_reserved_bytes", "Space reserved by running downloads and uploads",
+              lambda: space_reservations.to_dict()["reserved"])
+metrics.gauge("kiwix_manager_library_books", "Books in library.xml, as served by kiwix-serve",
+              lambda: len(library) if library is not None else 0)
+metrics.gauge("kiwix_manager_event_clients", "Connected /api/events clients", lambda: events.client_count)
+metrics.gauge("kiwix_manager_catalog_entries", "Books in the local copy of the OPDS catalog",
+              lambda: len(catalog) if catalog is not None else 0)
+metrics.gauge("kiwix_manager_kiwix_serve_up", "Whether each kiwix-serve worker answers its health probe",
+              lambda: [({"port": w["port"]}, int(w["state"] == "running")) for w in read_kiwix_status() or []])
+metrics.gauge("kiwix_manager_kiwix_serve_uptime_seconds", "Seconds since each kiwix-serve worker was last (re)started",
+              lambda: [({"port": w["port"]}, w["uptime"] or 0) for w in read_kiwix_status() or []])
+metrics.register(CollectedCounter(
+    "kiwix_manager_kiwix_serve_restarts_total", "Times the supervisor restarted a kiwix-serve worker",
+    lambda: [({"port": w["port"]}, w["restarts"]) for w in read_kiwix_status() or []]))
+
+
+@app.get("/api/catalog")
+async def search_catalog(q: str = "", lang: Optional[str] = None, category: Optional[str] = None,
+                         min_size: Optional[int] = None, max_size: Optional[int] = None,
+                         limit: int = 50, offset: int = 0):
+    """Search the local copy of the OPDS catalog (sizes in bytes)."""
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="The catalog mirror is disabled")
+    result = await run_blocking(catalog.search, q, lang, category, min_size, max_size,
+                                max(1, min(limit, 500)), max(0, offset))
+    return JSONResponse(content=result)
+
+
+@app.get("/api/catalog/status")
+async def get_catalog_status():
+    """Catalog source, last refresh, entry count and the languages and categories on offer."""
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="The catalog mirror is disabled")
+    return JSONResponse(content=await run_blocking(catalog.status))
+
+
+@app.post("/api/catalog/refresh", status_code=202)
+async def refresh_catalog(force: bool = False):
+    """Refresh the catalog in the background (force=true skips the conditional request)."""
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="The catalog mirror is disabled")
+    catalog.refresh_soon(force)
+    return {"message": "Catalog refresh started"}
+
+
+@app.get("/api/kiwix/status")
+async def get_kiwix_status():
+    """State of the supervised kiwix-serve workers: uptime, restarts, last probe."""
+    workers = await run_blocking(read_kiwix_status)
+    if workers is None:
+        raise HTTPException(status_code=503, detail="The kiwix-serve supervisor is not running")
+    return JSONResponse(content={
+        "workers": workers,
+        "running": sum(1 for worker in workers if worker["state"] == "running"),
+    })
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format."""
+    return Response(content=await run_blocking(metrics.render), media_type=MetricsRegistry.CONTENT_TYPE)
+
+
+@app.get("/api/events")
+async def event_stream():
+    """Server-sent events: job state and progress, library changes, uploads.
     
-    # Sort by modified date (newest first)
-    zim_files.sort(key=lambda x: x["modified"], reverse=True)
-    return JSONResponse(content=zim_files)
+    Each connection starts with the current ZIM listing and job list, so
+    clients never need to poll.
+    """
+    snapshot = [
+        EventBroker.format("library", await run_blocking(zim_listing)),
+        EventBroker.format("jobs", [download_status(job_id) for job_id in list(download_jobs)]),
+    ]
+    return StreamingResponse(
+        events.stream(snapshot),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 @app.post("/api/zim/download")
@@ -689,58 +3503,270 @@ async def download_zim_file(data: dict, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=400, detail="Invalid URL")
     
     # Generate job ID
-    job_id = f"download_{int(time.time())}"
+    job_id = new_job_id()
     
     # Extract filename from URL
-    filename = os.path.basename(parsed.path) or f"download_{int(time.time())}.zim"
+    filename = os.path.basename(parsed.path) or f"{job_id}.zim"
     filepath = storage_path / filename
     
+    def existing_state():
+        return filepath.exists(), DownloadManifest.load(filepath)
+    
     # Check if file already exists
-    if filepath.exists():
+    exists, manifest = await run_blocking(existing_state)
+    if exists:
         raise HTTPException(status_code=400, detail=f"File {filename} already exists")
     
+    # A leftover partial download of the same URL is resumed, anything else conflicts
+    if manifest and manifest.data.get("url") != url:
+        raise HTTPException(status_code=400, detail=f"A different download for {filename} is already in progress")
+    for job in download_jobs.values():
+        if job["filename"] == filename and job["status"] in ("pending", "queued", "downloading", "paused"):
+            raise HTTPException(status_code=400, detail=f"File {filename} is already being downloaded")
+    
+    # An update names the installed edition that the download takes over from
+    replaces = data.get("replaces")
+    if replaces:
+        if '..' in replaces or '/' in replaces or '\\' in replaces:
+            raise HTTPException(status_code=400, detail="Invalid filename")
+        if not await run_blocking((storage_path / replaces).exists):
+            raise HTTPException(status_code=404, detail=f"File {replaces} not found")
+        if replaces == filename or split_edition(replaces)[0] != split_edition(filename)[0]:
+            raise HTTPException(status_code=400, detail=f"{filename} is not another edition of {replaces}")
+    
+    try:
+        priority = int(data.get("priority", 0))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Priority must be an integer")
+    try:
+        rate_limit = int(data.get("rate_limit", 0))
+        if rate_limit < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Rate limit must be a non-negative integer (KB/s)")
+    
+    blockmap_url = data.get("blockmap_url")
+    if blockmap_url:
+        parsed_blockmap = urlparse(blockmap_url)
+        if not parsed_blockmap.scheme or not parsed_blockmap.netloc:
+            raise HTTPException(status_code=400, detail="Invalid block map URL")
+    
     # Initialize download job
     download_jobs[job_id] = {
         "job_id": job_id,
         "url": url,
         "filename": filename,
         "status": "pending",
+        "rate_limit": rate_limit,
+        "replaces": replaces or None,
+        "delta": bool(data.get("delta", True)),
+        "blockmap_url": blockmap_url or None,
         "progress": 0,
-        "downloaded": 0,
-        "total_size": 0,
+        "downloaded": manifest.completed_bytes if manifest else 0,
+        "total_size": manifest.data.get("total_size", 0) if manifest else 0,
         "started_at": datetime.now().isoformat(),
     }
     
-    # Start download in background thread
-    def download_task():
-        download_file_with_progress(url, filepath, job_id)
-    
-    thread = threading.Thread(target=download_task, daemon=True)
-    thread.start()
+    # Queue the download; the scheduler starts it when a slot is free
+    await run_blocking(scheduler.submit, job_id, filepath, priority)
     
-    logger.info(f"Started download job {job_id} for {url}")
-    return JSONResponse(content={"job_id": job_id, "filename": filename, "status": "started"})
+    logger.info(f"Queued download job {job_id} for {url} (priority {priority})"
+                + (f", replacing {replaces}" if replaces else ""))
+    return JSONResponse(content={
+        "job_id": job_id,
+        "filename": filename,
+        "replaces": replaces or None,
+        "status": download_jobs[job_id]["status"],
+        "queue_position": scheduler.queue_position(job_id),
+    })
 
 
-@app.get("/api/download/{job_id}/status")
-async def get_download_status(job_id: str):
-    """Get download job status."""
-    if job_id not in download_jobs:
-        raise HTTPException(status_code=404, detail="Download job not found")
+def available_updates() -> List[Dict]:
+    """Installed dated editions for which the catalog has a newer edition."""
+    latest = catalog.latest_editions()
+    downloading = {job["filename"]: job_id for job_id, job in download_jobs.items()
+                   if job["status"] in JobStore.ACTIVE_STATES}
+    updates = []
+    for filepath in sorted(storage_path.glob("*.zim")):
+        name, date = split_edition(filepath.name)
+        entry = latest.get(name)
+        if date is None or entry is None or entry["date"] <= date:
+            continue
+        if (storage_path / entry["filename"]).exists():
+            continue  # Downloaded, just not swapped in
+        updates.append({
+            "filename": filepath.name,
+            "date": date,
+            "latest_filename": entry["filename"],
+            "latest_date": entry["date"],
+            "url": entry["url"],
+            "size": entry["size"],
+            "size_formatted": format_size(entry["size"]) if entry["size"] is not None else None,
+            "job_id": downloading.get(entry["filename"]),
+        })
+    return updates
+
+
+@app.get("/api/zim/updates")
+async def list_zim_updates():
+    """Installed ZIM files with a newer edition in the catalog."""
+    if catalog is None:
+        raise HTTPException(status_code=404, detail="The catalog is disabled")
+    return JSONResponse(content=await run_blocking(available_updates))
+
+
+@app.post("/api/zim/{filename}/update")
+async def update_zim_file(filename: str, background_tasks: BackgroundTasks, data: Optional[dict] = None):
+    """Download a newer edition of a ZIM file and swap it in once complete.
     
-    job = download_jobs[job_id]
-    return JSONResponse(content={
+    The old edition keeps being served until then. Without a "url", the
+    newest edition in the catalog is downloaded.
+    """
+    # Security: prevent directory traversal
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    if not (storage_path / filename).exists():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    data = dict(data or {})
+    if not data.get("url"):
+        if catalog is None:
+            raise HTTPException(status_code=400, detail="URL is required when the catalog is disabled")
+        name, date = split_edition(filename)
+        entry = (await run_blocking(catalog.latest_editions)).get(name)
+        if date is None or entry is None or entry["date"] <= date:
+            raise HTTPException(status_code=404, detail=f"No newer edition of {filename} in the catalog")
+        data["url"] = entry["url"]
+    data["replaces"] = filename
+    return await download_zim_file(data, background_tasks)
+
+
+def download_status(job_id: str, job: Optional[Dict] = None) -> Dict:
+    """Public view of a download job."""
+    job = job or get_job(job_id)
+    return {
         "job_id": job_id,
+        "filename": job["filename"],
         "status": job["status"],
+        "priority": job.get("priority", 0),
+        "rate_limit": job.get("rate_limit", 0),
+        "replaces": job.get("replaces"),
+        "queue_position": scheduler.queue_position(job_id) if job["status"] == "queued" else None,
         "progress": job.get("progress", 0),
         "downloaded": job.get("downloaded", 0),
         "total_size": job.get("total_size", 0),
+        "speed": job.get("speed", 0) if job["status"] == "downloading" else 0,
+        "eta": job.get("eta") if job["status"] == "downloading" else None,
+        "resumed_from": job.get("resumed_from", 0),
+        "verified": job.get("verified"),
+        "bytes_saved": job.get("bytes_saved", 0),
+        "delta_seed": job.get("delta_seed"),
         "error": job.get("error"),
-    })
+    }
+
+
+@app.get("/api/download")
+async def list_downloads(status: Optional[str] = None, max_age: Optional[int] = None, limit: int = 100):
+    """List download jobs.
+    
+    Without parameters: active jobs and the most recent finished ones. With
+    status (comma-separated, "active" for all unfinished states) and/or
+    max_age (seconds), the job history is queried instead.
+    """
+    if status is None and max_age is None:
+        return JSONResponse(content=[download_status(job_id) for job_id in list(download_jobs)])
+    statuses = []
+    for name in (status or "").split(","):
+        if name == "active":
+            statuses.extend(JobStore.ACTIVE_STATES)
+        elif name in JobStore.ACTIVE_STATES or name in JobStore.FINISHED_STATES:
+            statuses.append(name)
+        elif name:
+            raise HTTPException(status_code=400, detail=f"Unknown status: {name}")
+    since = time.time() - max_age if max_age is not None else None
+    jobs = await run_blocking(job_store.query, statuses, since, max(1, min(limit, 1000)))
+    # Jobs still in memory have fresher progress than their last saved state
+    return JSONResponse(content=[download_status(job["job_id"], download_jobs.get(job["job_id"], job))
+                                 for job in jobs])
+
+
+@app.get("/api/download/limits")
+async def get_download_limits():
+    """Get the global download rate limit and time-of-day schedule."""
+    return JSONResponse(content=bandwidth_schedule.to_dict())
+
+
+@app.put("/api/download/limits")
+async def set_download_limits(data: dict):
+    """Change the global download rate limit and/or schedule (KB/s, 0 = unlimited)."""
+    global bandwidth_schedule
+    try:
+        rate_limit = int(data.get("rate_limit", bandwidth_schedule.default_kbps))
+        if rate_limit < 0:
+            raise ValueError("Rate limit must not be negative")
+        windows = data.get("schedule", [window["window"] for window in bandwidth_schedule.windows])
+        bandwidth_schedule = BandwidthSchedule(rate_limit, list(windows))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    logger.info(f"Download limits changed: {bandwidth_schedule.to_dict()}")
+    return JSONResponse(content=bandwidth_schedule.to_dict())
+
+
+@app.get("/api/download/{job_id}/status")
+async def get_download_status(job_id: str):
+    """Get download job status."""
+    if await run_blocking(get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Download job not found")
+    
+    return JSONResponse(content=await run_blocking(download_status, job_id))
+
+
+@app.post("/api/download/{job_id}/{action}")
+async def control_download(job_id: str, action: str, data: Optional[dict] = None):
+    """Pause, resume, cancel, re-prioritize or rate-limit a download job."""
+    if job_id not in download_jobs:
+        if await run_blocking(get_job, job_id) is None:
+            raise HTTPException(status_code=404, detail="Download job not found")
+        raise HTTPException(status_code=409, detail="Download job is finished and no longer active")
+    
+    if action == "priority":
+        try:
+            priority = int((data or {}).get("priority", 0))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Priority must be an integer")
+    elif action == "limit":
+        try:
+            rate_limit = int((data or {}).get("rate_limit", 0))
+            if rate_limit < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Rate limit must be a non-negative integer (KB/s)")
+    
+    try:
+        # Pausing and cancelling touch manifests and partial files on disk
+        if action == "pause":
+            await run_blocking(scheduler.pause, job_id)
+        elif action == "resume":
+            await run_blocking(scheduler.resume, job_id)
+        elif action == "cancel":
+            await run_blocking(scheduler.cancel, job_id)
+        elif action == "priority":
+            await run_blocking(scheduler.set_priority, job_id, priority)
+        elif action == "limit":
+            await run_blocking(set_job_rate_limit, job_id, rate_limit)
+        else:
+            raise HTTPException(status_code=404, detail=f"Unknown action: {action}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    logger.info(f"Download job {job_id}: {action}")
+    return JSONResponse(content=download_status(job_id))
 
 
 @app.post("/api/zim/upload")
-async def upload_zim_file(file: UploadFile = File(...)):
+async def upload_zim_file(request: Request, file: UploadFile = File(...)):
     """Upload a ZIM file."""
     if not file.filename.endswith('.zim'):
         raise HTTPException(status_code=400, detail="File must have .zim extension")
@@ -751,30 +3777,49 @@ async def upload_zim_file(file: UploadFile = File(...)):
     if filepath.exists():
         raise HTTPException(status_code=400, detail=f"File {file.filename} already exists")
     
+    # The multipart body is slightly larger than the file, which errs on the safe side
+    reservation = f"upload:{uuid.uuid4().hex}"
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        try:
+            space_reservations.reserve(reservation, filepath, int(content_length), "upload")
+        except InsufficientStorage as e:
+            raise HTTPException(status_code=507, detail=str(e))
+    
     try:
-        # Check file size during upload
+        # Check file size and checksum during upload
         total_size = 0
+        checksum = ZimChecksum()
         async with aiofiles.open(filepath, 'wb') as f:
-            while chunk := await file.read(8192):
+            while chunk := await file.read(UPLOAD_WRITE_SIZE):
                 total_size += len(chunk)
                 if total_size > max_upload_size:
                     filepath.unlink(missing_ok=True)
                     raise HTTPException(status_code=413, detail=f"File size exceeds maximum allowed size ({format_size(max_upload_size)})")
                 await f.write(chunk)
+                await run_blocking(checksum.update, chunk)
+                uploaded_bytes.inc(len(chunk), "multipart")
         
         # Verify file was written
         if not filepath.exists() or filepath.stat().st_size == 0:
             raise HTTPException(status_code=500, detail="Upload failed: file is empty")
         
+        if checksum.result() is False:
+            filepath.unlink(missing_ok=True)
+            transfers_finished.inc(1, "upload", "failed")
+            raise HTTPException(status_code=422, detail=f"{file.filename} failed its ZIM checksum, the upload is corrupt or truncated")
+        
         logger.info(f"Uploaded file: {file.filename} ({format_size(filepath.stat().st_size)})")
+        transfers_finished.inc(1, "upload", "completed")
         
         # Add to library.xml
-        library_xml = storage_path / "library.xml"
-        if add_zim_to_library(filepath, library_xml):
+        if await run_blocking(library.add, filepath):
             logger.info(f"ZIM file {file.filename} added to library successfully")
         else:
             logger.warning(f"ZIM file {file.filename} uploaded but failed to add to library")
         
+        events.publish("upload", {"filename": file.filename, "size": filepath.stat().st_size})
+        await run_blocking(notify_library_changed)
         return JSONResponse(content={
             "filename": file.filename,
             "size": filepath.stat().st_size,
@@ -783,9 +3828,273 @@ async def upload_zim_file(file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        filepath.unlink(missing_ok=True)
+        await run_blocking(lambda: filepath.unlink(missing_ok=True))
         logger.error(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        space_reservations.release(reservation)
+
+
+@app.put("/api/zim/{filename}")
+async def put_zim_file(filename: str, request: Request):
+    """Upload a ZIM file as the raw request body.
+    
+    The body is streamed straight into the destination file in large
+    blocks, with no multipart parsing or temporary spool file, and its
+    ZIM checksum is verified on the way through.
+    """
+    if not filename.endswith('.zim'):
+        raise HTTPException(status_code=400, detail="File must have .zim extension")
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    filepath = storage_path / filename
+    if await run_blocking(filepath.exists):
+        raise HTTPException(status_code=400, detail=f"File {filename} already exists")
+    
+    # Reject oversized uploads before reading any of the body
+    content_length = request.headers.get("content-length")
+    expected_size = int(content_length) if content_length and content_length.isdigit() else None
+    if expected_size is not None and expected_size > max_upload_size:
+        raise HTTPException(status_code=413, detail=f"File size exceeds maximum allowed size ({format_size(max_upload_size)})")
+    
+    try:
+        fd = await run_blocking(os.open, part_path(filepath), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"A download or upload of {filename} is already in progress")
+    
+    def discard():
+        os.close(fd)
+        part_path(filepath).unlink(missing_ok=True)
+    
+    reservation = f"upload:{uuid.uuid4().hex}"
+    if expected_size:
+        try:
+            await run_blocking(space_reservations.reserve, reservation, part_path(filepath), expected_size, "upload")
+        except InsufficientStorage as e:
+            await run_blocking(discard)
+            raise HTTPException(status_code=507, detail=str(e))
+    
+    checksum = ZimChecksum()
+    total_size = 0
+    buffer = bytearray()
+    
+    def write_block(data: bytes):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        checksum.update(data)
+        uploaded_bytes.inc(len(data), "put")
+    
+    try:
+        if expected_size:
+            await run_blocking(preallocate_file, fd, expected_size)
+        async for chunk in request.stream():
+            total_size += len(chunk)
+            if total_size > max_upload_size:
+                raise HTTPException(status_code=413, detail=f"File size exceeds maximum allowed size ({format_size(max_upload_size)})")
+            buffer += chunk
+            if len(buffer) >= UPLOAD_WRITE_SIZE:
+                await run_blocking(write_block, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_blocking(write_block, bytes(buffer))
+        
+        if total_size == 0:
+            raise HTTPException(status_code=400, detail="Upload failed: file is empty")
+        if expected_size is not None and total_size != expected_size:
+            raise HTTPException(status_code=400, detail=f"Upload incomplete: received {total_size} of {expected_size} bytes")
+        if checksum.result() is False:
+            transfers_finished.inc(1, "upload", "failed")
+            raise HTTPException(status_code=422, detail=f"{filename} failed its ZIM checksum, the upload is corrupt or truncated")
+        await run_blocking(os.close, fd)
+        fd = None
+        await run_blocking(os.replace, part_path(filepath), filepath)
+    except ClientDisconnect:
+        logger.warning(f"Upload of {filename} interrupted after {format_size(total_size)}")
+        await run_blocking(lambda: part_path(filepath).unlink(missing_ok=True))
+        raise HTTPException(status_code=400, detail="Client disconnected")
+    except OSError as e:
+        await run_blocking(lambda: part_path(filepath).unlink(missing_ok=True))
+        if e.errno == errno.ENOSPC:
+            raise HTTPException(status_code=507, detail=f"Not enough disk space for {filename}")
+        raise
+    except BaseException:
+        await run_blocking(lambda: part_path(filepath).unlink(missing_ok=True))
+        raise
+    finally:
+        if fd is not None:
+            os.close(fd)
+        space_reservations.release(reservation)
+    
+    logger.info(f"Uploaded file: {filename} ({format_size(total_size)})")
+    transfers_finished.inc(1, "upload", "completed")
+    
+    # Add to library.xml
+    if await run_blocking(library.add, filepath):
+        logger.info(f"ZIM file {filename} added to library successfully")
+    else:
+        logger.warning(f"ZIM file {filename} uploaded but failed to add to library")
+    
+    events.publish("upload", {"filename": filename, "size": total_size})
+    await run_blocking(notify_library_changed)
+    return JSONResponse(content={
+        "filename": filename,
+        "size": total_size,
+        "size_formatted": format_size(total_size),
+        "verified": checksum.result(),
+    })
+
+
+def get_upload_session(upload_id: str) -> UploadSession:
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@app.post("/api/upload")
+async def create_upload(data: dict):
+    """Create a resumable chunked upload session ({"filename": ..., "size": ...})."""
+    filename = data.get("filename") or ""
+    size = data.get("size")
+    if not filename.endswith('.zim'):
+        raise HTTPException(status_code=400, detail="File must have .zim extension")
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if not isinstance(size, int) or size <= 0:
+        raise HTTPException(status_code=400, detail="size must be a positive number of bytes")
+    if size > max_upload_size:
+        raise HTTPException(status_code=413, detail=f"File size exceeds maximum allowed size ({format_size(max_upload_size)})")
+    
+    filepath = storage_path / filename
+    if filepath.exists():
+        raise HTTPException(status_code=400, detail=f"File {filename} already exists")
+    try:
+        # Exclusive create: a download or another upload may own the .part file
+        os.close(os.open(part_path(filepath), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"A download or upload of {filename} is already in progress")
+    
+    now = time.time()
+    session = UploadSession(filepath, {
+        "upload_id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": size,
+        "offset": 0,
+        "created_at": now,
+        "updated_at": now,
+    })
+    
+    def reserve_and_preallocate():
+        space_reservations.reserve(session.reservation, part_path(filepath), size, "upload")
+        with open(part_path(filepath), 'r+b') as f:
+            preallocate_file(f.fileno(), size)
+    
+    try:
+        await run_blocking(reserve_and_preallocate)
+    except OSError as e:
+        space_reservations.release(session.reservation)
+        part_path(filepath).unlink(missing_ok=True)
+        if isinstance(e, InsufficientStorage) or e.errno == errno.ENOSPC:
+            raise HTTPException(status_code=507, detail=str(e))
+        raise
+    
+    await run_blocking(session.save)
+    upload_sessions[session.upload_id] = session
+    logger.info(f"Created upload {session.upload_id} for {filename} ({format_size(size)})")
+    return JSONResponse(
+        content=session.status(),
+        status_code=201,
+        headers={"Location": f"upload/{session.upload_id}", "Upload-Offset": "0"},
+    )
+
+
+@app.head("/api/upload/{upload_id}")
+async def get_upload_offset(upload_id: str):
+    """Report how many bytes of an upload have been received."""
+    session = get_upload_session(upload_id)
+    return Response(headers={
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.size),
+        "Cache-Control": "no-store",
+    })
+
+
+@app.patch("/api/upload/{upload_id}")
+async def append_upload(upload_id: str, request: Request):
+    """Append the request body to an upload at the offset given in Upload-Offset."""
+    session = get_upload_session(upload_id)
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="Another chunk of this upload is in progress")
+    
+    async with session.lock:
+        if offset != session.offset:
+            raise HTTPException(status_code=409, detail=f"Upload-Offset {offset} does not match the current offset {session.offset}",
+                                headers={"Upload-Offset": str(session.offset)})
+        
+        fd = os.open(part_path(session.filepath), os.O_RDWR)
+        buffer = bytearray()
+        try:
+            async for chunk in request.stream():
+                if session.offset + len(buffer) + len(chunk) > session.size:
+                    raise HTTPException(status_code=413, detail="Chunk goes past the declared upload size")
+                buffer += chunk
+                if len(buffer) >= UPLOAD_WRITE_SIZE:
+                    await run_blocking(session.write, fd, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_blocking(session.write, fd, bytes(buffer))
+        except ClientDisconnect:
+            logger.info(f"Upload {upload_id} interrupted at {format_size(session.offset)}")
+        finally:
+            try:
+                await run_blocking(session.commit, fd)
+                if session.offset == session.size:
+                    # A session restored complete has had nothing written since the restart
+                    await run_blocking(session.resume_checksum, fd)
+            finally:
+                os.close(fd)
+        
+        if session.offset < session.size:
+            return JSONResponse(content=session.status(), headers={"Upload-Offset": str(session.offset)})
+        
+        # Last chunk: verify and move into place
+        filepath = session.filepath
+        if session.checksum.result() is False:
+            await run_blocking(session.remove)
+            transfers_finished.inc(1, "upload", "failed")
+            raise HTTPException(status_code=422, detail=f"{filepath.name} failed its ZIM checksum, the upload is corrupt")
+        await run_blocking(os.replace, part_path(filepath), filepath)
+        await run_blocking(session.remove)
+        logger.info(f"Uploaded file: {filepath.name} ({format_size(session.size)})")
+        transfers_finished.inc(1, "upload", "completed")
+        
+        # Add to library.xml
+        if await run_blocking(library.add, filepath):
+            logger.info(f"ZIM file {filepath.name} added to library successfully")
+        else:
+            logger.warning(f"ZIM file {filepath.name} uploaded but failed to add to library")
+        
+        events.publish("upload", {"filename": filepath.name, "size": session.size})
+        await run_blocking(notify_library_changed)
+        return JSONResponse(content=dict(session.status(), completed=True),
+                            headers={"Upload-Offset": str(session.offset)})
+
+
+@app.delete("/api/upload/{upload_id}")
+async def abort_upload(upload_id: str):
+    """Abort an upload and discard the data received so far."""
+    session = get_upload_session(upload_id)
+    if session.lock.locked():
+        raise HTTPException(status_code=409, detail="A chunk of this upload is in progress")
+    await run_blocking(session.remove)
+    logger.info(f"Aborted upload {upload_id} of {session.filepath.name}")
+    return JSONResponse(content={"message": f"Upload of {session.filepath.name} aborted"})
 
 
 @app.delete("/api/zim/{filename}")
@@ -801,24 +4110,14 @@ async def delete_zim_file(filename: str):
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
-        # Remove from library.xml if it exists
-        library_xml = storage_path / "library.xml"
-        if library_xml.exists():
-            logger.info(f"Removing {filename} from library.xml")
-            result = subprocess.run(
-                ['kiwix-manage', str(library_xml), 'remove', str(filepath)],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode == 0:
-                logger.info(f"Removed {filename} from library.xml")
-            else:
-                logger.warning(f"Failed to remove {filename} from library.xml: {result.stderr}")
+        # Remove from library.xml
+        if not await run_blocking(library.remove, filepath):
+            logger.warning(f"{filename} was not in library.xml")
         
-        # Delete the file
-        filepath.unlink()
+        # Delete the file (unlinking a large file can take seconds)
+        await run_blocking(filepath.unlink)
         logger.info(f"Deleted file: {filename}")
+        await run_blocking(notify_library_changed)
         return JSONResponse(content={"message": f"File {filename} deleted successfully"})
     except Exception as e:
         logger.error(f"Delete error: {e}")
@@ -837,58 +4136,404 @@ async def get_zim_file_info(filename: str):
     if not filepath.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
-    info = get_zim_info(filepath)
+    info = await run_blocking(get_zim_info, filepath)
     if not info:
         raise HTTPException(status_code=500, detail="Failed to get file information")
     
     return JSONResponse(content=info)
 
 
-def scan_and_add_existing_zim_files():
-    """Scan for existing ZIM files and add them to library.xml if not already present."""
-    library_xml = storage_path / "library.xml"
+@app.get("/api/zim/{filename}/blockmap")
+async def get_zim_blockmap(filename: str):
+    """Get the block checksums of a ZIM file, for delta downloads of it from this server."""
+    # Security: prevent directory traversal
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
     
-    # Find all ZIM files
-    zim_files = list(storage_path.glob("*.zim"))
+    filepath = storage_path / filename
     
-    if not zim_files:
-        logger.info("No ZIM files found to scan")
-        return
+    if not filepath.exists():
+        raise HTTPException(status_code=404, detail="File not found")
     
-    logger.info(f"Scanning {len(zim_files)} ZIM file(s) and adding to library if needed")
-    
-    # Check if library.xml exists and read it to see what's already there
-    existing_files = set()
-    if library_xml.exists():
-        try:
-            import xml.etree.ElementTree as ET
-            tree = ET.parse(library_xml)
-            root = tree.getroot()
-            for book in root.findall(".//book"):
-                path = book.get("path", "")
-                if path:
-                    # Extract filename from path
-                    filename = Path(path).name
-                    existing_files.add(filename)
-        except Exception as e:
-            logger.warning(f"Could not parse existing library.xml: {e}")
-    
-    # Add files that aren't in the library
-    added_count = 0
-    for zim_file in zim_files:
-        if zim_file.name not in existing_files:
-            logger.info(f"Adding existing ZIM file {zim_file.name} to library")
-            if add_zim_to_library(zim_file, library_xml):
-                added_count += 1
-            else:
-                logger.warning(f"Failed to add {zim_file.name} to library")
-        else:
-            logger.debug(f"ZIM file {zim_file.name} already in library")
+    data = await run_blocking(blockmap_for, filepath)
+    return Response(content=data, media_type="application/octet-stream")
+
+
+@app.get("/api/zim/{filename}/illustration")
+async def get_zim_illustration(filename: str):
+    """Get the 48x48 PNG illustration of a ZIM file."""
+    # Security: prevent directory traversal
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    filepath = storage_path / filename
+    
+    if not filepath.exists():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    def read_illustration():
+        with ZimReader(filepath) as zim:
+            return zim.illustration()
     
-    if added_count > 0:
-        logger.info(f"Added {added_count} existing ZIM file(s) to library.xml")
+    try:
+        illustration = await run_blocking(read_illustration)
+    except (OSError, ZimFormatError, lzma.LZMAError, struct.error) as e:
+        raise HTTPException(status_code=422, detail=f"Cannot read ZIM file: {e}")
+    if not illustration:
+        raise HTTPException(status_code=404, detail="ZIM file has no illustration")
+    
+    return Response(content=illustration, media_type="image/png")
+
+
+@app.get("/api/zim/verify")
+async def get_verify_status():
+    """Get the state and per-file results of the last verification run."""
+    return JSONResponse(content=zim_verifier.status())
+
+
+@app.post("/api/zim/verify")
+async def start_verify(data: Optional[dict] = None):
+    """Verify ZIM files against their embedded MD5 in the background.
+    
+    Checks all files unless a list of "files" is given.
+    """
+    names = (data or {}).get("files")
+    if names is None:
+        files = await run_blocking(lambda: sorted(storage_path.glob("*.zim")))
     else:
-        logger.info("All ZIM files are already in library.xml")
+        files = []
+        for name in names:
+            if '..' in name or '/' in name or '\\' in name:
+                raise HTTPException(status_code=400, detail=f"Invalid filename: {name}")
+            if not (storage_path / name).exists():
+                raise HTTPException(status_code=404, detail=f"File not found: {name}")
+            files.append(storage_path / name)
+    
+    if not await run_blocking(zim_verifier.start, files):
+        raise HTTPException(status_code=409, detail="A verification run is already in progress")
+    
+    return JSONResponse(content=zim_verifier.status(), status_code=202)
+
+
+@app.post("/api/zim/verify/cancel")
+async def cancel_verify():
+    """Stop the running verification after the current block."""
+    if not zim_verifier.cancel():
+        raise HTTPException(status_code=409, detail="No verification run in progress")
+    return JSONResponse(content={"message": "Verification cancelled"})
+
+
+class LibraryReconciler:
+    """Brings library.xml in line with the storage directory after startup.
+
+    Runs in a background thread so the API binds immediately; /api/health
+    answers 503 until the first pass is done. ZIM headers are read by a
+    pool of worker threads outside the library lock, so on network storage
+    many files are waiting on the disk at once, and uploads and deletes
+    are never stuck behind the scan. All new books are then merged into
+    library.xml with a single write, in the same order as a serial scan.
+    Entries whose file has disappeared are dropped.
+    """
+
+    # Reading a header is a chain of small dependent reads, so threads spend
+    # most of their time waiting on storage: keep several requests in flight
+    # per core, capped like ThreadPoolExecutor's own default
+    WORKERS = min(32, (os.cpu_count() or 1) + 8)
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self.state: Dict = {"status": "pending"}
+
+    @property
+    def ready(self) -> bool:
+        return self.state["status"] in ("completed", "failed")
+
+    def start(self):
+        self.state = {
+            "status": "running",
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "duration": None,
+            "files_total": 0,
+            "files_done": 0,
+            "added": 0,
+            "removed": 0,
+            "failed": [],
+        }
+        self._thread = threading.Thread(target=self._run, name="library-reconcile", daemon=True)
+        self._thread.start()
+
+    def status(self) -> Dict:
+        return dict(self.state, failed=list(self.state.get("failed", [])))
+
+    def _run(self):
+        started = time.monotonic()
+        try:
+            self._reconcile()
+            self.state["status"] = "completed"
+        except Exception as e:
+            logger.exception(f"Library reconciliation failed: {e}")
+            self.state["status"] = "failed"
+            self.state["error"] = str(e)
+        self.state["finished_at"] = datetime.now().isoformat()
+        self.state["duration"] = round(time.monotonic() - started, 3)
+        logger.info(f"Library reconciliation {self.state['status']} in {self.state['duration']}s: "
+                    f"{self.state['added']} added, {self.state['removed']} removed, "
+                    f"{len(self.state['failed'])} unreadable")
+        events.publish("reconcile", self.status())
+        # Warm the /api/zim index so the first listing is not the slow one
+        if zim_index is not None:
+            zim_index.refresh()
+
+    def _reconcile(self):
+        stale = [path for path in library.paths() if not path.exists()]
+        if stale:
+            with library.batch():
+                for path in stale:
+                    if library.remove(path):
+                        self.state["removed"] += 1
+            notify_library_changed()
+
+        new_files = [path for path in sorted(storage_path.glob("*.zim")) if path not in library]
+        self.state["files_total"] = len(new_files)
+        if not new_files:
+            logger.info("All ZIM files are already in library.xml")
+            return
+        workers = min(self.WORKERS, len(new_files))
+        logger.info(f"Adding {len(new_files)} ZIM file(s) to library.xml in the background "
+                    f"({workers} reader threads)")
+
+        books = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library-scan") as pool:
+            for filepath, book in zip(new_files, pool.map(library.book_element, new_files)):
+                if book is None:
+                    logger.warning(f"Failed to add {filepath.name} to library")
+                    self.state["failed"].append(filepath.name)
+                else:
+                    books.append((filepath, book))
+                self.state["files_done"] += 1
+
+        if books:
+            with library.batch():
+                for filepath, book in books:
+                    if library.add(filepath, book):
+                        self.state["added"] += 1
+            notify_library_changed()
+
+
+library_reconciler = LibraryReconciler()
+
+
+class KiwixServeSupervisor:
+    """Runs kiwix-serve as a child process and keeps it alive.
+
+    The process is probed over HTTP every PROBE_INTERVAL seconds. When it
+    exits, or fails FAILURE_THRESHOLD probes in a row once past its
+    startup grace period, it is killed and started again after an
+    exponential backoff (reset once it has stayed up for STABLE_SECONDS).
+    kiwix-serve reloads library.xml by itself (--monitorLibrary); the
+    library only rewrites the file in batches, so a burst of changes
+    costs a single reload. --nodatealiases also serves every dated
+    edition under its undated name, so links to a book keep working when
+    a newer edition replaces it. Supervisors run in a process of their
+    own (see supervise_kiwix_serve), not in the management API.
+    """
+
+    PROBE_INTERVAL = 5
+    PROBE_TIMEOUT = 5
+    FAILURE_THRESHOLD = 3
+    STARTUP_GRACE = 30
+    STABLE_SECONDS = 60
+    BACKOFF_INITIAL = 1
+    BACKOFF_MAX = 60
+    STOP_TIMEOUT = 10
+
+    def __init__(self, binary: str, library_path: Path, port: int, address: str = "0.0.0.0"):
+        self.port = port
+        self.command = [binary, "--library", "--monitorLibrary", "--nodatealiases", "--address", address,
+                        "--port", str(port), str(library_path)]
+        self.probe_url = f"http://127.0.0.1:{port}/"
+        self._process: Optional[subprocess.Popen] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._crash_streak = 0
+        self.state: Dict = {
+            "state": "stopped",
+            "pid": None,
+            "started_at": None,
+            "restarts": 0,
+            "last_exit_code": None,
+            "last_restart_reason": None,
+            "last_restart_at": None,
+            "consecutive_failures": 0,
+            "last_probe_at": None,
+            "probe_latency_ms": None,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"kiwix-serve-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._terminate()
+        self.state["state"] = "stopped"
+
+    @property
+    def uptime(self) -> Optional[float]:
+        if self._process is None or self.state["state"] not in ("starting", "running", "unresponsive"):
+            return None
+        return time.monotonic() - self._started
+
+    def status(self) -> Dict:
+        uptime = self.uptime
+        return dict(self.state, port=self.port, uptime=round(uptime, 1) if uptime is not None else None,
+                    command=self.command)
+
+    def _spawn(self) -> bool:
+        try:
+            self._process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL)
+        except OSError as e:
+            logger.error(f"Could not start kiwix-serve: {e}")
+            self._process = None
+            self.state.update(state="failed", pid=None, last_exit_code=None)
+            return False
+        self._started = time.monotonic()
+        self.state.update(state="starting", pid=self._process.pid, started_at=datetime.now().isoformat(),
+                          consecutive_failures=0)
+        logger.info(f"Started kiwix-serve (PID {self._process.pid})")
+        return True
+
+    def _terminate(self):
+        process = self._process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(self.STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"kiwix-serve (PID {process.pid}) did not stop, killing it")
+            process.kill()
+            process.wait()
+
+    def _probe(self) -> bool:
+        started = time.monotonic()
+        try:
+            with urllib.request.urlopen(self.probe_url, timeout=self.PROBE_TIMEOUT) as response:
+                response.read(1)
+        except urllib.error.HTTPError:
+            pass  # Answering at all is what matters
+        except (OSError, ValueError):
+            return False
+        self.state["probe_latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        return True
+
+    def _restart(self, reason: str):
+        if self._stop.is_set():
+            return
+        self._terminate()
+        if self._process is not None:
+            self.state["last_exit_code"] = self._process.returncode
+        if time.monotonic() - self._started >= self.STABLE_SECONDS:
+            self._crash_streak = 0
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_INITIAL * 2 ** self._crash_streak)
+        self._crash_streak += 1
+        self.state.update(state="backoff", pid=None, last_restart_reason=reason,
+                          last_restart_at=datetime.now().isoformat())
+        self.state["restarts"] += 1
+        logger.warning(f"kiwix-serve {reason}, restarting in {delay}s (restart #{self.state['restarts']})")
+        if not self._stop.wait(delay):
+            self._spawn()
+
+    def _run(self):
+        self._spawn()
+        while not self._stop.is_set():
+            if self._process is None:
+                self._restart("could not be started")
+                continue
+            # Probe a fresh process often so it is reported up as soon as it answers
+            interval = 1 if self.state["state"] == "starting" else self.PROBE_INTERVAL
+            try:
+                # Returns early if the process exits
+                self._process.wait(interval)
+            except subprocess.TimeoutExpired:
+                pass
+            if self._stop.is_set():
+                break
+            if self._process.poll() is not None:
+                self._restart(f"exited with code {self._process.returncode}")
+                continue
+            healthy = self._probe()
+            self.state["last_probe_at"] = datetime.now().isoformat()
+            if healthy:
+                self.state.update(state="running", consecutive_failures=0)
+            elif time.monotonic() - self._started > self.STARTUP_GRACE:
+                self.state["consecutive_failures"] += 1
+                self.state["state"] = "unresponsive"
+                if self.state["consecutive_failures"] >= self.FAILURE_THRESHOLD:
+                    self._restart(f"not responding after {self.FAILURE_THRESHOLD} probes")
+
+
+# One per kiwix-serve worker; nginx balances wiki traffic across their ports
+kiwix_supervisors: List[KiwixServeSupervisor] = []
+
+# The supervisor process publishes the workers' state for the management API
+KIWIX_STATUS_INTERVAL = 1
+KIWIX_STATUS_STALE = 15  # Seconds without an update before the state is ignored
+
+
+def kiwix_status_path() -> Path:
+    return storage_path / ".kiwix-manager" / "kiwix-serve.json"
+
+
+def read_kiwix_status() -> Optional[List[Dict]]:
+    """Worker states published by the supervisor process, None if it is not running."""
+    try:
+        data = json.loads(kiwix_status_path().read_text())
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get("updated_at", 0) > KIWIX_STATUS_STALE:
+        return None
+    return data["workers"]
+
+
+def supervise_kiwix_serve(binary: str, ports: List[int]):
+    """Run and supervise the kiwix-serve workers until SIGTERM.
+
+    This runs as its own s6 service, apart from the management API, so a
+    crash or restart of the API leaves the wiki up and the workers are
+    supervised whether or not management is enabled. Should this process
+    die, the service's finish script kills the workers it leaves behind
+    (they stay in its process group) before s6 starts it again.
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    library_path = storage_path / "library.xml"
+    if not library_path.exists():
+        KiwixLibrary(library_path).save()
+    for port in ports:
+        supervisor = KiwixServeSupervisor(binary, library_path, port)
+        supervisor.start()
+        kiwix_supervisors.append(supervisor)
+    
+    status_path = kiwix_status_path()
+    status_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = status_path.with_name(status_path.name + ".tmp")
+    while True:
+        tmp.write_text(json.dumps({
+            "updated_at": time.time(),
+            "workers": [supervisor.status() for supervisor in kiwix_supervisors],
+        }))
+        os.replace(tmp, status_path)
+        if stop.wait(KIWIX_STATUS_INTERVAL):
+            break
+    
+    logger.info("Stopping kiwix-serve workers")
+    for supervisor in kiwix_supervisors:
+        supervisor.stop()
+    status_path.unlink(missing_ok=True)
 
 
 def main():
@@ -898,28 +4543,90 @@ def main():
     parser.add_argument("--storage-path", type=str, required=True, help="Path to ZIM storage directory")
     parser.add_argument("--max-upload-size", type=int, default=10000, help="Maximum upload size in MB")
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind to")
+    parser.add_argument("--download-connections", type=int, default=4, help="Parallel connections per download")
+    parser.add_argument("--max-concurrent-downloads", type=int, default=2, help="Downloads allowed to run at once")
+    parser.add_argument("--download-rate-limit", type=int, default=0, help="Global download rate limit in KB/s (0 = unlimited)")
+    parser.add_argument("--download-rate-schedule", action="append", default=[],
+                        help="Time-of-day rate limit window HH:MM-HH:MM=KBPS (repeatable)")
+    parser.add_argument("--log-level", type=str, default="info",
+                        choices=["debug", "info", "warning", "error"], help="Logging verbosity")
+    parser.add_argument("--progress-interval", type=float, default=1.0,
+                        help="Seconds between coalesced progress events on /api/events")
+    parser.add_argument("--min-free-space", type=int, default=1024,
+                        help="Free space in MB that downloads and uploads must leave on the storage volume")
+    parser.add_argument("--job-history-days", type=int, default=30,
+                        help="Days to keep finished download jobs in the job history")
+    parser.add_argument("--kiwix-serve-binary", type=str, default=None,
+                        help="Run and supervise kiwix-serve from this binary instead of serving the management API")
+    parser.add_argument("--catalog-url", type=str, default="https://library.kiwix.org/catalog/v2/entries?count=-1",
+                        help="OPDS catalog feed (URL or local file) to mirror for /api/catalog; empty to disable")
+    parser.add_argument("--catalog-refresh-hours", type=float, default=24,
+                        help="Hours between catalog refreshes (0 = only on request)")
+    parser.add_argument("--old-edition-days", type=int, default=7,
+                        help="Days to keep the old edition of an updated ZIM file (0 = delete it at once)")
+    parser.add_argument("--proxy-cache-path", type=str, default=None,
+                        help="nginx proxy cache directory to purge when a ZIM file is replaced or removed")
+    parser.add_argument("--kiwix-port", type=int, action="append", default=[],
+                        help="Port for a supervised kiwix-serve worker (repeat for more workers, default 8080)")
     
     args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
     
-    global storage_path, max_upload_size
+    global storage_path, max_upload_size, download_connections, max_concurrent_downloads, scheduler, min_free_space
+    global bandwidth_schedule, library, zim_index, job_store, proxy_cache, catalog, retired_editions
     storage_path = Path(args.storage_path)
+    if args.kiwix_serve_binary:
+        storage_path.mkdir(parents=True, exist_ok=True)
+        supervise_kiwix_serve(args.kiwix_serve_binary, args.kiwix_port or [8080])
+        return
     max_upload_size = args.max_upload_size * 1024 * 1024  # Convert MB to bytes
+    min_free_space = max(0, args.min_free_space) * 1024 * 1024
+    download_connections = max(1, args.download_connections)
+    max_concurrent_downloads = max(1, args.max_concurrent_downloads)
+    scheduler = DownloadScheduler(max_concurrent_downloads)
+    events.progress_interval = max(0.1, args.progress_interval)
+    try:
+        bandwidth_schedule = BandwidthSchedule(max(0, args.download_rate_limit), args.download_rate_schedule)
+    except ValueError as e:
+        parser.error(str(e))
     
     # Ensure storage path exists
     storage_path.mkdir(parents=True, exist_ok=True)
+    if args.proxy_cache_path:
+        proxy_cache = ProxyCache(Path(args.proxy_cache_path))
+    library = KiwixLibrary(storage_path / "library.xml")
+    zim_index = ZimIndex(storage_path, storage_path / ".kiwix-manager" / "index.json")
+    job_store = JobStore(storage_path / ".kiwix-manager" / "jobs.db", max(1, args.job_history_days))
+    job_store.prune()
+    retired_editions = RetiredEditions(storage_path / ".kiwix-manager" / "retired", max(0, args.old_edition_days))
+    if args.catalog_url:
+        catalog = CatalogMirror(storage_path / ".kiwix-manager" / "catalog.db", args.catalog_url,
+                                max(0.0, args.catalog_refresh_hours))
     
     logger.info(f"Starting Kiwix Management API on {args.host}:{args.port}")
     logger.info(f"ZIM storage path: {storage_path}")
     logger.info(f"Max upload size: {format_size(max_upload_size)}")
+    logger.info(f"Minimum free space: {format_size(min_free_space)}")
+    logger.info(f"Download connections: {download_connections}")
+    logger.info(f"Max concurrent downloads: {max_concurrent_downloads}")
+    logger.info(f"Download rate limit: {bandwidth_schedule.to_dict()}")
+    
+    # Add existing ZIM files to the library without holding up the API
+    library_reconciler.start()
+    retired_editions.start()
+    
+    if catalog is not None:
+        catalog.start()
     
-    # Scan for existing ZIM files and add them to library
-    scan_and_add_existing_zim_files()
+    # Pick up downloads interrupted by a restart
+    resume_unfinished_downloads()
+    restore_upload_sessions()
     
     uvicorn.run(
         app,
         host=args.host,
         port=args.port,
-        log_level="info",
+        log_level=args.log_level,
         access_log=True,
     )
 
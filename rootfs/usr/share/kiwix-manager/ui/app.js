@@ -0,0 +1,418 @@
+// Detect base path (for ingress compatibility)
+// When accessed via ingress, the iframe's pathname is stripped by the proxy
+// So we need to get it from the parent window or from postMessage
+function getBasePath() {
+    // First, try to get from parent window (if in iframe)
+    try {
+        if (window.parent && window.parent !== window) {
+            const parentPath = window.parent.location.pathname;
+            // Home Assistant ingress pattern: /api/hassio_ingress/<token>
+            let ingressMatch = parentPath.match(/^(\/api\/hassio_ingress\/[^/]+)/);
+            if (ingressMatch) {
+                console.log('[Management] Detected HA ingress from parent:', ingressMatch[1]);
+                return ingressMatch[1];
+            }
+            // Old ingress pattern: /<addon_id>/ingress
+            ingressMatch = parentPath.match(/^(\/[^\/]+\/ingress)/);
+            if (ingressMatch) {
+                console.log('[Management] Detected old ingress from parent:', ingressMatch[1]);
+                return ingressMatch[1];
+            }
+        }
+    } catch (e) {
+        // Cross-origin restriction - use postMessage or fallback
+    }
+    
+    // Check if base path was set via postMessage
+    if (window.__INGRESS_BASE_PATH__) {
+        console.log('[Management] Using base path from postMessage:', window.__INGRESS_BASE_PATH__);
+        return window.__INGRESS_BASE_PATH__;
+    }
+    
+    // Listen for postMessage from parent
+    window.addEventListener('message', function(event) {
+        if (event.data && event.data.type === 'ingress-path') {
+            console.log('[Management] Received base path via postMessage:', event.data.basePath);
+            window.__INGRESS_BASE_PATH__ = event.data.basePath;
+        }
+    });
+    
+    // Fallback: try to detect from current pathname
+    const pathname = window.location.pathname;
+    // Home Assistant ingress pattern
+    let ingressMatch = pathname.match(/^(\/api\/hassio_ingress\/[^\/]+)/);
+    if (ingressMatch) {
+        console.log('[Management] Detected HA ingress from pathname:', ingressMatch[1]);
+        return ingressMatch[1];
+    }
+    // Old ingress pattern
+    ingressMatch = pathname.match(/^(\/[^\/]+\/ingress)/);
+    if (ingressMatch) {
+        console.log('[Management] Detected old ingress from pathname:', ingressMatch[1]);
+        return ingressMatch[1];
+    }
+    
+    // If pathname is just / or /manage/, no ingress path
+    if (pathname === '/' || pathname === '/manage/' || pathname.match(/^\/manage\/?$/)) {
+        console.log('[Management] No ingress path - direct access');
+        return '';
+    }
+    
+    // Fallback: extract ingress path from pathname
+    const parts = pathname.split('/').filter(p => p);
+    const ingressIndex = parts.indexOf('ingress');
+    if (ingressIndex >= 0) {
+        const fallbackPath = '/' + parts.slice(0, ingressIndex + 1).join('/');
+        console.log('[Management] Fallback ingress path:', fallbackPath);
+        return fallbackPath;
+    }
+    
+    console.log('[Management] No ingress path detected');
+    return '';
+}
+
+// Wait a bit for postMessage to arrive, then get base path
+let basePath = '';
+let apiBase = '/api';
+
+function initPaths() {
+    basePath = getBasePath();
+    apiBase = basePath + '/api';
+    console.log('Management: Detected base path:', basePath);
+    console.log('Management: API base:', apiBase);
+}
+
+// Try immediately
+initPaths();
+
+// Also try after a short delay (for postMessage)
+setTimeout(initPaths, 100);
+setTimeout(initPaths, 500);
+
+let downloadJobId = null;
+let updates = {};
+let lastFiles = [];
+
+function showStatus(message, type) {
+    const status = document.getElementById('status');
+    status.textContent = message;
+    status.className = `status ${type} active`;
+    setTimeout(() => {
+        status.classList.remove('active');
+    }, 5000);
+}
+
+// Newer editions of installed files, from the offline catalog
+async function loadUpdates() {
+    try {
+        const response = await fetch(apiBase + '/zim/updates');
+        const list = response.ok ? await response.json() : [];
+        updates = Object.fromEntries(list.map(update => [update.filename, update]));
+        renderFiles(lastFiles);
+    } catch (error) {
+        console.error('Error loading updates:', error);
+    }
+}
+
+function renderFiles(files) {
+    const fileList = document.getElementById('fileList');
+    lastFiles = files;
+    
+    if (files.length === 0) {
+        fileList.innerHTML = '<p style="color: #7f8c8d;">No ZIM files found. Upload or download files to get started.</p>';
+        return;
+    }
+    
+    // Titles, languages and dates come from ZIM metadata: set them as text, never as HTML
+    fileList.replaceChildren(...files.map(renderFile));
+}
+
+function renderFile(file) {
+    const item = document.createElement('div');
+    item.className = 'file-item';
+    
+    const info = document.createElement('div');
+    info.className = 'file-info';
+    const name = document.createElement('div');
+    name.className = 'file-name';
+    name.textContent = file.title ? file.title + ' (' + file.name + ')' : file.name;
+    const meta = document.createElement('div');
+    meta.className = 'file-meta';
+    meta.textContent = [
+        file.language ? 'Language: ' + file.language : null,
+        file.article_count !== undefined ? 'Articles: ' + file.article_count.toLocaleString() : null,
+        file.date ? 'Date: ' + file.date : null,
+        'Size: ' + file.size_formatted,
+        'Modified: ' + new Date(file.modified).toLocaleString()
+    ].filter(Boolean).join(' | ');
+    info.append(name, meta);
+    
+    const actions = document.createElement('div');
+    actions.className = 'file-actions';
+    const update = updates[file.name];
+    if (update && !update.job_id) {
+        const updateButton = document.createElement('button');
+        updateButton.textContent = 'Update to ' + update.latest_date;
+        updateButton.addEventListener('click', () => updateFile(file.name));
+        actions.append(updateButton);
+    }
+    const deleteButton = document.createElement('button');
+    deleteButton.className = 'delete';
+    deleteButton.textContent = 'Delete';
+    deleteButton.addEventListener('click', () => deleteFile(file.name));
+    actions.append(deleteButton);
+    
+    item.append(info, actions);
+    return item;
+}
+
+function formatSize(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) {
+        bytes /= 1024;
+        i++;
+    }
+    return bytes.toFixed(1) + ' ' + units[i];
+}
+
+function formatDuration(seconds) {
+    if (seconds < 60) return seconds + 's';
+    if (seconds < 3600) return Math.floor(seconds / 60) + 'm';
+    return Math.floor(seconds / 3600) + 'h ' + Math.floor(seconds % 3600 / 60) + 'm';
+}
+
+function showDownloadStatus(status) {
+    if (status.job_id !== downloadJobId) {
+        return;
+    }
+    const progressContainer = document.getElementById('downloadProgress');
+    const progressFill = document.getElementById('downloadProgressFill');
+    
+    progressFill.style.width = status.progress + '%';
+    if (status.status === 'queued') {
+        progressFill.textContent = 'Queued (#' + status.queue_position + ')';
+    } else if (status.status === 'paused') {
+        progressFill.textContent = 'Paused at ' + status.progress + '%';
+    } else if (status.speed) {
+        const eta = status.eta !== null ? ', ' + formatDuration(status.eta) + ' left' : '';
+        progressFill.textContent = status.progress + '% (' + formatSize(status.speed) + '/s' + eta + ')';
+    } else {
+        progressFill.textContent = status.progress + '%';
+    }
+    
+    if (status.status === 'completed') {
+        downloadJobId = null;
+        showStatus('Download completed successfully!', 'success');
+        progressContainer.classList.remove('active');
+        document.getElementById('downloadUrl').value = '';
+    } else if (status.status === 'failed') {
+        downloadJobId = null;
+        showStatus('Download failed: ' + status.error, 'error');
+        progressContainer.classList.remove('active');
+    } else if (status.status === 'cancelled') {
+        downloadJobId = null;
+        showStatus('Download cancelled.', 'error');
+        progressContainer.classList.remove('active');
+    }
+}
+
+// Live updates pushed by the server (replaces polling)
+function connectEvents() {
+    initPaths();
+    const source = new EventSource(apiBase + '/events');
+    source.addEventListener('library', (e) => {
+        renderFiles(JSON.parse(e.data));
+        loadUpdates();
+    });
+    source.addEventListener('catalog', loadUpdates);
+    source.addEventListener('jobs', (e) => JSON.parse(e.data).forEach(showDownloadStatus));
+    source.addEventListener('job', (e) => showDownloadStatus(JSON.parse(e.data)));
+    source.addEventListener('progress', (e) => showDownloadStatus(JSON.parse(e.data)));
+}
+
+async function deleteFile(filename) {
+    if (!confirm(`Are you sure you want to delete "${filename}"?`)) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(`${apiBase}/zim/${encodeURIComponent(filename)}`, {
+            method: 'DELETE'
+        });
+        
+        if (response.ok) {
+            showStatus(`File "${filename}" deleted successfully.`, 'success');
+        } else {
+            const error = await response.json();
+            showStatus('Error deleting file: ' + error.detail, 'error');
+        }
+    } catch (error) {
+        showStatus('Error deleting file: ' + error.message, 'error');
+    }
+}
+
+// Downloads the new edition next to the old one, which is served until the swap
+async function updateFile(filename) {
+    const progressContainer = document.getElementById('downloadProgress');
+    const progressFill = document.getElementById('downloadProgressFill');
+    
+    try {
+        const response = await fetch(`${apiBase}/zim/${encodeURIComponent(filename)}/update`, {
+            method: 'POST'
+        });
+        
+        const result = await response.json();
+        if (response.ok) {
+            downloadJobId = result.job_id;
+            updates[filename].job_id = result.job_id;
+            renderFiles(lastFiles);
+            progressContainer.classList.add('active');
+            progressFill.style.width = '0%';
+            progressFill.textContent = 'Starting...';
+            showStatus(`Downloading ${result.filename}. "${filename}" stays available until it replaces it.`, 'success');
+        } else {
+            showStatus('Error starting update: ' + result.detail, 'error');
+        }
+    } catch (error) {
+        showStatus('Error: ' + error.message, 'error');
+    }
+}
+
+document.getElementById('downloadForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const url = document.getElementById('downloadUrl').value;
+    const progressContainer = document.getElementById('downloadProgress');
+    const progressFill = document.getElementById('downloadProgressFill');
+    
+    progressContainer.classList.add('active');
+    progressFill.style.width = '0%';
+    progressFill.textContent = 'Starting...';
+    
+    try {
+        const response = await fetch(apiBase + '/zim/download', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ url: url })
+        });
+        
+        const result = await response.json();
+        if (response.ok) {
+            downloadJobId = result.job_id;
+            showStatus('Download queued. Progress will be shown below.', 'success');
+        } else {
+            showStatus('Error starting download: ' + result.detail, 'error');
+            progressContainer.classList.remove('active');
+        }
+    } catch (error) {
+        showStatus('Error: ' + error.message, 'error');
+        progressContainer.classList.remove('active');
+    }
+});
+
+document.getElementById('uploadForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const fileInput = document.getElementById('uploadFile');
+    const file = fileInput.files[0];
+    
+    if (!file) {
+        showStatus('Please select a file to upload.', 'error');
+        return;
+    }
+    
+    const progressContainer = document.getElementById('uploadProgress');
+    const progressFill = document.getElementById('uploadProgressFill');
+    progressContainer.classList.add('active');
+    progressFill.style.width = '0%';
+    progressFill.textContent = 'Uploading...';
+    
+    try {
+        await uploadChunked(file, (loaded, total) => {
+            const percentComplete = (loaded / total) * 100;
+            progressFill.style.width = percentComplete + '%';
+            progressFill.textContent = Math.round(percentComplete) + '%';
+        });
+        showStatus('File uploaded successfully!', 'success');
+        progressContainer.classList.remove('active');
+        fileInput.value = '';
+    } catch (error) {
+        showStatus('Upload failed: ' + error.message, 'error');
+        progressContainer.classList.remove('active');
+    }
+});
+
+// Resumable upload: create a session, then PATCH chunks at the server's offset.
+// The session is remembered per file, so re-selecting the same file after a
+// dropped connection or page reload continues where it stopped.
+async function uploadChunked(file, onProgress) {
+    const key = 'kiwix-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+    let upload = JSON.parse(localStorage.getItem(key) || 'null');
+    let offset = upload ? await getUploadOffset(upload.upload_id) : null;
+    if (offset === null) {
+        const response = await fetch(apiBase + '/upload', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const result = await response.json();
+        if (!response.ok) throw new Error(result.detail);
+        upload = result;
+        offset = 0;
+        localStorage.setItem(key, JSON.stringify(upload));
+    }
+    
+    let retries = 0;
+    let completed = false;
+    while (!completed) {
+        // At offset === file.size (all data sent before a reload) the empty chunk finalises the upload
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        try {
+            const result = await sendChunk(upload.upload_id, offset, chunk,
+                loaded => onProgress(offset + loaded, file.size));
+            offset = result.offset;
+            completed = result.completed;
+            retries = 0;
+        } catch (error) {
+            if (error.fatal || ++retries > 5) {
+                if (error.fatal) localStorage.removeItem(key);
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            offset = await getUploadOffset(upload.upload_id);
+            if (offset === null) throw new Error('Upload session expired');
+        }
+    }
+    localStorage.removeItem(key);
+}
+
+async function getUploadOffset(uploadId) {
+    const response = await fetch(apiBase + '/upload/' + uploadId, { method: 'HEAD', cache: 'no-store' });
+    return response.ok ? parseInt(response.headers.get('Upload-Offset'), 10) : null;
+}
+
+function sendChunk(uploadId, offset, chunk, onProgress) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.upload.addEventListener('progress', (e) => onProgress(e.loaded));
+        xhr.addEventListener('load', () => {
+            if (xhr.status === 200) {
+                resolve(JSON.parse(xhr.responseText));
+                return;
+            }
+            let detail = 'HTTP ' + xhr.status;
+            try { detail = JSON.parse(xhr.responseText).detail; } catch (e) {}
+            const error = new Error(detail);
+            // 409 (offset mismatch) and server errors are retried after asking for the offset
+            error.fatal = xhr.status !== 409 && xhr.status < 500;
+            reject(error);
+        });
+        xhr.addEventListener('error', () => reject(new Error('Upload error occurred.')));
+        xhr.open('PATCH', apiBase + '/upload/' + uploadId);
+        xhr.setRequestHeader('Upload-Offset', offset);
+        xhr.setRequestHeader('Content-Type', 'application/offset+octet-stream');
+        xhr.send(chunk);
+    });
+}
+
+// The event stream sends the file list on connect and whenever it changes
+connectEvents();